@@ -1,20 +1,195 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
 
+REQUIRED_SETTINGS = ("supabase_url", "supabase_service_role_key", "supabase_anon_key", "gemini_api_key")
+
+
+class SettingsError(RuntimeError):
+    pass
+
+
 class Settings(BaseSettings):
-    supabase_url: str
-    supabase_service_role_key: str
-    supabase_anon_key: str
-    gemini_api_key: str
-    jwt_secret: str = "your-jwt-secret-key"
-    redis_url: str = "redis://localhost:6379"
+    # Required, checked by check_required() when the web app or the worker starts
+    supabase_url: str = ""
+    supabase_service_role_key: str = ""
+    supabase_anon_key: str = ""
+    gemini_api_key: str = ""
+    jwt_secret: str = ""  # Supabase project JWT secret, verifies HS256 access tokens locally; unset: checked by the auth server
+    redis_url: str = ""  # Job queue and cache invalidations; unset: single process, nothing shared
     public_api_url: str = "http://localhost:8000"  # URL accessible from outside (e.g., ngrok or production domain)
+
+    # Dashboard authentication (access tokens verified locally, decoded users cached by token hash)
+    auth_jwt_audience: str = "authenticated"
+    auth_jwks_ttl_seconds: float = 3600.0
+    auth_claims_cache_ttl_seconds: float = 60.0
+    auth_claims_cache_max_entries: int = 10000
+    auth_revocation_check: bool = False  # Also confirm each new token with the auth server
+
+    # Supabase REST (async repository layer: one pooled client for every table read and write)
+    postgrest_max_connections: int = 20
+    postgrest_timeout_seconds: float = 10.0
+    postgrest_pool_timeout_seconds: float = 5.0  # Wait for a free pooled connection before failing
+
+    # Gemini HTTP client (one pooled, keep-alive client shared by every request)
+    gemini_api_base_url: str = "https://generativelanguage.googleapis.com"  # Overridden by the benchmarks' fake server
+    gemini_timeout_seconds: float = 60.0
+    gemini_connect_timeout_seconds: float = 5.0
+    gemini_max_connections: int = 50
+    gemini_max_keepalive_connections: int = 20
+    gemini_http2: bool = True
+    gemini_embedding_model: str = "text-embedding-004"
+
+    # Gemini resilience (per call kind: generate / embed / files)
+    gemini_max_attempts: int = 3
+    gemini_retry_base_seconds: float = 0.5
+    gemini_retry_max_seconds: float = 8.0
+    gemini_concurrency_initial: int = 16
+    gemini_concurrency_min: int = 2
+    gemini_concurrency_max: int = 50
+    gemini_latency_tolerance: float = 2.0  # Recent average latency above this x long-run average shrinks the limit; 0 disables
+    gemini_breaker_failure_threshold: int = 5
+    gemini_breaker_reset_seconds: float = 30.0
+
+    # ManyChat delivery (one pooled client, retries, per-subscriber ordering)
+    manychat_api_base_url: str = "https://api.manychat.com"
+    manychat_timeout_seconds: float = 10.0
+    manychat_max_connections: int = 50
+    manychat_max_attempts: int = 4
+    manychat_retry_base_seconds: float = 0.5
+    manychat_retry_max_seconds: float = 30.0
+    manychat_max_message_chars: int = 1000  # Longer answers are sent as several messages
+    manychat_order_wait_seconds: float = 60.0  # Max wait for the reply to a subscriber's previous message
+
+    # Streamed replies (streamGenerateContent, sent to ManyChat sentence by sentence)
+    stream_replies_enabled: bool = False
+    stream_min_chars: int = 200  # Complete sentences are sent once this much text is buffered...
+    stream_max_delay_seconds: float = 2.0  # ...or this long after the previous message
+
+    # Instrumentation (/metrics in Prometheus format, sampled traces at /metrics/traces)
+    metrics_max_tenants: int = 100  # Tenants beyond this share the "other" label
+    metrics_token: str = ""  # When set, /metrics, /metrics/traces and /health require "Bearer <token>"
+    metrics_trace_sample_rate: float = 0.01  # Fraction of webhook jobs traced stage by stage
+    metrics_trace_buffer: int = 200  # Most recent traces kept
+    metrics_loop_lag_interval_seconds: float = 0.5  # Event-loop lag sampling period, 0 to disable
+    worker_metrics_port: int = 0  # Serves /metrics from `python -m app.worker` when set
+
+    # Startup warmup (runs in the background after boot; /ready answers 503 until it is done)
+    warmup_enabled: bool = True
+    warmup_timeout_seconds: float = 15.0  # Past this the process reports ready anyway
+    warmup_connections: int = 4  # Keep-alive connections opened ahead of traffic, per upstream pool
+    warmup_tenants: int = 100  # Busiest tenants of the month preloaded into the tenant cache
+
+    # Tenant profile cache used by the webhook hot path
+    tenant_cache_ttl_seconds: float = 300.0
+    tenant_cache_negative_ttl_seconds: float = 60.0
+    tenant_cache_max_entries: int = 10000
+
+    # Per-tenant answer cache in front of Gemini generation
+    answer_cache_enabled: bool = True
+    answer_cache_ttl_seconds: float = 3600.0
+    answer_cache_max_entries_per_tenant: int = 500
+    answer_cache_max_tenants: int = 1000
+    answer_cache_semantic: bool = False  # Needs numpy; costs one embedding call per lookup
+    answer_cache_similarity_threshold: float = 0.92
+    answer_cache_context_free_min_terms: int = 2  # Content words for a mid-conversation question to be looked up
+
+    # Webhook job queue ("memory" runs the workers inside the web process and is not durable,
+    # "redis" uses redis_url); unset: "redis" when redis_url is set
+    queue_backend: str = ""
+    queue_claim_batch_size: int = 50  # Jobs of dead consumers taken over per XAUTOCLAIM
+    queue_stream: str = "webhook:jobs"
+    queue_consumer_group: str = "chat-workers"
+    queue_max_pending: int = 10000
+    queue_visibility_timeout_seconds: float = 300.0
+    worker_concurrency: int = 8  # Webhook jobs processed at once per process (admission control's in-flight limit)
+    job_max_attempts: int = 3
+    job_retry_base_seconds: float = 2.0
+    run_workers_in_web: bool = False  # Also consume the Redis queue from the web process
+    invalidation_channel: str = "cache:invalidate"  # Redis pub/sub channel for per-tenant cache invalidations
+
+    # Admission control in front of process_chat (per-tenant limits come from the plan)
+    admission_max_queued: int = 500
+    admission_max_queued_per_tenant: int = 50
+    admission_max_wait_seconds: float = 30.0
+    admission_burst_seconds: float = 10.0
+    admission_default_concurrency: int = 2  # For profiles without a plan
+    admission_default_requests_per_minute: int = 30
+    load_shed_message: str = "Nous recevons beaucoup de messages en ce moment. Merci de réessayer dans quelques instants."
+
+    # Message coalescing (the window itself is per tenant: profiles.message_coalesce_ms)
+    coalesce_max_wait_ms: int = 8000
+    coalesce_max_messages: int = 8
+
+    # Write-behind persistence of the messages table
+    message_batch_size: int = 200
+    message_flush_interval_ms: int = 250
+    message_buffer_max_rows: int = 5000
+
+    # Background document ingestion
+    ingestion_concurrency: int = 4
+    ingestion_poll_initial_seconds: float = 1.0
+    ingestion_poll_max_seconds: float = 15.0
+    ingestion_timeout_seconds: float = 900.0
+
+    # Process pool for PDF parsing
+    pdf_pool_workers: int = 2
+    pdf_pool_max_queued: int = 16
+    pdf_job_timeout_seconds: float = 60.0
+    pdf_job_memory_mb: int = 1024
+
+    # Retrieval: "file_search" (Gemini File Search tool) or "local" (document_sections + NumPy index)
+    retriever_backend: str = "file_search"
+    vector_store_dir: str = "./data/vectors"
+    embedding_dimensions: int = 768
+    embedding_batch_size: int = 100
+    retriever_top_k: int = 5
+    retriever_min_score: float = 0.3
+
+    # Lexical FAQ fast path (answers without calling Gemini above these confidences)
+    faq_fast_path_enabled: bool = True
+    faq_qa_threshold: float = 0.85
+    faq_min_coverage: float = 0.8  # Share of the query's terms the matched question/passage must contain
+    faq_passage_answers_enabled: bool = False  # Also answer from document text (a snippet of the best passage)
+    faq_passage_threshold: float = 0.6  # Of the BM25 bound: each query term repeated in a passage of usual length
+    faq_passage_min_terms: int = 3
+    faq_passage_snippet_chars: int = 300
+    faq_index_ttl_seconds: float = 600.0
+    faq_index_max_tenants: int = 500
+
+    # Usage metering and quota (subscriptions.monthly_request_limit, per calendar month)
+    usage_flush_interval_seconds: float = 10.0
+    default_monthly_request_limit: int = 1000  # For profiles without a plan
+    quota_exceeded_message: str = "Ce service a atteint sa limite de messages pour ce mois. Merci de réessayer plus tard."
+
+    # Conversation memory (recent turns in memory, older ones folded into a summary)
+    conversation_memory_enabled: bool = True
+    conversation_max_turns: int = 10
+    conversation_max_conversations: int = 10000
+    conversation_history_token_budget: int = 1500
+    conversation_summary_max_chars: int = 1200
+    conversation_idle_reset_seconds: float = 3600.0
     
     class Config:
         env_file = ".env"
 
+    @model_validator(mode="after")
+    def _default_queue_backend(self):
+        if not self.queue_backend:
+            self.queue_backend = "redis" if self.redis_url else "memory"
+        return self
+
+    def check_required(self):
+        missing = [name.upper() for name in REQUIRED_SETTINGS if not getattr(self, name)]
+        if missing:
+            raise SettingsError(
+                f"Missing required settings: {', '.join(missing)} (set them in the environment or in backend/.env)"
+            )
+
 
+# Called at import by every module that reads settings; importing never fails on a missing
+# variable, the lifespan and the worker call check_required() before serving anything.
 @lru_cache()
 def get_settings() -> Settings:
     return Settings()
@@ -1,13 +1,19 @@
-from supabase import create_client, Client
+from typing import TYPE_CHECKING, Optional
 from app.config import get_settings
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 settings = get_settings()
 
-supabase: Client = create_client(
-    settings.supabase_url,
-    settings.supabase_service_role_key
-)
+# Auth and Storage only; table reads and writes go through app.repositories
+_supabase: Optional["Client"] = None
 
 
-def get_supabase() -> Client:
-    return supabase
+def get_supabase() -> "Client":
+    """Created on first use: supabase-py is the slowest import of the app and most requests never need it."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(settings.supabase_url, settings.supabase_service_role_key)
+    return _supabase
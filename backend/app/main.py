@@ -1,19 +1,95 @@
-from fastapi import FastAPI
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, customers, documents, webhook, messages, billing
+from app.routers import auth, customers, documents, webhook, messages, billing, faq
+from app.services.gemini_service import gemini_service
+from app.services.manychat_service import manychat_service
+from app.services.tenant_cache import tenant_cache
+from app.services.answer_cache import answer_cache
+from app.services.job_queue import job_queue
+from app.services.coalescer import message_coalescer
+from app.services.message_writer import message_writer
+from app.services.ingestion_service import ingestion_service
+from app.services.pdf_service import pdf_pool
+from app.services.faq_index import faq_index
+from app.services.conversation_store import conversation_store
+from app.services.auth_service import token_verifier
+from app.services.usage_meter import usage_meter
+from app.services.admission import admission_controller
+from app.services.metrics import metrics, scrape_allowed
+from app.services.invalidation import invalidation_bus
+from app.services.runtime import create_worker_pool, render_metrics, warmup_steps
+from app.services.startup import FirstRequestMiddleware, startup
+from app.database import get_supabase
+from app.repositories.postgrest import postgrest
+from app.config import get_settings
+
+settings = get_settings()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings.check_required()
+    message_writer.start()
+    usage_meter.start()
+    invalidation_bus.start()
+    metrics.start_loop_monitor(settings.metrics_loop_lag_interval_seconds)
+
+    # The in-memory queue only exists in this process, so it has to be consumed here.
+    worker_pool = None
+    if settings.queue_backend == "memory" or settings.run_workers_in_web:
+        worker_pool = create_worker_pool()
+        worker_pool.start()
+    app.state.worker_pool = worker_pool
+
+    # In the background so the server starts listening at once; /ready waits for it
+    steps = {}
+    if settings.warmup_enabled:
+        # supabase-py (Auth, Storage) is imported off the event loop rather than by the first login
+        steps = {**warmup_steps(), "supabase": lambda: asyncio.to_thread(get_supabase)}
+    warmup = asyncio.create_task(startup.warm_up(steps, settings.warmup_timeout_seconds))
+
+    yield
+
+    warmup.cancel()
+    if worker_pool is not None:
+        await worker_pool.stop()
+    await ingestion_service.stop()
+    await conversation_store.stop()
+    await faq_index.stop()
+    pdf_pool.shutdown()
+    await usage_meter.stop()
+    await message_writer.stop()
+    await job_queue.close()
+    await invalidation_bus.stop()
+    await gemini_service.aclose()
+    await manychat_service.aclose()
+    await postgrest.aclose()
+    await metrics.stop_loop_monitor()
+
 
 app = FastAPI(
     title="WhatsApp RAG Chatbot API",
     description="Intelligent middleware SaaS connecting WhatsApp via ManyChat with Google Gemini Pro",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+app.add_middleware(FirstRequestMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth.router, prefix="/api/v1")
@@ -22,6 +98,7 @@ app.include_router(documents.router, prefix="/api/v1")
 app.include_router(webhook.router, prefix="/api/v1")
 app.include_router(messages.router, prefix="/api/v1")
 app.include_router(billing.router, prefix="/api/v1")
+app.include_router(faq.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -29,6 +106,52 @@ async def root():
     return {"message": "WhatsApp RAG Chatbot API", "version": "1.0.0"}
 
 
-@app.get("/health")
+async def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not scrape_allowed(authorization):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+@app.get("/health", dependencies=[Depends(require_metrics_token)])
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "gemini": gemini_service.stats(),
+        "manychat": manychat_service.stats(),
+        "postgrest": postgrest.stats(),
+        "tenant_cache": tenant_cache.stats(),
+        "auth": token_verifier.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalescer": message_coalescer.stats(),
+        "message_writer": message_writer.stats(),
+        "faq": faq_index.stats(),
+        "conversations": conversation_store.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "usage": usage_meter.stats(),
+        "admission": admission_controller.stats(),
+        "metrics": metrics.stats(),
+        "startup": startup.stats(),
+        "job_queue": {
+            "depth": await job_queue.depth(),
+            "workers": app.state.worker_pool.stats() if app.state.worker_pool else None
+        }
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until warmup has run, with the startup timings either way."""
+    return JSONResponse(startup.stats(), status_code=200 if startup.ready else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+async def prometheus_metrics():
+    return PlainTextResponse(await render_metrics(app.state.worker_pool), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/traces", dependencies=[Depends(require_metrics_token)])
+async def recent_traces(limit: int = 50):
+    """Stage-by-stage breakdown of recently sampled webhook jobs and ingestions, newest first."""
+    return metrics.traces(limit)
+
+
+startup.mark_imported(_import_started)
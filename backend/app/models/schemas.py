@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 from uuid import UUID
@@ -22,6 +22,7 @@ class UserProfile(BaseModel):
     manychat_api_key: Optional[str] = None
     webhook_url: Optional[str] = None
     chatbot_prompt: Optional[str] = None
+    message_coalesce_ms: int = 0
     role: str = "account_user"
     created_at: Optional[datetime] = None
 
@@ -30,6 +31,15 @@ class ProfileUpdate(BaseModel):
     company_name: Optional[str] = None
     manychat_api_key: Optional[str] = None
     chatbot_prompt: Optional[str] = None
+    message_coalesce_ms: Optional[int] = Field(None, ge=0, le=10000)
+
+    @field_validator("message_coalesce_ms", mode="before")
+    @classmethod
+    def _coalesce_not_null(cls, value):
+        # Omit the field to leave it unchanged; the column is NOT NULL and 0 turns coalescing off
+        if value is None:
+            raise ValueError("message_coalesce_ms cannot be null, use 0 to disable coalescing")
+        return value
 
 
 class ChatbotPromptUpdate(BaseModel):
@@ -47,6 +57,20 @@ class DocumentResponse(BaseModel):
     filename: str
     file_path: str
     status: str
+    error_message: Optional[str] = None
+    created_at: datetime
+
+
+class FaqEntryCreate(BaseModel):
+    question: str = Field(..., min_length=1)
+    answer: str = Field(..., min_length=1)
+
+
+class FaqEntryResponse(BaseModel):
+    id: int
+    owner_id: UUID
+    question: str
+    answer: str
     created_at: datetime
 
 
@@ -66,6 +90,15 @@ class MessageResponse(BaseModel):
     created_at: datetime
 
 
+class ConversationResponse(BaseModel):
+    user_phone: str
+    last_message_at: datetime
+    last_message_id: int
+    message_count: int
+    last_direction: str
+    last_snippet: str
+
+
 class SubscriptionPlan(BaseModel):
     id: UUID
     name: str
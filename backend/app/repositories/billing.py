@@ -0,0 +1,36 @@
+from datetime import date
+from typing import Any, Dict, List
+from app.repositories.postgrest import PostgrestClient, postgrest
+
+BILLING_RECORD_COLUMNS = "id, period_start, period_end, amount_cents, overage_cents, status, created_at"
+
+
+class BillingRepository:
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def invoices(self, owner_id: str) -> List[dict]:
+        return await self.db.select(
+            "billing_records", BILLING_RECORD_COLUMNS, [("customer_id", "eq", owner_id)], order=["period_start.desc"]
+        )
+
+    async def usage(self, owner_id: str, period: date) -> int:
+        row = await self.db.select_one(
+            "usage_counters", "requests", [("customer_id", "eq", owner_id), ("period_start", "eq", period.isoformat())]
+        )
+        return row["requests"] if row else 0
+
+    async def most_active(self, period: date, limit: int) -> List[str]:
+        """Owners with the most requests in the period, busiest first."""
+        rows = await self.db.select(
+            "usage_counters", "customer_id", [("period_start", "eq", period.isoformat())],
+            order=["requests.desc"], limit=limit,
+        )
+        return [row["customer_id"] for row in rows]
+
+    async def increment_usage(self, deltas: List[Dict[str, Any]]) -> List[dict]:
+        """Adds all tenants' deltas atomically; returns the new totals."""
+        return await self.db.rpc("increment_usage", {"deltas": deltas})
+
+
+billing_repository = BillingRepository(postgrest)
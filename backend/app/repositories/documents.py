@@ -0,0 +1,73 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.repositories.postgrest import PostgrestClient, postgrest
+
+DOCUMENT_COLUMNS = "id, owner_id, filename, file_path, status, error_message, gemini_file_name, created_at"
+SECTION_PAGE_SIZE = 1000
+
+
+class DocumentRepository:
+    """documents and their document_sections."""
+
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def list(self, owner_id: str) -> List[dict]:
+        return await self.db.select("documents", DOCUMENT_COLUMNS, [("owner_id", "eq", owner_id)], order=["created_at.desc"])
+
+    async def get(self, owner_id: str, document_id: int, columns: str = DOCUMENT_COLUMNS) -> Optional[dict]:
+        return await self.db.select_one("documents", columns, [("id", "eq", document_id), ("owner_id", "eq", owner_id)])
+
+    async def find_by_hash(self, owner_id: str, content_hash: str) -> Optional[dict]:
+        return await self.db.select_one(
+            "documents", "id, status, gemini_file_name", [("owner_id", "eq", owner_id), ("content_hash", "eq", content_hash)]
+        )
+
+    async def count(self, owner_id: str) -> int:
+        return await self.db.count("documents", [("owner_id", "eq", owner_id)])
+
+    async def create(self, row: Dict[str, Any]) -> int:
+        """Inserts the document and returns its id; raises PostgrestError (23505) on a duplicate content hash."""
+        rows = await self.db.insert("documents", [row], returning="id")
+        return rows[0]["id"]
+
+    async def update(self, document_id: int, values: Dict[str, Any]) -> bool:
+        """False if the document no longer exists."""
+        rows = await self.db.update("documents", values, [("id", "eq", document_id)], returning="id")
+        return bool(rows)
+
+    async def delete(self, document_id: int):
+        # document_sections rows are removed by ON DELETE CASCADE
+        await self.db.delete("documents", [("id", "eq", document_id)])
+
+    async def insert_sections(self, rows: List[Dict[str, Any]]):
+        await self.db.insert("document_sections", rows)
+
+    async def delete_sections(self, document_id: int):
+        await self.db.delete("document_sections", [("document_id", "eq", document_id)])
+
+    async def section_contents(self, section_ids: List[int]) -> Dict[int, str]:
+        rows = await self.db.select("document_sections", "id, content", [("id", "in", section_ids)])
+        return {row["id"]: row["content"] for row in rows}
+
+    async def processed_sections(self, owner_id: str, columns: str, embedded_only: bool = False) -> AsyncIterator[List[dict]]:
+        """Pages of the sections of the owner's processed documents, in id order (keyset on id)."""
+        filters = [("documents.owner_id", "eq", owner_id), ("documents.status", "eq", "processed")]
+        if embedded_only:
+            filters.append(("embedding", "not.is", None))
+        # The next page starts after the last id seen, so it needs the id even if the caller doesn't
+        if "id" not in (column.strip() for column in columns.split(",")):
+            columns = f"id, {columns}"
+        last_id = None
+        while True:
+            page = await self.db.select(
+                "document_sections", f"{columns}, documents!inner(owner_id, status)",
+                filters if last_id is None else [*filters, ("id", "gt", last_id)],
+                order=["id"], limit=SECTION_PAGE_SIZE,
+            )
+            yield page
+            if len(page) < SECTION_PAGE_SIZE:
+                break
+            last_id = page[-1]["id"]
+
+
+document_repository = DocumentRepository(postgrest)
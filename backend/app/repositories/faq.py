@@ -0,0 +1,28 @@
+from typing import List, Optional
+from app.repositories.postgrest import PostgrestClient, postgrest
+
+FAQ_COLUMNS = "id, owner_id, question, answer, created_at"
+
+
+class FaqRepository:
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def list(self, owner_id: str) -> List[dict]:
+        return await self.db.select("faq_entries", FAQ_COLUMNS, [("owner_id", "eq", owner_id)], order=["created_at.desc"])
+
+    async def pairs(self, owner_id: str) -> List[dict]:
+        return await self.db.select("faq_entries", "question, answer", [("owner_id", "eq", owner_id)])
+
+    async def create(self, owner_id: str, question: str, answer: str) -> dict:
+        rows = await self.db.insert(
+            "faq_entries", [{"owner_id": owner_id, "question": question, "answer": answer}], returning=FAQ_COLUMNS
+        )
+        return rows[0]
+
+    async def delete(self, owner_id: str, entry_id: int) -> bool:
+        rows = await self.db.delete("faq_entries", [("id", "eq", entry_id), ("owner_id", "eq", owner_id)], returning="id")
+        return bool(rows)
+
+
+faq_repository = FaqRepository(postgrest)
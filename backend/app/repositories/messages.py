@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional
+from app.repositories.postgrest import PostgrestClient, postgrest
+from app.services.pagination import keyset_filter
+
+MESSAGE_COLUMNS = "id, customer_id, user_phone, direction, content, created_at"
+CONVERSATION_COLUMNS = "user_phone, last_message_at, last_message_id, message_count, last_direction, last_snippet"
+
+
+class MessageRepository:
+    """messages and the conversations summary maintained from them."""
+
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def insert_many(self, rows: List[Dict[str, Any]]):
+        # A retried job writes its rows again with the same job_id: those are skipped
+        await self.db.insert("messages", rows, ignore_conflicts_on="job_id,direction")
+
+    async def has_reply(self, job_id: str) -> bool:
+        """Whether the job already stored its outbound message, i.e. got as far as answering."""
+        row = await self.db.select_one("messages", "id", [("job_id", "eq", job_id), ("direction", "eq", "outbound")])
+        return row is not None
+
+    async def page(self, owner_id: str, limit: int, cursor: Optional[str] = None, offset: int = 0,
+                   user_phone: Optional[str] = None) -> List[dict]:
+        """Newest first, after `cursor` (keyset) or skipping `offset` rows."""
+        filters = [("customer_id", "eq", owner_id)]
+        if user_phone:
+            filters.append(("user_phone", "eq", user_phone))
+        return await self.db.select(
+            "messages", MESSAGE_COLUMNS, filters,
+            or_=keyset_filter(cursor) if cursor else None,
+            order=["created_at.desc", "id.desc"], limit=limit, offset=0 if cursor else offset,
+        )
+
+    async def recent(self, owner_id: str, user_phone: str, since: str, limit: int) -> List[dict]:
+        """The conversation's last `limit` messages since `since`, oldest first."""
+        rows = await self.db.select(
+            "messages", "direction, content",
+            [("customer_id", "eq", owner_id), ("user_phone", "eq", user_phone), ("created_at", "gte", since)],
+            order=["created_at.desc"], limit=limit,
+        )
+        return rows[::-1]
+
+    async def message_count(self, owner_id: str, user_phone: str) -> int:
+        """Messages stored for this conversation, as kept by the conversations trigger."""
+        row = await self.db.select_one(
+            "conversations", "message_count", [("customer_id", "eq", owner_id), ("user_phone", "eq", user_phone)]
+        )
+        return row["message_count"] if row else 0
+
+    async def conversations(self, owner_id: str, limit: Optional[int], cursor: Optional[str] = None) -> List[dict]:
+        """Most recently active first; all of them when `limit` is None."""
+        return await self.db.select(
+            "conversations", CONVERSATION_COLUMNS, [("customer_id", "eq", owner_id)],
+            or_=keyset_filter(cursor, "last_message_at", "last_message_id") if cursor else None,
+            order=["last_message_at.desc", "last_message_id.desc"], limit=limit,
+        )
+
+
+message_repository = MessageRepository(postgrest)
@@ -0,0 +1,183 @@
+import logging
+import httpx
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.config import get_settings
+from app.services.metrics import metrics
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# (column, operator, value), e.g. ("owner_id", "eq", owner_id) or ("id", "in", [1, 2])
+Filter = Tuple[str, str, Any]
+
+UNIQUE_VIOLATION = "23505"
+_OPERATIONS = {"GET": "select", "HEAD": "count", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status_code: int, message: str, code: Optional[str] = None, details: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.details = details
+
+
+def _format(op: str, value: Any) -> str:
+    if op in ("in", "not.in"):
+        return f"{op}.({','.join(_quote(v) for v in value)})"
+    if value is None:
+        return f"{op}.null"
+    if isinstance(value, bool):
+        return f"{op}.{str(value).lower()}"
+    return f"{op}.{value}"
+
+
+def _quote(value: Any) -> str:
+    text = str(value)
+    # Reserved characters inside an in.(...) list need double quotes
+    if any(c in text for c in ',()"\\ '):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return text
+
+
+class PostgrestClient:
+    """
+    Async PostgREST client (service role) on one pooled keep-alive httpx client.
+
+    Queries name their columns and filters explicitly; responses are plain dicts. The
+    pool is bounded by `postgrest_max_connections`: beyond it, requests wait for a free
+    connection (up to `postgrest_pool_timeout_seconds`) instead of opening more.
+    Every request is timed as stage `supabase.<operation>.<table>`.
+    """
+
+    def __init__(self, url: str, key: str):
+        self.url = f"{url.rstrip('/')}/rest/v1"
+        self.key = key
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"},
+                limits=httpx.Limits(
+                    max_connections=settings.postgrest_max_connections,
+                    max_keepalive_connections=settings.postgrest_max_connections,
+                ),
+                timeout=httpx.Timeout(settings.postgrest_timeout_seconds, pool=settings.postgrest_pool_timeout_seconds),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_connections": settings.postgrest_max_connections,
+        }
+
+    async def select(self, table: str, columns: str, filters: Sequence[Filter] = (), *, or_: Optional[str] = None,
+                     order: Sequence[str] = (), limit: Optional[int] = None, offset: Optional[int] = None) -> List[dict]:
+        """Rows matching all filters; `order` items are "column" or "column.desc"."""
+        params = self._params(filters, or_)
+        params.append(("select", columns))
+        if order:
+            params.append(("order", ",".join(order)))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset:
+            params.append(("offset", str(offset)))
+        response = await self._request("GET", table, params)
+        return response.json()
+
+    async def select_one(self, table: str, columns: str, filters: Sequence[Filter] = ()) -> Optional[dict]:
+        rows = await self.select(table, columns, filters, limit=1)
+        return rows[0] if rows else None
+
+    async def count(self, table: str, filters: Sequence[Filter] = ()) -> int:
+        """Exact count without fetching rows."""
+        response = await self._request("HEAD", table, self._params(filters), headers={"Prefer": "count=exact"})
+        total = response.headers.get("content-range", "*/0").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
+
+    async def insert(self, table: str, rows: Iterable[Dict[str, Any]], returning: Optional[str] = None,
+                     ignore_conflicts_on: Optional[str] = None) -> List[dict]:
+        """
+        Inserts all rows in one request; returns the `returning` columns of each, or nothing.
+
+        With `ignore_conflicts_on` (columns of a unique index), rows clashing with an existing
+        one are skipped instead of failing the whole request.
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        if ignore_conflicts_on:
+            return await self._write("POST", table, [("on_conflict", ignore_conflicts_on)], rows, returning,
+                                     resolution="ignore-duplicates")
+        return await self._write("POST", table, [], rows, returning)
+
+    async def update(self, table: str, values: Dict[str, Any], filters: Sequence[Filter],
+                     returning: Optional[str] = None) -> List[dict]:
+        return await self._write("PATCH", table, self._params(filters), values, returning)
+
+    async def delete(self, table: str, filters: Sequence[Filter], returning: Optional[str] = None) -> List[dict]:
+        return await self._write("DELETE", table, self._params(filters), None, returning)
+
+    async def rpc(self, function: str, args: Dict[str, Any]) -> Any:
+        response = await self._request("POST", f"rpc/{function}", [], json=args)
+        return response.json() if response.content else None
+
+    async def _write(self, method: str, table: str, params: List[Tuple[str, str]], body: Any,
+                     returning: Optional[str], resolution: Optional[str] = None) -> List[dict]:
+        if returning:
+            params.append(("select", returning))
+        prefer = "return=representation" if returning else "return=minimal"
+        if resolution:
+            prefer += f",resolution={resolution}"
+        headers = {"Prefer": prefer}
+        response = await self._request(method, table, params, json=body, headers=headers)
+        return response.json() if returning else []
+
+    def _params(self, filters: Sequence[Filter], or_: Optional[str] = None) -> List[Tuple[str, str]]:
+        params = [(column, _format(op, value)) for column, op, value in filters]
+        if or_:
+            params.append(("or", f"({or_})"))
+        return params
+
+    async def _request(self, method: str, path: str, params: List[Tuple[str, str]], json: Any = None,
+                       headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        if path.startswith("rpc/"):
+            stage = f"supabase.rpc.{path[4:]}"
+        else:
+            stage = f"supabase.{_OPERATIONS[method]}.{path}"
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            with metrics.timer(stage):
+                response = await self.client.request(method, f"/{path}", params=params, json=json, headers=headers)
+        except httpx.HTTPError:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        if response.status_code >= 400:
+            self.errors += 1
+            try:
+                error = response.json()
+            except ValueError:
+                error = {"message": response.text}
+            raise PostgrestError(response.status_code, error.get("message") or response.text,
+                                 error.get("code"), error.get("details"))
+        return response
+
+
+postgrest = PostgrestClient(settings.supabase_url, settings.supabase_service_role_key)
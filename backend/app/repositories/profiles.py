@@ -0,0 +1,40 @@
+from typing import Any, Dict, List, Optional
+from app.repositories.postgrest import PostgrestClient, postgrest
+
+PROFILE_COLUMNS = "id, email, company_name, manychat_api_key, webhook_url, chatbot_prompt, message_coalesce_ms, role, created_at"
+# What the webhook needs about a tenant, its plan included
+TENANT_COLUMNS = (
+    "id, api_key_generee, manychat_api_key, chatbot_prompt, gemini_file_store_id, message_coalesce_ms, "
+    "subscriptions(monthly_request_limit, max_concurrent_requests, requests_per_minute, scheduling_weight)"
+)
+
+
+class ProfileRepository:
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def get(self, owner_id: str, columns: str = PROFILE_COLUMNS) -> Optional[dict]:
+        return await self.db.select_one("profiles", columns, [("id", "eq", owner_id)])
+
+    async def find_tenant(self, client_api_key: str) -> Optional[dict]:
+        """Profile by its generated webhook key or, for older integrations, by its id: one round trip."""
+        rows = await self.db.select(
+            "profiles", TENANT_COLUMNS, or_=f"api_key_generee.eq.{client_api_key},id.eq.{client_api_key}", limit=2
+        )
+        if not rows:
+            return None
+        return next((row for row in rows if row.get("api_key_generee") == client_api_key), rows[0])
+
+    async def tenants(self, owner_ids: List[str]) -> List[dict]:
+        if not owner_ids:
+            return []
+        return await self.db.select("profiles", TENANT_COLUMNS, [("id", "in", owner_ids)])
+
+    async def create(self, row: Dict[str, Any]):
+        await self.db.insert("profiles", [row])
+
+    async def update(self, owner_id: str, values: Dict[str, Any], returning: Optional[str] = None) -> List[dict]:
+        return await self.db.update("profiles", values, [("id", "eq", owner_id)], returning)
+
+
+profile_repository = ProfileRepository(postgrest)
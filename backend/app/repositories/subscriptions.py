@@ -0,0 +1,23 @@
+from typing import List, Optional
+from app.repositories.postgrest import PostgrestClient, postgrest
+
+PLAN_COLUMNS = (
+    "id, name, monthly_request_limit, storage_limit_mb, price_cents, "
+    "max_concurrent_requests, requests_per_minute, scheduling_weight"
+)
+
+
+class SubscriptionRepository:
+    def __init__(self, db: PostgrestClient):
+        self.db = db
+
+    async def list_plans(self) -> List[dict]:
+        return await self.db.select("subscriptions", PLAN_COLUMNS, order=["price_cents"])
+
+    async def plan_for(self, owner_id: str) -> Optional[dict]:
+        """The owner's plan, or None for profiles without one."""
+        profile = await self.db.select_one("profiles", f"plan_id, subscriptions({PLAN_COLUMNS})", [("id", "eq", owner_id)])
+        return profile.get("subscriptions") if profile else None
+
+
+subscription_repository = SubscriptionRepository(postgrest)
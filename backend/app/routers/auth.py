@@ -1,27 +1,29 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.models.schemas import UserCreate, UserLogin, UserProfile
 from app.database import get_supabase
-from supabase import Client
+from app.repositories.profiles import profile_repository
+import asyncio
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/signup")
-async def signup(user: UserCreate, supabase: Client = Depends(get_supabase)):
+async def signup(user: UserCreate, supabase=Depends(get_supabase)):
     try:
-        auth_response = supabase.auth.sign_up({
+        # supabase-py auth is synchronous: keep it off the event loop
+        auth_response = await asyncio.to_thread(supabase.auth.sign_up, {
             "email": user.email,
             "password": user.password
         })
         
         if auth_response.user:
-            supabase.table("profiles").insert({
+            await profile_repository.create({
                 "id": str(auth_response.user.id),
                 "email": user.email,
                 "company_name": user.company_name,
                 "role": "account_user",
                 "chatbot_prompt": "Tu es un assistant client utile. Utilise UNIQUEMENT le contexte ci-dessous pour répondre à la question. Si la réponse n'est pas dans le contexte, dis poliment que tu ne sais pas."
-            }).execute()
+            })
             
             return {
                 "message": "User created successfully",
@@ -34,9 +36,9 @@ async def signup(user: UserCreate, supabase: Client = Depends(get_supabase)):
 
 
 @router.post("/login")
-async def login(user: UserLogin, supabase: Client = Depends(get_supabase)):
+async def login(user: UserLogin, supabase=Depends(get_supabase)):
     try:
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await asyncio.to_thread(supabase.auth.sign_in_with_password, {
             "email": user.email,
             "password": user.password
         })
@@ -54,18 +56,18 @@ async def login(user: UserLogin, supabase: Client = Depends(get_supabase)):
 
 
 @router.post("/logout")
-async def logout(supabase: Client = Depends(get_supabase)):
+async def logout(supabase=Depends(get_supabase)):
     try:
-        supabase.auth.sign_out()
+        await asyncio.to_thread(supabase.auth.sign_out)
         return {"message": "Logged out successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/password-reset")
-async def password_reset(email: str, supabase: Client = Depends(get_supabase)):
+async def password_reset(email: str, supabase=Depends(get_supabase)):
     try:
-        supabase.auth.reset_password_email(email)
+        await asyncio.to_thread(supabase.auth.reset_password_email, email)
         return {"message": "Password reset email sent"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
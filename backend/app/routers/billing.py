@@ -1,36 +1,35 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.database import get_supabase
 from app.services.auth_service import get_current_user
-from supabase import Client
+from app.services.usage_meter import usage_meter, current_period
+from app.repositories.billing import billing_repository
+from app.repositories.documents import document_repository
+from app.repositories.subscriptions import subscription_repository
+from app.config import get_settings
 
+settings = get_settings()
 router = APIRouter(prefix="/billing", tags=["Billing"])
 
 
 @router.get("/usage")
-async def get_usage(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def get_usage(current_user: dict = Depends(get_current_user)):
     try:
-        profile = supabase.table("profiles").select("plan_id").eq("id", current_user["id"]).single().execute()
+        plan = await subscription_repository.plan_for(current_user["id"])
         
-        messages = supabase.table("messages").select("id", count="exact").eq("customer_id", current_user["id"]).execute()
-        message_count = messages.count or 0
+        # Requests answered in the current period, from the usage counters (no scan of messages)
+        message_count = await usage_meter.usage(current_user["id"])
         
-        documents = supabase.table("documents").select("id", count="exact").eq("owner_id", current_user["id"]).execute()
-        document_count = documents.count or 0
+        document_count = await document_repository.count(current_user["id"])
         
         plan_limits = {
-            "monthly_request_limit": 1000,
+            "monthly_request_limit": settings.default_monthly_request_limit,
             "storage_limit_mb": 100
         }
         
-        if profile.data and profile.data.get("plan_id"):
-            plan = supabase.table("subscriptions").select("*").eq("id", profile.data["plan_id"]).single().execute()
-            if plan.data:
-                plan_limits = plan.data
+        if plan:
+            plan_limits = plan
         
         return {
+            "period_start": current_period().isoformat(),
             "current_usage": {
                 "messages": message_count,
                 "documents": document_count
@@ -42,12 +41,8 @@ async def get_usage(
 
 
 @router.get("/invoices")
-async def get_invoices(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def get_invoices(current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("billing_records").select("*").eq("customer_id", current_user["id"]).order("period_start", desc=True).execute()
-        return response.data
+        return await billing_repository.invoices(current_user["id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
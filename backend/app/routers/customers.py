@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
 from app.models.schemas import UserProfile, ProfileUpdate, ChatbotPromptUpdate
-from app.database import get_supabase
 from app.services.auth_service import get_current_user
-from app.services.manychat_service import validate_manychat_api_key
+from app.services.manychat_service import validate_manychat_api_key, manychat_service
+from app.services.invalidation import invalidation_bus, TENANT
+from app.services.answer_cache import answer_cache
+from app.services.admission import admission_controller
+from app.repositories.profiles import profile_repository, PROFILE_COLUMNS
 from app.config import get_settings
-from supabase import Client
 from uuid import UUID
 
 router = APIRouter(prefix="/customers", tags=["Customers"])
@@ -12,22 +14,20 @@ settings = get_settings()
 
 
 @router.get("/me", response_model=UserProfile)
-async def get_profile(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def get_profile(current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("profiles").select("*").eq("id", current_user["id"]).single().execute()
-        return response.data
+        profile = await profile_repository.get(current_user["id"])
     except Exception as e:
         raise HTTPException(status_code=404, detail="Profile not found")
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
 
 
 @router.patch("/me")
 async def update_profile(
     profile_update: ProfileUpdate,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
         # Validate ManyChat Key if provided
@@ -37,8 +37,9 @@ async def update_profile(
                  raise HTTPException(status_code=400, detail="Invalid ManyChat API Key. Please check your token.")
 
         update_data = profile_update.model_dump(exclude_unset=True)
-        response = supabase.table("profiles").update(update_data).eq("id", current_user["id"]).execute()
-        return {"message": "Profile updated successfully", "data": response.data}
+        data = await profile_repository.update(current_user["id"], update_data, returning=PROFILE_COLUMNS)
+        await invalidation_bus.invalidate(current_user["id"], TENANT)
+        return {"message": "Profile updated successfully", "data": data}
     except HTTPException:
         raise
     except Exception as e:
@@ -46,13 +47,10 @@ async def update_profile(
 
 
 @router.get("/me/webhook-url")
-async def get_webhook_url(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def get_webhook_url(current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("profiles").select("id, api_key_generee").eq("id", current_user["id"]).single().execute()
-        api_key = response.data.get("api_key_generee") or current_user["id"]
+        profile = await profile_repository.get(current_user["id"], "id, api_key_generee") or {}
+        api_key = profile.get("api_key_generee") or current_user["id"]
         
         # Use configured public API URL
         base_url = settings.public_api_url.rstrip('/')
@@ -64,14 +62,11 @@ async def get_webhook_url(
 
 
 @router.get("/me/chatbot-prompt")
-async def get_chatbot_prompt(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def get_chatbot_prompt(current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("profiles").select("chatbot_prompt").eq("id", current_user["id"]).single().execute()
+        profile = await profile_repository.get(current_user["id"], "chatbot_prompt") or {}
         return {
-            "chatbot_prompt": response.data.get("chatbot_prompt") or "Tu es un assistant client utile. Utilise UNIQUEMENT le contexte ci-dessous pour répondre à la question. Si la réponse n'est pas dans le contexte, dis poliment que tu ne sais pas."
+            "chatbot_prompt": profile.get("chatbot_prompt") or "Tu es un assistant client utile. Utilise UNIQUEMENT le contexte ci-dessous pour répondre à la question. Si la réponse n'est pas dans le contexte, dis poliment que tu ne sais pas."
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -80,16 +75,36 @@ async def get_chatbot_prompt(
 @router.put("/me/chatbot-prompt")
 async def update_chatbot_prompt(
     prompt_update: ChatbotPromptUpdate,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        response = supabase.table("profiles").update({
-            "chatbot_prompt": prompt_update.chatbot_prompt
-        }).eq("id", current_user["id"]).execute()
+        await profile_repository.update(current_user["id"], {"chatbot_prompt": prompt_update.chatbot_prompt})
+        await invalidation_bus.invalidate(current_user["id"], TENANT)
         return {
             "message": "Chatbot prompt updated successfully",
             "chatbot_prompt": prompt_update.chatbot_prompt
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/me/answer-cache")
+async def get_answer_cache_stats(current_user: dict = Depends(get_current_user)):
+    return answer_cache.tenant_stats(current_user["id"])
+
+
+@router.get("/me/admission")
+async def get_admission_stats(current_user: dict = Depends(get_current_user)):
+    """Webhook jobs of this tenant queued/running in this process, and how long they waited."""
+    return admission_controller.tenant_stats(current_user["id"]) or {
+        "queued": 0, "running": 0, "admitted": 0, "shed": 0, "wait_ms_avg": 0.0, "wait_ms_max": 0.0
+    }
+
+
+@router.get("/me/delivery")
+async def get_delivery_stats(current_user: dict = Depends(get_current_user)):
+    """ManyChat deliveries of this tenant from this process: sent, failed, retries and latency."""
+    return manychat_service.tenant_stats(current_user["id"]) or {
+        "sent": 0, "failed": 0, "retries": 0, "latency_ms_avg": 0.0, "last_error": None,
+        "time_to_first_message_ms": {}
+    }
@@ -1,91 +1,112 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, Request
 from app.models.schemas import DocumentResponse
 from app.database import get_supabase
 from app.services.auth_service import get_current_user
-from app.services.pdf_service import validate_pdf
+from app.services.pdf_service import spool_upload, validate_pdf, InvalidUploadError, UploadTooLargeError
 from app.services.gemini_service import gemini_service
-from supabase import Client
+from app.services.ingestion_service import ingestion_service
+from app.services.invalidation import invalidation_bus, ANSWERS, FAQ, VECTORS
+from app.repositories.documents import document_repository
+from app.repositories.postgrest import PostgrestError, UNIQUE_VIOLATION
 from typing import List
+import asyncio
 import uuid
 import os
-import tempfile
 
 router = APIRouter(prefix="/documents", tags=["Documents"])
 
+# The body is read by spool_upload, not by FastAPI: documented here instead of as a File parameter
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
 
-@router.post("/upload")
+
+@router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_document(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    request: Request,
+    current_user: dict = Depends(get_current_user)
 ):
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-    
-    content = await file.read()
-    
-    is_valid, message = validate_pdf(content)
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=message)
+    try:
+        upload = await spool_upload(request)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = upload.filename
     
     try:
-        # 1. Get or Create Gemini File Store for User
-        user_profile = supabase.table("profiles").select("*").eq("id", current_user["id"]).single().execute()
-        store_id = user_profile.data.get("gemini_file_store_id")
-        
-        if not store_id:
-            company_name = user_profile.data.get("company_name", "User")
-            store_id = gemini_service.create_file_store(current_user["id"], company_name)
-            # Update profile with store_id
-            supabase.table("profiles").update({"gemini_file_store_id": store_id}).eq("id", current_user["id"]).execute()
-
-        # 2. Upload to Supabase Storage (Archive)
-        file_path = f"{current_user['id']}/{uuid.uuid4()}/{file.filename}"
-        supabase.storage.from_("documents").upload(file_path, content)
+        # Same content already uploaded by this owner: reuse it instead of ingesting again
+        existing = await document_repository.find_by_hash(current_user["id"], upload.sha256)
+        if existing and existing["status"] != "failed":
+            os.unlink(upload.path)
+            return _duplicate_response(existing)
         
-        # 3. Create temp file for Gemini upload (GenAI SDK needs a file path)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-
-        try:
-            # 4. Upload to Gemini File Search Store
-            # Use a unique name for Gemini file to avoid collisions if needed, or just filename
-            # Note: We pass a display name, but we MUST store the returned resource name (files/xyz)
-            display_name = f"{current_user['id']}_{file.filename}"
-            gemini_file_resource_name = gemini_service.upload_document(tmp_path, display_name, store_id)
-        finally:
-            os.unlink(tmp_path)
+        analysis = await validate_pdf(upload.path)
+        if not analysis.valid:
+            raise HTTPException(status_code=400, detail=analysis.message)
         
-        # 5. Insert into Supabase DB
-        doc_response = supabase.table("documents").insert({
+        file_path = f"{current_user['id']}/{uuid.uuid4()}/{filename}"
+        row = {
             "owner_id": current_user["id"],
-            "filename": file.filename,
+            "filename": filename,
             "file_path": file_path,
-            "status": "processed", # Gemini processing is synchronous in our service wrapper
-            "gemini_file_name": gemini_file_resource_name
-        }).execute()
-        
-        document_id = doc_response.data[0]["id"]
-        
-        return {
-            "message": "Document uploaded and indexed successfully",
-            "document_id": document_id,
-            "status": "processed"
+            "status": "pending",
+            "error_message": None,
+            "content_hash": upload.sha256
         }
+        
+        if existing:
+            # A previous ingestion of this content failed: retry it on the same row
+            document_id = existing["id"]
+            await document_repository.update(document_id, row)
+        else:
+            try:
+                document_id = await document_repository.create(row)
+            except PostgrestError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
+                # A concurrent upload of the same content won the race
+                os.unlink(upload.path)
+                return _duplicate_response(await document_repository.find_by_hash(current_user["id"], upload.sha256))
+    except HTTPException:
+        os.unlink(upload.path)
+        raise
     except Exception as e:
+        os.unlink(upload.path)
         raise HTTPException(status_code=500, detail=str(e))
 
+    ingestion_service.submit(document_id, current_user["id"], upload.path, file_path, filename,
+                             analysis.page_count)
+
+    return {
+        "message": "Document uploaded, indexing in progress",
+        "document_id": document_id,
+        "status": "pending",
+        "page_count": analysis.page_count
+    }
+
+
+def _duplicate_response(document: dict) -> dict:
+    return {
+        "message": "This document has already been uploaded",
+        "document_id": document["id"],
+        "status": document["status"],
+        "gemini_file_name": document.get("gemini_file_name"),
+        "duplicate": True
+    }
+
 
 @router.get("", response_model=List[DocumentResponse])
-async def list_documents(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
-):
+async def list_documents(current_user: dict = Depends(get_current_user)):
     try:
-        response = supabase.table("documents").select("*").eq("owner_id", current_user["id"]).order("created_at", desc=True).execute()
-        return response.data
+        return await document_repository.list(current_user["id"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -93,31 +114,31 @@ async def list_documents(
 @router.get("/{document_id}")
 async def get_document(
     document_id: int,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        response = supabase.table("documents").select("*").eq("id", document_id).eq("owner_id", current_user["id"]).single().execute()
-        return response.data
+        document = await document_repository.get(current_user["id"], document_id)
     except Exception as e:
         raise HTTPException(status_code=404, detail="Document not found")
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document
 
 
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    current_user: dict = Depends(get_current_user)
 ):
     try:
-        doc = supabase.table("documents").select("file_path", "gemini_file_name").eq("id", document_id).eq("owner_id", current_user["id"]).single().execute()
+        doc = await document_repository.get(current_user["id"], document_id, "file_path, gemini_file_name")
         
-        if not doc.data:
+        if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Delete from Gemini if exists
-        if doc.data.get("gemini_file_name"):
-            gemini_service.delete_document(doc.data["gemini_file_name"])
+        if doc.get("gemini_file_name"):
+            await gemini_service.delete_document(doc["gemini_file_name"])
             # Note: We don't delete from the store explicitly as deleting the file resource removes it from stores? 
             # Actually, the file resource in Gemini is temporary (48h) unless imported to store.
             # But "Files imported to a File Search store ... stored indefinitely".
@@ -133,13 +154,11 @@ async def delete_document(
             # However, usually there is a way to manage resources. 
             # For now, let's keep the `delete_document` call which tries to clean up what it can.
         
-        # We don't need to delete from document_sections anymore as we don't use it
-        # supabase.table("document_sections").delete().eq("document_id", document_id).execute()
-        
-        supabase.table("documents").delete().eq("id", document_id).execute()
+        await document_repository.delete(document_id)
+        await invalidation_bus.invalidate(current_user["id"], VECTORS, ANSWERS, FAQ)
         
         try:
-            supabase.storage.from_("documents").remove([doc.data["file_path"]])
+            await asyncio.to_thread(get_supabase().storage.from_("documents").remove, [doc["file_path"]])
         except:
             pass
         
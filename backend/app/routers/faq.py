@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Depends
+from app.models.schemas import FaqEntryCreate, FaqEntryResponse
+from app.services.auth_service import get_current_user
+from app.services.invalidation import invalidation_bus, FAQ
+from app.repositories.faq import faq_repository
+from typing import List
+
+router = APIRouter(prefix="/faq", tags=["FAQ"])
+
+
+@router.get("", response_model=List[FaqEntryResponse])
+async def list_faq_entries(current_user: dict = Depends(get_current_user)):
+    try:
+        return await faq_repository.list(current_user["id"])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("", response_model=FaqEntryResponse)
+async def create_faq_entry(
+    entry: FaqEntryCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        created = await faq_repository.create(current_user["id"], entry.question, entry.answer)
+        await invalidation_bus.invalidate(current_user["id"], FAQ)
+        return created
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{entry_id}")
+async def delete_faq_entry(
+    entry_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        if not await faq_repository.delete(current_user["id"], entry_id):
+            raise HTTPException(status_code=404, detail="FAQ entry not found")
+        await invalidation_bus.invalidate(current_user["id"], FAQ)
+        return {"message": "FAQ entry deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
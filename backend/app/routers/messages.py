@@ -1,58 +1,60 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from app.models.schemas import MessageResponse
-from app.database import get_supabase
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from app.models.schemas import MessageResponse, ConversationResponse
 from app.services.auth_service import get_current_user
-from supabase import Client
+from app.services.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, encode_cursor
+from app.repositories.messages import message_repository
 from typing import List, Optional
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
 
+DEFAULT_CONVERSATIONS_PAGE = 100
+
 
 @router.get("", response_model=List[MessageResponse])
 async def list_messages(
+    response: Response,
     limit: int = Query(50, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     user_phone: Optional[str] = None,
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    current_user: dict = Depends(get_current_user)
 ):
+    """Newest first. Pass the `X-Next-Cursor` response header back as `cursor` for the next page."""
     try:
-        query = supabase.table("messages").select("*").eq("customer_id", current_user["id"])
-        
-        if user_phone:
-            query = query.eq("user_phone", user_phone)
-        
-        response = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
-        return response.data
+        # OFFSET is kept for existing clients; it gets slower the deeper the page
+        rows = await message_repository.page(current_user["id"], limit, cursor, offset, user_phone)
+        if len(rows) == limit:
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["id"])
+        return rows
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/conversations")
+@router.get("/conversations", response_model=List[ConversationResponse])
 async def list_conversations(
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase)
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
 ):
+    """
+    Most recently active first, read from the `conversations` summary table.
+
+    Without `limit` or `cursor` every conversation is returned, as before pagination;
+    otherwise pages of `limit` (100 by default) follow the `X-Next-Cursor` header.
+    """
     try:
-        response = supabase.rpc(
-            "get_conversations",
-            {"filter_customer_id": current_user["id"]}
-        ).execute()
-        return response.data
+        if limit is None and cursor is not None:
+            limit = DEFAULT_CONVERSATIONS_PAGE
+        rows = await message_repository.conversations(current_user["id"], limit, cursor)
+        if limit is not None and len(rows) == limit:
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["last_message_at"], last["last_message_id"])
+        return rows
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        response = supabase.table("messages").select(
-            "user_phone, created_at"
-        ).eq("customer_id", current_user["id"]).order("created_at", desc=True).execute()
-        
-        conversations = {}
-        for msg in response.data:
-            phone = msg["user_phone"]
-            if phone not in conversations:
-                conversations[phone] = {
-                    "user_phone": phone,
-                    "last_message_at": msg["created_at"],
-                    "message_count": 0
-                }
-            conversations[phone]["message_count"] += 1
-        
-        return list(conversations.values())
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,69 +1,143 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+import time
+from fastapi import APIRouter, HTTPException
+from typing import Optional
 from app.models.schemas import ManyChatWebhook
-from app.database import get_supabase
 from app.services.rag_service import process_rag_query
-from app.services.manychat_service import send_to_manychat
+from app.services.manychat_service import manychat_service, Outbox, StreamingReply
+from app.services.tenant_cache import tenant_cache, TenantContext
+from app.services.job_queue import Job, job_queue, QueueFullError
+from app.services.coalescer import message_coalescer
+from app.services.message_writer import message_writer
+from app.repositories.messages import message_repository
+from app.services.conversation_store import conversation_store
+from app.services.usage_meter import usage_meter
+from app.services.admission import admission_controller, LoadShedError
+from app.services.metrics import metrics
+from app.config import get_settings
 
+settings = get_settings()
 router = APIRouter(prefix="/webhook", tags=["Webhook"])
 
 
 @router.post("/incoming")
-async def handle_manychat_webhook(
-    payload: ManyChatWebhook,
-    background_tasks: BackgroundTasks
-):
-    background_tasks.add_task(process_chat, payload)
+async def handle_manychat_webhook(payload: ManyChatWebhook):
+    try:
+        await job_queue.enqueue(payload.model_dump())
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many pending messages, retry later")
     return {"status": "ok"}
 
 
-async def process_chat(payload: ManyChatWebhook):
-    supabase = get_supabase()
-    
+async def run_chat_job(job: Job):
+    with metrics.request("webhook.process_chat"):
+        await process_chat(ManyChatWebhook(**job.payload), job)
+
+
+async def process_chat(payload: ManyChatWebhook, job: Optional[Job] = None):
     try:
-        response = supabase.table("profiles").select(
-            "id, manychat_api_key, chatbot_prompt"
-        ).eq("api_key_generee", payload.client_api_key).execute()
+        with metrics.timer("webhook.tenant_lookup"):
+            tenant = await tenant_cache.get(payload.client_api_key)
         
-        if not response.data:
-            response = supabase.table("profiles").select(
-                "id, manychat_api_key, chatbot_prompt"
-            ).eq("id", payload.client_api_key).execute()
-        
-        if not response.data:
+        if tenant is None:
             print(f"Client not found for api_key: {payload.client_api_key}")
             return
         
-        client_data = response.data[0]
-        owner_id = client_data["id"]
-        manychat_token = client_data["manychat_api_key"]
-        custom_prompt = client_data.get("chatbot_prompt")
+        owner_id = tenant.owner_id
+        metrics.set_tenant(owner_id)
+        manychat_token = tenant.manychat_api_key
         
         if not manychat_token:
             print(f"No ManyChat API key configured for client: {owner_id}")
             return
         
-        supabase.table("messages").insert({
+        # Taken on arrival so replies go out in the order the subscriber's messages came in
+        async with manychat_service.outbox(owner_id, payload.user_id, manychat_token) as outbox:
+            await answer_message(payload, tenant, outbox, job)
+        
+    except Exception as e:
+        print(f"Error processing chat: {str(e)}")
+        raise
+
+
+async def already_answered(job: Optional[Job]) -> bool:
+    """Whether an earlier attempt of this job got as far as storing its reply."""
+    if job is None or job.attempts == 0:
+        return False
+    return message_writer.pending(job.id, "outbound") or await message_repository.has_reply(job.id)
+
+
+async def answer_message(payload: ManyChatWebhook, tenant: TenantContext, outbox: Outbox,
+                         job: Optional[Job] = None):
+    owner_id = tenant.owner_id
+    job_id = job.id if job is not None else None
+    
+    # A retry must not ask Gemini again, nor send the subscriber a second reply
+    if await already_answered(job):
+        metrics.inc("webhook_replies_total", outcome="already_answered")
+        return
+    
+    # Loaded before this message is written so a reload from the table doesn't include it
+    conversation = None
+    if settings.conversation_memory_enabled:
+        with metrics.timer("webhook.conversation_load"):
+            conversation = await conversation_store.get(owner_id, payload.user_id)
+    
+    # Keyed by job so a retry of this job doesn't store the message a second time
+    with metrics.timer("webhook.inbound_write"):
+        await message_writer.write({
             "customer_id": owner_id,
             "user_phone": payload.user_id,
             "direction": "inbound",
-            "content": payload.last_text_input
-        }).execute()
-        
-        ai_response = await process_rag_query(
-            payload.last_text_input,
-            owner_id,
-            custom_prompt
-        )
-        
-        supabase.table("messages").insert({
+            "content": payload.last_text_input,
+            "job_id": job_id
+        })
+    
+    query = payload.last_text_input
+    if tenant.message_coalesce_ms > 0:
+        # Only the first message of a burst answers, with the whole burst as query
+        with metrics.timer("webhook.coalesce"):
+            query = await message_coalescer.submit(
+                owner_id, payload.user_id, query, tenant.message_coalesce_ms / 1000
+            )
+        if query is None:
+            metrics.inc("webhook_replies_total", outcome="coalesced")
+            return
+    
+    reply = StreamingReply(outbox, settings.stream_min_chars, settings.stream_max_delay_seconds)
+    answered = False
+    try:
+        async with admission_controller.slot(tenant):
+            with metrics.timer("webhook.usage_check"):
+                allowed = await usage_meter.try_consume(owner_id, tenant.monthly_request_limit)
+            if allowed:
+                reply.started = time.monotonic()
+                on_chunk = reply.feed if settings.stream_replies_enabled else None
+                with metrics.timer("rag.query"):
+                    ai_response = await process_rag_query(query, tenant, conversation, on_chunk)
+                answered = True
+                metrics.inc("webhook_replies_total", outcome="answered")
+            else:
+                print(f"Monthly request limit ({tenant.monthly_request_limit}) reached for client: {owner_id}")
+                ai_response = settings.quota_exceeded_message
+                metrics.inc("webhook_replies_total", outcome="quota_exceeded")
+    except LoadShedError:
+        ai_response = settings.load_shed_message
+        metrics.inc("webhook_replies_total", outcome="shed")
+    
+    if not ai_response:
+        return
+    
+    with metrics.timer("webhook.delivery"):
+        sent = await reply.finish(ai_response)
+    if answered and conversation is not None:
+        conversation_store.record(conversation, query, sent)
+    
+    # Stored once, whole, as the subscriber got it however many messages it was sent as
+    with metrics.timer("webhook.outbound_write"):
+        await message_writer.write({
             "customer_id": owner_id,
             "user_phone": payload.user_id,
             "direction": "outbound",
-            "content": ai_response
-        }).execute()
-        
-        await send_to_manychat(payload.user_id, ai_response, manychat_token)
-        
-    except Exception as e:
-        print(f"Error processing chat: {str(e)}")
-        raise
+            "content": sent,
+            "job_id": job_id
+        })
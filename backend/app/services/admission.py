@@ -0,0 +1,208 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+from app.config import get_settings
+from app.services.tenant_cache import TenantContext
+from app.services.metrics import metrics, tenant_alias
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class LoadShedError(Exception):
+    pass
+
+
+class _TenantState:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.tokens = burst
+        self.updated_at = now
+        self.rate = rate
+        self.burst = burst
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.running = 0
+        self.max_concurrent = 1
+        self.weight = 1
+        self.pass_value = 0.0  # Stride scheduling: lowest pass is served next
+        self.admitted = 0
+        self.shed = 0
+        self.wait_ms_avg = 0.0
+        self.wait_ms_max = 0.0
+
+    def take_token(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController:
+    """
+    Decides when a tenant's webhook job may run.
+
+    Each tenant has a token bucket (`requests_per_minute` of its plan, bursting up to
+    `burst_seconds` worth) and a cap on jobs running at once (`max_concurrent_requests`).
+    At most `max_in_flight` jobs run in the process; waiting jobs are served in weighted
+    fair order across tenants (stride scheduling on `scheduling_weight`), so a burst from
+    one tenant queues behind its own cap instead of everyone's. Jobs are shed with
+    LoadShedError when the bucket is empty, the queues are full, or the wait exceeds
+    `max_wait`.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, max_queued_per_tenant: int,
+                 max_wait: float, burst_seconds: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self.max_wait = max_wait
+        self.burst_seconds = burst_seconds
+        self._tenants: Dict[str, _TenantState] = {}
+        self.virtual_pass = 0.0
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def slot(self, tenant: TenantContext):
+        state = self._state(tenant)
+        with metrics.timer("admission.wait"):
+            await self._acquire(tenant, state)
+        try:
+            yield
+        finally:
+            state.running -= 1
+            self.in_flight -= 1
+            self._dispatch()
+
+    async def _acquire(self, tenant: TenantContext, state: _TenantState):
+        started = time.monotonic()
+        if not state.take_token(started):
+            self._shed(state, tenant, "rate limit")
+        if not state.waiters and not state.running:
+            self._level(state)
+        if not state.waiters and state.running < tenant.max_concurrent_requests and self.in_flight < self.max_in_flight:
+            self._grant(state)
+            self._record_wait(state, 0.0)
+            return
+        if len(state.waiters) >= self.max_queued_per_tenant or self.queued >= self.max_queued:
+            self._shed(state, tenant, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            self._withdraw(state, waiter)
+            self._shed(state, tenant, f"waited more than {self.max_wait:.0f}s")
+        except asyncio.CancelledError:
+            self._withdraw(state, waiter)
+            raise
+        self._record_wait(state, (time.monotonic() - started) * 1000)
+
+    def _withdraw(self, state: _TenantState, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # Granted just as we gave up: hand the slot back
+            state.running -= 1
+            self.in_flight -= 1
+            self._dispatch()
+            return
+        waiter.cancel()
+        try:
+            state.waiters.remove(waiter)
+            self.queued -= 1
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        """Grants slots to waiting tenants, lowest pass first, while capacity remains."""
+        while self.in_flight < self.max_in_flight:
+            eligible = [
+                (state.pass_value, owner_id) for owner_id, state in self._tenants.items()
+                if state.waiters and state.running < state.max_concurrent
+            ]
+            if not eligible:
+                return
+            _, owner_id = min(eligible)
+            state = self._tenants[owner_id]
+            waiter = state.waiters.popleft()
+            self.queued -= 1
+            if waiter.done():
+                continue
+            self._grant(state)
+            waiter.set_result(None)
+
+    def _level(self, state: _TenantState):
+        # A tenant coming back from idle starts at the current virtual time instead of
+        # spending credit it accumulated while it had nothing queued. A tenant that
+        # keeps jobs queued is never levelled: its lower pass is what its weight earns.
+        state.pass_value = max(state.pass_value, self.virtual_pass)
+
+    def _grant(self, state: _TenantState):
+        # Slots always go to the lowest pass, so this tracks how far scheduling has got
+        self.virtual_pass = max(self.virtual_pass, state.pass_value)
+        state.pass_value += 1.0 / state.weight
+        state.running += 1
+        state.admitted += 1
+        self.in_flight += 1
+
+    def _shed(self, state: _TenantState, tenant: TenantContext, reason: str):
+        state.shed += 1
+        self.shed += 1
+        logger.warning(f"Shedding webhook job for {tenant.owner_id}: {reason}")
+        raise LoadShedError(reason)
+
+    def _record_wait(self, state: _TenantState, wait_ms: float):
+        state.wait_ms_avg = wait_ms if state.admitted <= 1 else 0.9 * state.wait_ms_avg + 0.1 * wait_ms
+        state.wait_ms_max = max(state.wait_ms_max, wait_ms)
+
+    def _state(self, tenant: TenantContext) -> _TenantState:
+        now = time.monotonic()
+        rate = tenant.requests_per_minute / 60
+        burst = max(1.0, rate * self.burst_seconds)
+        state = self._tenants.get(tenant.owner_id)
+        if state is None:
+            state = self._tenants[tenant.owner_id] = _TenantState(rate, burst, now)
+        # Plan changes apply on the next job
+        state.rate, state.burst = rate, burst
+        state.max_concurrent = tenant.max_concurrent_requests
+        state.weight = max(1, tenant.scheduling_weight)
+        return state
+
+    def tenant_stats(self, owner_id: str) -> Optional[dict]:
+        state = self._tenants.get(owner_id)
+        if state is None:
+            return None
+        return {
+            "queued": len(state.waiters),
+            "running": state.running,
+            "admitted": state.admitted,
+            "shed": state.shed,
+            "wait_ms_avg": round(state.wait_ms_avg, 1),
+            "wait_ms_max": round(state.wait_ms_max, 1),
+        }
+
+    def stats(self, top: int = 20) -> dict:
+        busiest = sorted(self._tenants, key=lambda o: len(self._tenants[o].waiters) + self._tenants[o].running, reverse=True)
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": self.queued,
+            "shed": self.shed,
+            "tenants": {tenant_alias(owner_id): self.tenant_stats(owner_id) for owner_id in busiest[:top]},
+        }
+
+
+admission_controller = AdmissionController(
+    max_in_flight=settings.worker_concurrency,
+    max_queued=settings.admission_max_queued,
+    max_queued_per_tenant=settings.admission_max_queued_per_tenant,
+    max_wait=settings.admission_max_wait_seconds,
+    burst_seconds=settings.admission_burst_seconds,
+)
@@ -0,0 +1,262 @@
+import re
+import time
+import hashlib
+import importlib.util
+import logging
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.services.gemini_service import gemini_service
+
+# Semantic matching is optional; numpy is only imported once an embedding is matched or stored
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases, strips accents and punctuation and collapses whitespace."""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def prompt_version(prompt: Optional[str]) -> str:
+    return hashlib.sha1((prompt or "").encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    expires_at: float
+    generation_ms: float
+    row: Optional[int] = None
+
+
+@dataclass
+class TenantStats:
+    lookups: int = 0
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    stores: int = 0
+    context_skips: int = 0  # Questions answered without the cache because they depend on earlier turns
+    latency_saved_ms: float = 0.0
+
+    def as_dict(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "stores": self.stores,
+            "context_skips": self.context_skips,
+            "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+        }
+
+
+@dataclass
+class CacheLookup:
+    owner_id: str
+    scope: Tuple[str, str]
+    key: str
+    generation: int
+    answer: Optional[str] = None
+    embedding: Optional[List[float]] = None
+
+
+class _ScopeCache:
+    """Answers of one (owner_id, prompt version) scope, with an optional embedding matrix."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self.matrix = None
+        self.row_keys: List[Optional[str]] = []
+        self.free_rows: List[int] = []
+
+    def get(self, key: str, now: float) -> Optional[CachedAnswer]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def nearest(self, embedding, threshold: float, now: float) -> Optional[CachedAnswer]:
+        if self.matrix is None or not self.entries:
+            return None
+        import numpy as np
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        # Rows are stored L2-normalised; free rows are zeroed and score 0.
+        scores = self.matrix @ (query / norm)
+        row = int(np.argmax(scores))
+        if scores[row] < threshold:
+            return None
+        key = self.row_keys[row]
+        return self.get(key, now) if key is not None else None
+
+    def put(self, key: str, entry: CachedAnswer, embedding=None):
+        if key in self.entries:
+            self.remove(key)
+        if embedding is not None and NUMPY_AVAILABLE:
+            entry.row = self._write_row(key, embedding)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None and entry.row is not None:
+            self.matrix[entry.row] = 0.0
+            self.row_keys[entry.row] = None
+            self.free_rows.append(entry.row)
+
+    def _write_row(self, key: str, embedding) -> Optional[int]:
+        import numpy as np
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        if self.matrix is None:
+            # Compact, preallocated float32 matrix: one row per possible entry
+            self.matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self.row_keys = [None] * self.max_entries
+            self.free_rows = list(range(self.max_entries - 1, -1, -1))
+        if not self.free_rows:
+            self.remove(next(iter(self.entries)))
+        row = self.free_rows.pop()
+        self.matrix[row] = vector / norm
+        self.row_keys[row] = key
+        return row
+
+
+class AnswerCache:
+    """
+    Per-tenant cache of generated answers, scoped by owner_id and chatbot prompt version.
+
+    Queries are matched exactly after normalisation and, when semantic matching is
+    enabled, by cosine similarity of their embeddings. Each scope is bounded (LRU + TTL)
+    and the number of cached tenants is bounded too. Document changes invalidate every
+    scope of the owner.
+    """
+
+    def __init__(self, ttl: float, max_entries_per_tenant: int, max_tenants: int,
+                 semantic: bool = False, similarity_threshold: float = 0.92):
+        self.ttl = ttl
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.max_tenants = max_tenants
+        self.semantic = semantic and NUMPY_AVAILABLE
+        self.similarity_threshold = similarity_threshold
+        self._scopes: "OrderedDict[Tuple[str, str], _ScopeCache]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._stats: Dict[str, TenantStats] = {}
+
+        if semantic and not NUMPY_AVAILABLE:
+            logger.warning("numpy is not installed; answer cache falls back to exact matching")
+
+    async def lookup(self, owner_id: str, custom_prompt: Optional[str], query: str) -> CacheLookup:
+        scope = (owner_id, prompt_version(custom_prompt))
+        result = CacheLookup(
+            owner_id=owner_id,
+            scope=scope,
+            key=normalize_query(query),
+            generation=self._generations.get(owner_id, 0),
+        )
+        stats = self._stats.setdefault(owner_id, TenantStats())
+        stats.lookups += 1
+        now = time.monotonic()
+
+        cache = self._scopes.get(scope)
+        if cache is not None:
+            self._scopes.move_to_end(scope)
+            entry = cache.get(result.key, now)
+            if entry is not None:
+                stats.exact_hits += 1
+                stats.latency_saved_ms += entry.generation_ms
+                result.answer = entry.answer
+                return result
+
+        if self.semantic:
+            try:
+                result.embedding = await gemini_service.embed_text(result.key)
+            except Exception as e:
+                logger.warning(f"Answer cache embedding failed: {e}")
+                return result
+            cache = self._scopes.get(scope)
+            if cache is not None:
+                entry = cache.nearest(result.embedding, self.similarity_threshold, time.monotonic())
+                if entry is not None:
+                    stats.semantic_hits += 1
+                    stats.latency_saved_ms += entry.generation_ms
+                    result.answer = entry.answer
+
+        return result
+
+    def skip_for_context(self, owner_id: str):
+        """Counts a question that bypassed the cache because it only makes sense with the conversation."""
+        self._stats.setdefault(owner_id, TenantStats()).context_skips += 1
+
+    def store(self, lookup: CacheLookup, answer: str, generation_ms: float):
+        # Documents changed while the answer was being generated: it may be stale.
+        if self._generations.get(lookup.owner_id, 0) != lookup.generation:
+            return
+
+        cache = self._scopes.get(lookup.scope)
+        if cache is None:
+            cache = _ScopeCache(self.max_entries_per_tenant)
+            self._scopes[lookup.scope] = cache
+            while len(self._scopes) > self.max_tenants:
+                self._scopes.popitem(last=False)
+        self._scopes.move_to_end(lookup.scope)
+
+        entry = CachedAnswer(answer=answer, expires_at=time.monotonic() + self.ttl, generation_ms=generation_ms)
+        cache.put(lookup.key, entry, lookup.embedding if self.semantic else None)
+        self._stats.setdefault(lookup.owner_id, TenantStats()).stores += 1
+
+    def invalidate_owner(self, owner_id: str):
+        self._generations[owner_id] = self._generations.get(owner_id, 0) + 1
+        for scope in [s for s in self._scopes if s[0] == owner_id]:
+            del self._scopes[scope]
+
+    def tenant_stats(self, owner_id: str) -> dict:
+        stats = self._stats.get(owner_id, TenantStats()).as_dict()
+        stats["entries"] = sum(len(c.entries) for s, c in self._scopes.items() if s[0] == owner_id)
+        return stats
+
+    def stats(self) -> dict:
+        total = TenantStats()
+        for s in self._stats.values():
+            total.lookups += s.lookups
+            total.exact_hits += s.exact_hits
+            total.semantic_hits += s.semantic_hits
+            total.stores += s.stores
+            total.context_skips += s.context_skips
+            total.latency_saved_ms += s.latency_saved_ms
+        return {
+            **total.as_dict(),
+            "tenants": len(self._scopes),
+            "entries": sum(len(c.entries) for c in self._scopes.values()),
+            "semantic": self.semantic,
+        }
+
+
+answer_cache = AnswerCache(
+    ttl=settings.answer_cache_ttl_seconds,
+    max_entries_per_tenant=settings.answer_cache_max_entries_per_tenant,
+    max_tenants=settings.answer_cache_max_tenants,
+    semantic=settings.answer_cache_semantic,
+    similarity_threshold=settings.answer_cache_similarity_threshold,
+)
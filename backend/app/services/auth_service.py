@@ -1,32 +1,163 @@
+import asyncio
+import hashlib
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import httpx
 from fastapi import HTTPException, Header, Depends
-from jose import jwt, JWTError
 from app.config import get_settings
 from app.database import get_supabase
-from supabase import Client
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+# Former default of `jwt_secret` and the .env.example value: public, so they must never verify anything
+PLACEHOLDER_SECRETS = ("your-jwt-secret-key", "your-jwt-secret")
 
-async def get_current_user(
-    authorization: str = Header(...),
-    supabase: Client = Depends(get_supabase)
-) -> dict:
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens without a round trip to the auth server.
+
+    HS256 tokens are checked against `jwt_secret` (the project's JWT secret), RS256/ES256
+    ones against the project's JWKS, fetched once and kept for `jwks_ttl` seconds. Without
+    a real `jwt_secret` (unset or the old placeholder), HS256 tokens are confirmed with
+    `auth.get_user` instead. Decoded users are cached by token hash for `claims_ttl`
+    seconds (never past the token expiry).
+
+    With `revocation_check`, a token seen for the first time is also confirmed with
+    `auth.get_user`, so a signed-out token is refused once its cache entry expires.
+    """
+
+    def __init__(self, secret: str, audience: str, jwks_url: str, jwks_ttl: float,
+                 claims_ttl: float, max_entries: int, revocation_check: bool):
+        self.secret = secret if secret and secret not in PLACEHOLDER_SECRETS else None
+        if self.secret is None:
+            logger.warning("JWT_SECRET is not set: HS256 tokens are verified with the auth server")
+        self.audience = audience
+        self.jwks_url = jwks_url
+        self.jwks_ttl = jwks_ttl
+        self.claims_ttl = claims_ttl
+        self.max_entries = max_entries
+        self.revocation_check = revocation_check
+        self._claims: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._jwks: Dict[str, dict] = {}
+        self._jwks_fetched_at = 0.0
+        self._jwks_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def verify(self, token: str) -> dict:
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        entry = self._claims.get(key)
+        if entry is not None and entry[1] > now:
+            self._claims.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        # python-jose (and its crypto backend) is imported with the first token to decode
+        from jose import jwt
+
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256" and self.secret is None:
+            claims = await self._remote_claims(token)
+        else:
+            claims = await self._decode(token, header)
+            if self.revocation_check:
+                await self._remote_claims(token)
+
+        user = {
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "role": (claims.get("user_metadata") or {}).get("role", "account_user")
+        }
+        self._claims[key] = (user, min(now + self.claims_ttl, claims["exp"]))
+        while len(self._claims) > self.max_entries:
+            self._claims.popitem(last=False)
+        return user
+
+    def stats(self) -> dict:
+        return {"entries": len(self._claims), "hits": self.hits, "misses": self.misses}
+
+    async def _remote_claims(self, token: str) -> dict:
+        """Claims of a token the auth server accepts, taken from the user it returns."""
+        supabase = await asyncio.to_thread(get_supabase)
+        user_response = await asyncio.to_thread(supabase.auth.get_user, token)
+        user = user_response.user if user_response else None
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # Only the expiry is read from the token itself, to bound the cache entry
+        from jose import jwt, JWTError
+        exp = jwt.get_unverified_claims(token).get("exp")
+        if not isinstance(exp, (int, float)):
+            raise JWTError("Token has no expiry")
+        return {"sub": str(user.id), "email": user.email, "user_metadata": user.user_metadata or {}, "exp": exp}
+
+    async def _decode(self, token: str, header: dict) -> dict:
+        from jose import jwt, JWTError
+
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            key = self.secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = await self._signing_key(header.get("kid"))
+        else:
+            raise JWTError(f"Unsupported token algorithm: {algorithm}")
+
+        # Signature, expiry and audience; "exp" is required so cached entries always expire
+        return jwt.decode(
+            token, key, algorithms=[algorithm], audience=self.audience,
+            options={"require_exp": True, "require_sub": True}
+        )
+
+    async def _signing_key(self, kid: Optional[str]) -> dict:
+        key = self._jwks.get(kid)
+        if key is not None and time.monotonic() - self._jwks_fetched_at < self.jwks_ttl:
+            return key
+
+        async with self._jwks_lock:
+            # Unknown kid (key rotation) refreshes the set, at most once a minute
+            stale = time.monotonic() - self._jwks_fetched_at >= self.jwks_ttl
+            if stale or (kid not in self._jwks and time.monotonic() - self._jwks_fetched_at >= 60):
+                async with httpx.AsyncClient(timeout=10.0) as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                self._jwks = {k.get("kid"): k for k in response.json().get("keys", [])}
+                self._jwks_fetched_at = time.monotonic()
+                logger.info(f"Loaded {len(self._jwks)} signing keys from {self.jwks_url}")
+
+        key = self._jwks.get(kid)
+        if key is None:
+            from jose import JWTError
+            raise JWTError(f"Unknown signing key: {kid}")
+        return key
+
+
+token_verifier = TokenVerifier(
+    secret=settings.jwt_secret,
+    audience=settings.auth_jwt_audience,
+    jwks_url=f"{settings.supabase_url}/auth/v1/.well-known/jwks.json",
+    jwks_ttl=settings.auth_jwks_ttl_seconds,
+    claims_ttl=settings.auth_claims_cache_ttl_seconds,
+    max_entries=settings.auth_claims_cache_max_entries,
+    revocation_check=settings.auth_revocation_check,
+)
+
+
+async def get_current_user(authorization: str = Header(...)) -> dict:
     try:
         if not authorization.startswith("Bearer "):
             raise HTTPException(status_code=401, detail="Invalid authorization header")
-        
+
         token = authorization.split(" ")[1]
-        
-        user_response = supabase.auth.get_user(token)
-        
-        if user_response.user:
-            return {
-                "id": str(user_response.user.id),
-                "email": user_response.user.email,
-                "role": user_response.user.user_metadata.get("role", "account_user")
-            }
-        
-        raise HTTPException(status_code=401, detail="Invalid token")
+
+        return await token_verifier.verify(token)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication failed: {str(e)}")
 
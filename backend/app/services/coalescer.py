@@ -0,0 +1,76 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+
+@dataclass
+class _Burst:
+    texts: List[str]
+    deadline: float
+    hard_deadline: float
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class MessageCoalescer:
+    """
+    Debounces bursts of messages per (owner_id, user_id).
+
+    The first message of a burst makes its caller the leader: it waits until no new
+    message arrived for `window` seconds (bounded by `max_wait` overall and
+    `max_messages`) and gets the merged text back. Callers whose message joined an
+    open burst get None and have nothing left to do. Bursts are tracked per process.
+    """
+
+    def __init__(self, max_wait: float, max_messages: int):
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self._bursts: Dict[Tuple[str, str], _Burst] = {}
+        self.bursts = 0
+        self.merged_messages = 0
+
+    async def submit(self, owner_id: str, user_id: str, text: str, window: float) -> Optional[str]:
+        key = (owner_id, user_id)
+        now = time.monotonic()
+
+        burst = self._bursts.get(key)
+        if burst is not None:
+            burst.texts.append(text)
+            burst.deadline = min(now + window, burst.hard_deadline)
+            if len(burst.texts) >= self.max_messages:
+                burst.wakeup.set()
+            return None
+
+        burst = _Burst(texts=[text], deadline=now + window, hard_deadline=now + self.max_wait)
+        self._bursts[key] = burst
+        try:
+            while len(burst.texts) < self.max_messages:
+                remaining = burst.deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(burst.wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            del self._bursts[key]
+
+        self.bursts += 1
+        self.merged_messages += len(burst.texts)
+        return "\n".join(burst.texts)
+
+    def stats(self) -> dict:
+        return {
+            "open_bursts": len(self._bursts),
+            "bursts": self.bursts,
+            "merged_messages": self.merged_messages,
+        }
+
+
+message_coalescer = MessageCoalescer(
+    max_wait=settings.coalesce_max_wait_ms / 1000,
+    max_messages=settings.coalesce_max_messages,
+)
@@ -0,0 +1,185 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import get_settings
+from app.repositories.messages import message_repository
+from app.services.gemini_service import gemini_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for French/English text; only used for budgeting
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    role: str  # "user" or "model", as in Gemini `contents`
+    text: str
+
+
+@dataclass
+class Conversation:
+    turns: List[Turn] = field(default_factory=list)  # Most recent turns, oldest first
+    evicted: List[Turn] = field(default_factory=list)  # Pushed out of `turns`, not yet summarised
+    summary: str = ""
+    last_active: float = field(default_factory=time.monotonic)
+    compacting: bool = False
+    message_count: int = 0  # Messages of the conversation in the table that this state reflects
+
+    def context(self, token_budget: int) -> Tuple[str, List[Turn]]:
+        """Summary plus the newest turns that fit in `token_budget` (summary included)."""
+        budget = token_budget - (estimate_tokens(self.summary) if self.summary else 0)
+        selected: List[Turn] = []
+        for turn in reversed(self.evicted + self.turns):
+            budget -= estimate_tokens(turn.text)
+            if budget < 0:
+                break
+            selected.append(turn)
+        selected.reverse()
+        # Gemini expects the history to start with a user turn
+        while selected and selected[0].role != "user":
+            selected.pop(0)
+        return self.summary, selected
+
+
+class ConversationStore:
+    """
+    Recent turns per (owner_id, user_phone), kept in memory.
+
+    Each conversation holds at most `max_turns` turns; older ones are folded
+    asynchronously into a rolling summary by Gemini, so the prompt stays bounded
+    however long the conversation gets. A conversation missing from memory is reloaded
+    from the messages table; one idle for more than `idle_reset` seconds starts over.
+    State is per process (LRU-bounded to `max_conversations`), the table stays the
+    source of truth: before each turn the message count kept in `conversations` is
+    compared with the one this state reflects, and the turns are reloaded when another
+    process has answered in the meantime.
+    """
+
+    def __init__(self, max_turns: int, max_conversations: int, idle_reset: float, summary_max_chars: int):
+        self.max_turns = max_turns
+        self.max_conversations = max_conversations
+        self.idle_reset = idle_reset
+        self.summary_max_chars = summary_max_chars
+        self._conversations: "OrderedDict[Tuple[str, str], Conversation]" = OrderedDict()
+        self._load_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.loads = 0
+        self.refreshes = 0
+        self.compactions = 0
+
+    async def get(self, owner_id: str, user_phone: str) -> Conversation:
+        key = (owner_id, user_phone)
+        lock = self._load_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Read before the turns so a message written in between triggers another reload
+            message_count = await self._message_count(owner_id, user_phone)
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                self._conversations.move_to_end(key)
+                if time.monotonic() - conversation.last_active > self.idle_reset:
+                    conversation = self._conversations[key] = Conversation(message_count=message_count or 0)
+                elif message_count is not None and message_count > conversation.message_count:
+                    # Answered by another process: its turns are only in the table
+                    self.refreshes += 1
+                    conversation.turns = await self._load_or_empty(owner_id, user_phone)
+                    conversation.evicted = []
+                    conversation.message_count = message_count
+                return conversation
+
+            turns = await self._load_or_empty(owner_id, user_phone)
+            conversation = Conversation(turns=turns, message_count=message_count or 0)
+            self._conversations[key] = conversation
+            while len(self._conversations) > self.max_conversations:
+                evicted_key, _ = self._conversations.popitem(last=False)
+                self._load_locks.pop(evicted_key, None)
+        return conversation
+
+    def record(self, conversation: Conversation, user_text: str, model_text: str):
+        conversation.turns.append(Turn("user", user_text))
+        conversation.turns.append(Turn("model", model_text))
+        conversation.last_active = time.monotonic()
+        conversation.message_count += 2
+
+        overflow = len(conversation.turns) - self.max_turns
+        if overflow > 0:
+            conversation.evicted.extend(conversation.turns[:overflow])
+            del conversation.turns[:overflow]
+        # If summarising keeps failing, forget the oldest turns rather than grow forever
+        if len(conversation.evicted) > self.max_turns:
+            del conversation.evicted[:len(conversation.evicted) - self.max_turns]
+
+        if conversation.evicted and not conversation.compacting:
+            conversation.compacting = True
+            task = asyncio.create_task(self._compact(conversation))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._conversations),
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+            "compactions": self.compactions,
+            "compacting": len(self._tasks),
+        }
+
+    async def _compact(self, conversation: Conversation):
+        try:
+            while conversation.evicted:
+                batch = list(conversation.evicted)
+                summary = await gemini_service.summarize_conversation(
+                    conversation.summary, [(t.role, t.text) for t in batch], self.summary_max_chars
+                )
+                if summary is None:
+                    return
+                # Turns evicted meanwhile stay for the next round
+                conversation.summary = summary[:self.summary_max_chars]
+                done = {id(t) for t in batch}
+                conversation.evicted = [t for t in conversation.evicted if id(t) not in done]
+                self.compactions += 1
+        except Exception as e:
+            logger.warning(f"Conversation compaction failed: {e}")
+        finally:
+            conversation.compacting = False
+
+    async def _message_count(self, owner_id: str, user_phone: str) -> Optional[int]:
+        try:
+            return await message_repository.message_count(owner_id, user_phone)
+        except Exception as e:
+            logger.warning(f"Could not check history of {owner_id}/{user_phone}: {e}")
+            return None
+
+    async def _load_or_empty(self, owner_id: str, user_phone: str) -> List[Turn]:
+        try:
+            return await self._load(owner_id, user_phone)
+        except Exception as e:
+            logger.warning(f"Could not load history for {owner_id}/{user_phone}: {e}")
+            return []
+
+    async def _load(self, owner_id: str, user_phone: str) -> List[Turn]:
+        self.loads += 1
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.idle_reset)
+        rows = await message_repository.recent(owner_id, user_phone, since.isoformat(), self.max_turns)
+        return [Turn("user" if row["direction"] == "inbound" else "model", row["content"]) for row in rows]
+
+
+conversation_store = ConversationStore(
+    max_turns=settings.conversation_max_turns,
+    max_conversations=settings.conversation_max_conversations,
+    idle_reset=settings.conversation_idle_reset_seconds,
+    summary_max_chars=settings.conversation_summary_max_chars,
+)
@@ -0,0 +1,320 @@
+import asyncio
+import math
+import re
+import time
+import logging
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.repositories.documents import document_repository
+from app.repositories.faq import faq_repository
+from app.services.answer_cache import normalize_query
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette dans de des du elle en est et etre il ils je la le les leur lui ma mais me
+mes mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes ton tu un une vos
+votre vous y c d j l m n s t est quel quelle quels quelles combien comment
+the an and are as at be by for from has have how i in is it of on or that the this to was what when where
+which who why will with you your do does can
+""".split())
+
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in normalize_query(text).split() if len(t) > 1 and t not in STOPWORDS]
+
+
+def snippet(passage: str, tokens: List[str], max_chars: int) -> str:
+    """The run of sentences of `passage` that mentions the most query terms, within max_chars."""
+    terms = set(tokens)
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(passage) if s.strip()]
+    if not sentences:
+        return passage[:max_chars]
+    best = max(range(len(sentences)), key=lambda i: len(terms & set(tokenize(sentences[i]))))
+    text = sentences[best]
+    for sentence in sentences[best + 1:]:
+        if len(text) + 1 + len(sentence) > max_chars or not terms & set(tokenize(sentence)):
+            break
+        text += " " + sentence
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+@dataclass
+class Bm25Match:
+    doc_id: int
+    confidence: float
+    matched_terms: int  # Distinct query terms found in the document
+    query_terms: int  # Distinct query terms
+
+    @property
+    def coverage(self) -> float:
+        return self.matched_terms / self.query_terms if self.query_terms else 0.0
+
+
+NO_MATCH = Bm25Match(-1, 0.0, 0, 0)
+
+
+@dataclass
+class FaqMatch:
+    kind: str  # "qa" (tenant-curated pair) or "passage" (document text)
+    answer: str
+    confidence: float
+
+
+class Bm25Index:
+    """
+    BM25 over a small corpus with CSR postings: `term_ptr[t]:term_ptr[t + 1]` slices the
+    flat `post_docs` / `post_tf` arrays for term t.
+    """
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        # Imported with the first index built, not at startup
+        import numpy as np
+
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(documents)
+        self.doc_len = np.asarray([len(d) for d in documents], dtype=np.float32)
+        self.avgdl = max(float(self.doc_len.mean()), 1.0) if self.n_docs else 1.0
+
+        self.vocabulary: Dict[str, int] = {}
+        postings: List[Tuple[int, int, int]] = []
+        for doc_id, tokens in enumerate(documents):
+            for term, tf in Counter(tokens).items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                postings.append((term_id, doc_id, tf))
+        postings.sort()
+
+        self.term_ptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        self.post_docs = np.fromiter((p[1] for p in postings), dtype=np.int32, count=len(postings))
+        self.post_tf = np.fromiter((p[2] for p in postings), dtype=np.float32, count=len(postings))
+        term_ids = np.fromiter((p[0] for p in postings), dtype=np.int64, count=len(postings))
+        np.add.at(self.term_ptr, term_ids + 1, 1)
+        np.cumsum(self.term_ptr, out=self.term_ptr)
+
+        df = np.diff(self.term_ptr).astype(np.float32)
+        self.idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def _weight(self, tf, doc_len):
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl))
+
+    def best(self, tokens: List[str], length_aware: bool = False) -> Bm25Match:
+        """Best match for the query tokens, or NO_MATCH.
+
+        Confidence is the BM25 score divided by the score of an ideal document, capped at
+        1. The ideal is a document made of exactly the query, or with `length_aware`, the
+        BM25 bound (every query term saturated): as the score is normalized by document
+        length, a passage only gets close by mentioning the query terms repeatedly for its
+        length, not by containing a short query once.
+        """
+        all_terms = Counter(tokens)
+        query = {t: qtf for t, qtf in all_terms.items() if t in self.vocabulary}
+        if not query or not self.n_docs:
+            return NO_MATCH
+
+        import numpy as np
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        matched = np.zeros(self.n_docs, dtype=np.int32)
+        for term in query:
+            t = self.vocabulary[term]
+            lo, hi = self.term_ptr[t], self.term_ptr[t + 1]
+            docs = self.post_docs[lo:hi]
+            scores[docs] += self.idf[t] * self._weight(self.post_tf[lo:hi], self.doc_len[docs])
+            matched[docs] += 1
+
+        doc_id = int(np.argmax(scores))
+        if scores[doc_id] <= 0:
+            return NO_MATCH
+
+        query_len = sum(all_terms.values())
+        # Query terms unknown to the corpus can never be matched: they count against confidence
+        unknown_idf = math.log(1 + (self.n_docs + 0.5) / 0.5)
+        ideal = sum(
+            (float(self.idf[self.vocabulary[t]]) if t in query else unknown_idf)
+            * ((self.k1 + 1) if length_aware else self._weight(qtf, query_len))
+            for t, qtf in all_terms.items()
+        )
+        if ideal <= 0:
+            return NO_MATCH
+        return Bm25Match(doc_id, min(1.0, float(scores[doc_id]) / ideal), int(matched[doc_id]), len(all_terms))
+
+
+class _TenantFaq:
+    def __init__(self, qa: List[Tuple[str, str]], passages: List[str], built_at: float):
+        self.qa_answers = [a for _, a in qa]
+        self.qa_index = Bm25Index([tokenize(q) for q, _ in qa])
+        self.passages = passages
+        self.passage_index = Bm25Index([tokenize(p) for p in passages])
+        self.built_at = built_at
+        self.stale = False  # Tenant's Q&A pairs or documents changed since it was built
+
+
+class FaqIndex:
+    """
+    Per-tenant lexical index used to answer high-confidence questions without the LLM.
+
+    Two BM25 indexes per tenant: one over the questions of tenant-curated Q&A pairs
+    (faq_entries) and, when `passages_enabled`, one over the extracted document chunks
+    (document_sections), answered with a snippet of the best chunk. A match also has to
+    contain `min_coverage` of the query's terms (and, for passages, `passage_min_terms`
+    of them). Built on a tenant's first question, kept LRU-bounded to `max_tenants`, and
+    rebuilt in the background after `ttl` seconds or when the tenant's documents or Q&A
+    pairs change: the previous index keeps answering until the new one is ready, so
+    the fetch and build never land on a webhook after the first one.
+    """
+
+    def __init__(self, ttl: float, max_tenants: int, qa_threshold: float, passage_threshold: float,
+                 min_coverage: float, passages_enabled: bool, passage_min_terms: int, snippet_chars: int):
+        self.ttl = ttl
+        self.max_tenants = max_tenants
+        self.qa_threshold = qa_threshold
+        self.passage_threshold = passage_threshold
+        self.min_coverage = min_coverage
+        self.passages_enabled = passages_enabled
+        self.passage_min_terms = passage_min_terms
+        self.snippet_chars = snippet_chars
+        self._tenants: "OrderedDict[str, _TenantFaq]" = OrderedDict()
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        self._generations: Dict[str, int] = {}  # Bumped on each invalidation
+        self._rebuilds: Dict[str, asyncio.Task] = {}
+        self.answered = 0
+        self.fallbacks = 0
+        self.rebuilt = 0
+
+    async def match(self, owner_id: str, query: str) -> Optional[FaqMatch]:
+        started = time.perf_counter()
+        faq = await self._get(owner_id)
+        tokens = tokenize(query)
+
+        # (kind, answer, confidence, threshold, eligible)
+        candidates = []
+        qa = faq.qa_index.best(tokens)
+        if qa.doc_id >= 0:
+            eligible = qa.coverage >= self.min_coverage
+            candidates.append(("qa", faq.qa_answers[qa.doc_id], qa.confidence, self.qa_threshold, eligible))
+        if self.passages_enabled:
+            passage = faq.passage_index.best(tokens, length_aware=True)
+            if passage.doc_id >= 0:
+                # A couple of words ("prix", "horaires") say too little to answer from raw document text
+                eligible = passage.matched_terms >= self.passage_min_terms and passage.coverage >= self.min_coverage
+                text = faq.passages[passage.doc_id]
+                candidates.append(("passage", text, passage.confidence, self.passage_threshold, eligible))
+
+        accepted = [c for c in candidates if c[4] and c[2] >= c[3]]
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        if accepted:
+            kind, answer, confidence, threshold, _ = max(accepted, key=lambda c: c[2])
+            if kind == "passage":
+                answer = snippet(answer, tokens, self.snippet_chars)
+            self.answered += 1
+            logger.info(f"FAQ decision owner={owner_id} decision=answer kind={kind} confidence={confidence:.3f} "
+                        f"threshold={threshold} elapsed_us={elapsed_us:.0f} query={query!r}")
+            return FaqMatch(kind, answer, confidence)
+
+        self.fallbacks += 1
+        best = ", ".join(f"{c[0]}={c[2]:.3f}/{c[3]}{'' if c[4] else ' (too few terms)'}" for c in candidates) or "no candidate"
+        logger.info(f"FAQ decision owner={owner_id} decision=fallback best=[{best}] "
+                    f"elapsed_us={elapsed_us:.0f} query={query!r}")
+        return None
+
+    def invalidate(self, owner_id: str):
+        self._generations[owner_id] = self._generations.get(owner_id, 0) + 1
+        faq = self._tenants.get(owner_id)
+        if faq is not None:
+            faq.stale = True
+            self._schedule_rebuild(owner_id)
+
+    async def stop(self):
+        for task in list(self._rebuilds.values()):
+            task.cancel()
+        if self._rebuilds:
+            await asyncio.gather(*self._rebuilds.values(), return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "tenants": len(self._tenants),
+            "answered": self.answered,
+            "fallbacks": self.fallbacks,
+            "rebuilt": self.rebuilt,
+            "rebuilding": len(self._rebuilds),
+        }
+
+    async def _get(self, owner_id: str) -> _TenantFaq:
+        faq = self._tenants.get(owner_id)
+        if faq is not None:
+            self._tenants.move_to_end(owner_id)
+            if faq.stale or time.monotonic() - faq.built_at >= self.ttl:
+                self._schedule_rebuild(owner_id)
+            return faq
+
+        # Nothing to answer from meanwhile: only a tenant's first question waits for the build
+        lock = self._build_locks.setdefault(owner_id, asyncio.Lock())
+        async with lock:
+            faq = self._tenants.get(owner_id)
+            if faq is None:
+                generation = self._generations.get(owner_id, 0)
+                faq = await self._build(owner_id)
+                faq.stale = self._generations.get(owner_id, 0) != generation
+                self._tenants[owner_id] = faq
+                while len(self._tenants) > self.max_tenants:
+                    evicted, _ = self._tenants.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+                    self._generations.pop(evicted, None)
+        return faq
+
+    def _schedule_rebuild(self, owner_id: str):
+        if owner_id in self._rebuilds:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._rebuild(owner_id))
+        except RuntimeError:
+            # No event loop (called outside the app): the stale index waits for the next question
+            return
+        self._rebuilds[owner_id] = task
+        task.add_done_callback(lambda _: self._rebuilds.pop(owner_id, None))
+
+    async def _rebuild(self, owner_id: str):
+        while True:
+            generation = self._generations.get(owner_id, 0)
+            try:
+                faq = await self._build(owner_id)
+            except Exception as e:
+                logger.warning(f"FAQ index rebuild for {owner_id} failed, keeping the previous one: {e}")
+                return
+            if owner_id not in self._tenants:
+                return
+            self._tenants[owner_id] = faq
+            self.rebuilt += 1
+            # Changed again while this build was reading: read once more
+            if self._generations.get(owner_id, 0) == generation:
+                return
+
+    async def _build(self, owner_id: str) -> _TenantFaq:
+        qa = await faq_repository.pairs(owner_id)
+        passages: List[str] = []
+        if self.passages_enabled:
+            async for page in document_repository.processed_sections(owner_id, "content"):
+                passages.extend(row["content"] for row in page)
+        # Tokenizing and indexing is CPU work: keep it off the event loop
+        return await asyncio.to_thread(
+            _TenantFaq, [(r["question"], r["answer"]) for r in qa], passages, time.monotonic()
+        )
+
+
+faq_index = FaqIndex(
+    ttl=settings.faq_index_ttl_seconds,
+    max_tenants=settings.faq_index_max_tenants,
+    qa_threshold=settings.faq_qa_threshold,
+    passage_threshold=settings.faq_passage_threshold,
+    min_coverage=settings.faq_min_coverage,
+    passages_enabled=settings.faq_passage_answers_enabled,
+    passage_min_terms=settings.faq_passage_min_terms,
+    snippet_chars=settings.faq_passage_snippet_chars,
+)
@@ -1,24 +1,113 @@
-import google.generativeai as genai
-import requests
-import time
+import asyncio
+import json
+import os
 import logging
+import httpx
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 from app.config import get_settings
+from app.services.resilience import AdaptiveLimiter, CircuitBreaker, ResilientCaller, UpstreamUnavailableError
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-# Configure SDK for file upload helper
-genai.configure(api_key=settings.gemini_api_key)
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+DEFAULT_PROMPT = "Tu es un assistant client utile. Utilise UNIQUEMENT le contexte ci-dessous pour répondre à la question. Si la réponse n'est pas dans le contexte, dis poliment que tu ne sais pas."
+GENERATION_ERROR_MESSAGE = "Désolé, une erreur technique est survenue lors de la génération."
+NO_ANSWER_MESSAGE = "Je n'ai pas trouvé de réponse pertinente dans les documents."
+
+# Receives each piece of text as it is generated
+ChunkCallback = Callable[[str], Awaitable[None]]
+
+
+class TruncatedAnswer(str):
+    """What a generation stream produced before breaking off: already sent, but never to be cached."""
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _iter_file(file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Streams a file from disk without blocking the event loop."""
+    f = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _resilient_caller(name: str) -> ResilientCaller:
+    return ResilientCaller(
+        f"gemini.{name}",
+        AdaptiveLimiter(
+            initial=settings.gemini_concurrency_initial,
+            min_limit=settings.gemini_concurrency_min,
+            max_limit=settings.gemini_concurrency_max,
+            latency_tolerance=settings.gemini_latency_tolerance,
+        ),
+        CircuitBreaker(settings.gemini_breaker_failure_threshold, settings.gemini_breaker_reset_seconds),
+        max_attempts=settings.gemini_max_attempts,
+        retry_base=settings.gemini_retry_base_seconds,
+        retry_max=settings.gemini_retry_max_seconds,
+    )
+
 
 class GeminiService:
     def __init__(self):
         self.api_key = settings.gemini_api_key
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta"
+        self.base_url = f"{settings.gemini_api_base_url}/v1beta"
+        self.upload_url = f"{settings.gemini_api_base_url}/upload/v1beta"
+        self._client: Optional[httpx.AsyncClient] = None
+        # One limiter/breaker per kind of call: their latencies and failure modes differ
+        self.generation = _resilient_caller("generate")
+        self.embedding = _resilient_caller("embed")
+        self.files = _resilient_caller("files")
+        self.truncated_streams = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, created on first use so every call reuses the same pool."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=settings.gemini_http2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=settings.gemini_max_connections,
+                    max_keepalive_connections=settings.gemini_max_keepalive_connections,
+                ),
+                timeout=httpx.Timeout(
+                    settings.gemini_timeout_seconds,
+                    connect=settings.gemini_connect_timeout_seconds,
+                ),
+                params={"key": self.api_key},
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "generate": self.generation.stats(),
+            "embed": self.embedding.stats(),
+            "files": self.files.stats(),
+            "truncated_streams": self.truncated_streams,
+        }
 
     def _get_headers(self):
         return {"Content-Type": "application/json"}
 
-    def create_file_store(self, user_id: str, company_name: str = None) -> str:
+    async def create_file_store(self, user_id: str, company_name: str = None) -> str:
         """Creates a new File Search Store via REST API."""
         display_name = f"store-{user_id}"
         if company_name:
@@ -26,97 +115,248 @@ class GeminiService:
             display_name = f"{safe_name}-{user_id}"
         display_name = display_name[:512]
 
-        url = f"{self.base_url}/fileSearchStores?key={self.api_key}"
+        url = f"{self.base_url}/fileSearchStores"
         payload = {"displayName": display_name}
-        
+
         logger.info(f"Creating Store: {display_name}")
-        response = requests.post(url, headers=self._get_headers(), json=payload)
+        response = await self.files.call(lambda: self.client.post(url, headers=self._get_headers(), json=payload))
         if response.status_code != 200:
             logger.error(f"Create Store Failed: {response.text}")
             response.raise_for_status()
-        
+
         return response.json()["name"]
 
-    def upload_document(self, file_path: str, file_name: str, store_name: str) -> str:
-        """Uploads file using SDK, then imports to Store using REST. Returns the Gemini File Resource Name."""
-        logger.info(f"Uploading file {file_name} to Gemini via SDK...")
-        
-        try:
-            # 1. Upload to Gemini Files API using SDK (handles mime types and protocol)
-            g_file = genai.upload_file(path=file_path, display_name=file_name)
-            logger.info(f"Uploaded to Gemini: {g_file.name}")
-            
-            # 2. Import into File Search Store via REST
-            url = f"{self.base_url}/{store_name}:importFile?key={self.api_key}"
-            payload = {"fileName": g_file.name} 
-            
-            logger.info(f"Importing {g_file.name} into {store_name}")
-            response = requests.post(url, headers=self._get_headers(), json=payload)
-            if response.status_code != 200:
-                logger.error(f"Import Failed: {response.text}")
-                response.raise_for_status()
-            
-            operation = response.json()
-            op_name = operation["name"]
-            
-            # 3. Poll operation status
-            while True:
-                time.sleep(1)
-                op_url = f"{self.base_url}/{op_name}?key={self.api_key}"
-                op_resp = requests.get(op_url)
-                op_resp.raise_for_status()
-                op_data = op_resp.json()
-                
-                if op_data.get("done"):
-                    if "error" in op_data:
-                        raise Exception(f"Import failed: {op_data['error']}")
-                    break
-            
-            logger.info("Import complete")
-            return g_file.name
-            
-        except Exception as e:
-            logger.error(f"Upload/Import failed: {e}")
-            raise
+    async def upload_file(self, file_path: str, display_name: str, mime_type: str = "application/pdf") -> str:
+        """Uploads a local file to the Gemini Files API (resumable protocol). Returns the File Resource Name."""
+        size = await asyncio.to_thread(os.path.getsize, file_path)
 
-    def generate_response(self, query: str, store_name: str, custom_prompt: str = None) -> str:
-        # Using gemini-2.5-flash as it is supported and available
-        url = f"{self.base_url}/models/gemini-2.5-flash:generateContent?key={self.api_key}"
-        
-        default_prompt = "Tu es un assistant client utile. Utilise UNIQUEMENT le contexte ci-dessous pour répondre à la question. Si la réponse n'est pas dans le contexte, dis poliment que tu ne sais pas."
-        system_instruction = custom_prompt if custom_prompt else default_prompt
-        
+        start = await self.files.call(lambda: self.client.post(
+            f"{self.upload_url}/files",
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(size),
+                "X-Goog-Upload-Header-Content-Type": mime_type,
+                **self._get_headers(),
+            },
+            json={"file": {"display_name": display_name}},
+        ))
+        if start.status_code != 200:
+            logger.error(f"Upload Start Failed: {start.text}")
+            start.raise_for_status()
+        session_url = start.headers["x-goog-upload-url"]
+
+        # Not retried here: the streamed body can only be sent once (ingestion fails and can be re-uploaded)
+        response = await self.files.call(lambda: self.client.post(
+            session_url,
+            headers={
+                "Content-Length": str(size),
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize",
+            },
+            content=_iter_file(file_path),
+        ), retry=False)
+        if response.status_code != 200:
+            logger.error(f"Upload Failed: {response.text}")
+            response.raise_for_status()
+
+        return response.json()["file"]["name"]
+
+    async def import_file(self, store_name: str, file_name: str) -> str:
+        """Imports an uploaded file into a File Search Store. Returns the long-running operation name."""
+        url = f"{self.base_url}/{store_name}:importFile"
+        payload = {"fileName": file_name}
+
+        logger.info(f"Importing {file_name} into {store_name}")
+        response = await self.files.call(lambda: self.client.post(url, headers=self._get_headers(), json=payload))
+        if response.status_code != 200:
+            logger.error(f"Import Failed: {response.text}")
+            response.raise_for_status()
+
+        return response.json()["name"]
+
+    async def get_operation(self, op_name: str) -> dict:
+        response = await self.files.call(lambda: self.client.get(f"{self.base_url}/{op_name}"))
+        response.raise_for_status()
+        return response.json()
+
+    def _chat_payload(self, text: str, custom_prompt: Optional[str], history: Optional[List[Tuple[str, str]]], summary: Optional[str]) -> dict:
+        """Builds `contents` from earlier (role, text) turns and folds the rolling summary into the system instruction."""
+        instruction = custom_prompt or DEFAULT_PROMPT
+        if summary:
+            instruction = f"{instruction}\n\nRésumé de la conversation précédente : {summary}"
+        contents = [{"role": role, "parts": [{"text": turn}]} for role, turn in history or []]
+        contents.append({"role": "user", "parts": [{"text": text}]})
+        return {
+            "contents": contents,
+            "system_instruction": {
+                "parts": [{"text": instruction}]
+            }
+        }
+
+    async def generate_response(self, query: str, store_name: str, custom_prompt: str = None,
+                                history: List[Tuple[str, str]] = None, summary: str = None,
+                                on_chunk: Optional[ChunkCallback] = None) -> str:
         # Payload for REST API (Snake case is required for v1beta tools)
+        payload = self._chat_payload(query, custom_prompt, history, summary)
+        payload["tools"] = [{
+            "file_search": {
+                "file_search_store_names": [store_name]
+            }
+        }]
+        return await self._generate(payload, on_chunk)
+
+    async def generate_with_context(self, query: str, passages: List[str], custom_prompt: str = None,
+                                    history: List[Tuple[str, str]] = None, summary: str = None,
+                                    on_chunk: Optional[ChunkCallback] = None) -> str:
+        """Generates an answer grounded on passages we retrieved ourselves (no File Search tool)."""
+        context = "\n\n".join(f"[{i + 1}] {p}" for i, p in enumerate(passages))
+        payload = self._chat_payload(f"Contexte :\n{context}\n\nQuestion : {query}", custom_prompt, history, summary)
+        return await self._generate(payload, on_chunk)
+
+    async def summarize_conversation(self, previous_summary: str, turns: List[Tuple[str, str]], max_chars: int) -> Optional[str]:
+        """Folds `turns` into the rolling conversation summary. Returns None if generation failed."""
+        transcript = "\n".join(f"{'Client' if role == 'user' else 'Assistant'} : {text}" for role, text in turns)
         payload = {
             "contents": [{
-                "parts": [{"text": query}]
+                "parts": [{"text": f"Résumé actuel :\n{previous_summary or '(aucun)'}\n\nNouveaux échanges :\n{transcript}"}]
             }],
             "system_instruction": {
-                "parts": [{"text": system_instruction}]
+                "parts": [{"text": (
+                    "Mets à jour le résumé d'une conversation entre un client et un assistant. "
+                    "Garde les faits utiles pour la suite (produits, demandes, informations données). "
+                    f"Réponds uniquement par le résumé, en moins de {max_chars} caractères."
+                )}]
             },
-            "tools": [{
-                "file_search": {
-                    "file_search_store_names": [store_name]
-                }
-            }] 
+            "generationConfig": {"maxOutputTokens": max_chars // 3}
         }
-        
-        response = requests.post(url, headers=self._get_headers(), json=payload)
+        summary = await self._generate(payload)
+        if summary in (GENERATION_ERROR_MESSAGE, NO_ANSWER_MESSAGE):
+            return None
+        return summary.strip()
+
+    async def _generate(self, payload: dict, on_chunk: Optional[ChunkCallback] = None) -> str:
+        """Returns the whole answer; with `on_chunk`, streams it and hands each piece over as it arrives."""
+        if on_chunk is not None:
+            return await self._generate_stream(payload, on_chunk)
+
+        # Using gemini-2.5-flash as it is supported and available
+        url = f"{self.base_url}/models/gemini-2.5-flash:generateContent"
+
+        try:
+            response = await self.generation.call(lambda: self.client.post(url, headers=self._get_headers(), json=payload))
+        except UpstreamUnavailableError as e:
+            logger.error(f"Generation unavailable: {e}")
+            return GENERATION_ERROR_MESSAGE
         if response.status_code != 200:
              logger.error(f"Generation Failed: {response.text}")
-             return "Désolé, une erreur technique est survenue lors de la génération."
+             return GENERATION_ERROR_MESSAGE
 
         data = response.json()
         try:
             return data["candidates"][0]["content"]["parts"][0]["text"]
         except (KeyError, IndexError):
             logger.error(f"Unexpected response format: {data}")
-            return "Je n'ai pas trouvé de réponse pertinente dans les documents."
+            return NO_ANSWER_MESSAGE
+
+    async def _generate_stream(self, payload: dict, on_chunk: ChunkCallback) -> str:
+        url = f"{self.base_url}/models/gemini-2.5-flash:streamGenerateContent"
+
+        async def send() -> httpx.Response:
+            request = self.client.build_request("POST", url, headers=self._get_headers(), json=payload, params={"alt": "sse"})
+            response = await self.client.send(request, stream=True)
+            if response.status_code != 200:
+                # Read (and release the connection) now: error responses may be retried or logged
+                await response.aread()
+            return response
+
+        try:
+            # The concurrency slot is held until the whole answer has been read
+            response, release = await self.generation.open(send)
+        except UpstreamUnavailableError as e:
+            logger.error(f"Generation unavailable: {e}")
+            return GENERATION_ERROR_MESSAGE
+        if response.status_code != 200:
+            await release()
+            logger.error(f"Generation Failed: {response.text}")
+            return GENERATION_ERROR_MESSAGE
 
-    def delete_document(self, file_name: str):
+        parts: List[str] = []
+        truncated = False
+        try:
+            # Server-sent events: one GenerateContentResponse per "data:" line
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                try:
+                    pieces = data["candidates"][0]["content"]["parts"]
+                except (KeyError, IndexError):
+                    continue
+                text = "".join(piece.get("text", "") for piece in pieces)
+                if text:
+                    parts.append(text)
+                    await on_chunk(text)
+        except (httpx.TransportError, ValueError) as e:
+            # Not retried: part of the answer may already be on its way to the user
+            logger.error(f"Generation stream interrupted after {len(parts)} chunks: {type(e).__name__}: {e}")
+            if not parts:
+                return GENERATION_ERROR_MESSAGE
+            truncated = True
+        finally:
+            try:
+                await response.aclose()
+            finally:
+                await release()
+
+        if not parts:
+            logger.error("Generation stream ended without text")
+            return NO_ANSWER_MESSAGE
+        if truncated:
+            self.truncated_streams += 1
+            return TruncatedAnswer("".join(parts))
+        return "".join(parts)
+
+    async def embed_text(self, text: str, task_type: str = None) -> List[float]:
+        """Returns the embedding vector for a single text."""
+        url = f"{self.base_url}/models/{settings.gemini_embedding_model}:embedContent"
+        payload = {
+            "model": f"models/{settings.gemini_embedding_model}",
+            "content": {"parts": [{"text": text}]}
+        }
+        if task_type:
+            payload["taskType"] = task_type
+
+        response = await self.embedding.call(lambda: self.client.post(url, headers=self._get_headers(), json=payload))
+        if response.status_code != 200:
+            logger.error(f"Embedding Failed: {response.text}")
+            response.raise_for_status()
+
+        return response.json()["embedding"]["values"]
+
+    async def embed_texts(self, texts: List[str], task_type: str = None) -> List[List[float]]:
+        """Embeds many texts in one batchEmbedContents call (at most 100 per call)."""
+        model = f"models/{settings.gemini_embedding_model}"
+        url = f"{self.base_url}/{model}:batchEmbedContents"
+        requests = []
+        for text in texts:
+            request = {"model": model, "content": {"parts": [{"text": text}]}}
+            if task_type:
+                request["taskType"] = task_type
+            requests.append(request)
+
+        response = await self.embedding.call(lambda: self.client.post(url, headers=self._get_headers(), json={"requests": requests}))
+        if response.status_code != 200:
+            logger.error(f"Batch Embedding Failed: {response.text}")
+            response.raise_for_status()
+
+        return [e["values"] for e in response.json()["embeddings"]]
+
+    async def delete_document(self, file_name: str):
         # file_name should be 'files/xyz'
         try:
-            genai.delete_file(file_name)
+            response = await self.files.call(lambda: self.client.delete(f"{self.base_url}/{file_name}"))
+            response.raise_for_status()
             logger.info(f"Deleted file {file_name}")
         except Exception as e:
             logger.error(f"Error deleting file: {e}")
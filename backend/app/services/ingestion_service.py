@@ -0,0 +1,302 @@
+import asyncio
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+from app.config import get_settings
+from app.database import get_supabase
+from app.repositories.documents import document_repository
+from app.repositories.profiles import profile_repository
+from app.services.gemini_service import gemini_service
+from app.services.pdf_service import Chunk, iter_chunks, iter_pages
+from app.services.invalidation import invalidation_bus, ANSWERS, FAQ, TENANT, VECTORS
+from app.services.metrics import metrics
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class OperationTimeoutError(Exception):
+    pass
+
+
+async def _run_together(*steps):
+    """Like asyncio.gather, but the first failure cancels the other steps before it is raised."""
+    tasks = [asyncio.ensure_future(step) for step in steps]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+@dataclass
+class _PendingOperation:
+    name: str
+    deadline: float
+    delay: float
+    next_check: float
+    future: asyncio.Future = field(repr=False)
+
+
+class OperationPoller:
+    """
+    Polls every pending Gemini long-running operation from a single scheduler task.
+
+    Each operation is checked with its own exponential backoff (initial_delay doubling up
+    to max_delay) and fails with OperationTimeoutError once its deadline has passed.
+    """
+
+    def __init__(self, initial_delay: float, max_delay: float, timeout: float):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._pending: Dict[str, _PendingOperation] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def wait(self, op_name: str) -> dict:
+        """Waits until the operation is done and returns its final state."""
+        now = time.monotonic()
+        op = _PendingOperation(
+            name=op_name,
+            deadline=now + self.timeout,
+            delay=self.initial_delay,
+            next_check=now + self.initial_delay,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._pending[op_name] = op
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        try:
+            return await op.future
+        finally:
+            self._pending.pop(op_name, None)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while self._pending:
+            now = time.monotonic()
+            due = [op for op in self._pending.values() if op.next_check <= now and not op.future.done()]
+            if due:
+                await asyncio.gather(*(self._check(op) for op in due))
+
+            pending = [op.next_check for op in self._pending.values() if not op.future.done()]
+            if not pending:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, min(pending) - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, op: _PendingOperation):
+        try:
+            data = await gemini_service.get_operation(op.name)
+        except Exception as e:
+            # Transient polling errors only delay the next check; the deadline still applies.
+            logger.warning(f"Polling {op.name} failed: {e}")
+            data = {}
+
+        now = time.monotonic()
+        if data.get("done"):
+            op.future.set_result(data)
+        elif now >= op.deadline:
+            op.future.set_exception(OperationTimeoutError(f"Operation {op.name} did not finish in {self.timeout:.0f}s"))
+        else:
+            op.delay = min(op.delay * 2, self.max_delay)
+            op.next_check = min(now + op.delay, op.deadline)
+
+
+class IngestionService:
+    """
+    Runs document ingestion in the background.
+
+    The upload request only inserts a `pending` row; this pipeline moves it through
+    `processing` to `processed` or `failed` (with `error_message`). Storage archiving
+    and the Gemini upload run concurrently.
+    """
+
+    def __init__(self, concurrency: int, poller: OperationPoller):
+        self.poller = poller
+        self._slots = asyncio.Semaphore(concurrency)
+        self._store_locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, document_id: int, owner_id: str, local_path: str, storage_path: str, filename: str,
+               page_count: Optional[int] = None):
+        task = asyncio.create_task(self._ingest(document_id, owner_id, local_path, storage_path, filename, page_count))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.poller.stop()
+
+    async def _ingest(self, document_id: int, owner_id: str, local_path: str, storage_path: str, filename: str,
+                      page_count: Optional[int]):
+        with metrics.request("ingestion.document"):
+            metrics.set_tenant(owner_id)
+            await self._run_ingestion(document_id, owner_id, local_path, storage_path, filename, page_count)
+
+    async def _run_ingestion(self, document_id: int, owner_id: str, local_path: str, storage_path: str, filename: str,
+                             page_count: Optional[int]):
+        try:
+            with metrics.timer("ingestion.wait"):
+                await self._slots.acquire()
+            try:
+                await self._set_status(document_id, "processing")
+
+                if settings.retriever_backend == "local":
+                    # Archive in Supabase Storage while the sections are extracted and embedded
+                    await _run_together(
+                        self._timed_archive(storage_path, local_path),
+                        self._index_sections(document_id, local_path, page_count),
+                    )
+                    await self._set_status(document_id, "processed")
+                    await invalidation_bus.invalidate(owner_id, VECTORS, ANSWERS, FAQ)
+                    logger.info(f"Document {document_id} indexed locally")
+                    return
+
+                store_id = await self._ensure_store(owner_id)
+
+                # Archive in Supabase Storage and extract the sections (for the FAQ fast path)
+                # while the file goes to Gemini
+                display_name = f"{owner_id}_{filename}"
+                upload = asyncio.create_task(gemini_service.upload_file(local_path, display_name))
+                try:
+                    await _run_together(
+                        self._timed_archive(storage_path, local_path),
+                        self._index_sections(document_id, local_path, page_count, embed=False),
+                        upload,
+                    )
+                    gemini_file_name = upload.result()
+
+                    with metrics.timer("ingestion.gemini_import"):
+                        op_name = await gemini_service.import_file(store_id, gemini_file_name)
+                        operation = await self.poller.wait(op_name)
+                    if "error" in operation:
+                        raise Exception(f"Import failed: {operation['error']}")
+
+                    updated = await self._set_status(document_id, "processed", gemini_file_name=gemini_file_name)
+                except BaseException:
+                    # No document row points at the uploaded file yet: nothing else would delete it
+                    if upload.done() and not upload.cancelled() and upload.exception() is None:
+                        await gemini_service.delete_document(upload.result())
+                    raise
+                if not updated:
+                    # Document was deleted while it was being ingested
+                    await gemini_service.delete_document(gemini_file_name)
+                    return
+                await invalidation_bus.invalidate(owner_id, ANSWERS, FAQ)
+                logger.info(f"Document {document_id} ingested as {gemini_file_name}")
+            finally:
+                self._slots.release()
+        except asyncio.CancelledError:
+            await self._set_status(document_id, "failed", error_message="Ingestion interrupted by shutdown")
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion of document {document_id} failed: {e}")
+            await self._set_status(document_id, "failed", error_message=str(e)[:1000])
+        finally:
+            await asyncio.to_thread(os.unlink, local_path)
+
+    async def _ensure_store(self, owner_id: str) -> str:
+        # One lock per owner so concurrent uploads don't each create a store
+        lock = self._store_locks.setdefault(owner_id, asyncio.Lock())
+        async with lock:
+            profile = await profile_repository.get(owner_id, "company_name, gemini_file_store_id") or {}
+            store_id = profile.get("gemini_file_store_id")
+            if store_id:
+                return store_id
+
+            company_name = profile.get("company_name") or "User"
+            store_id = await gemini_service.create_file_store(owner_id, company_name)
+            await profile_repository.update(owner_id, {"gemini_file_store_id": store_id})
+            await invalidation_bus.invalidate(owner_id, TENANT)
+            return store_id
+
+    async def _timed_archive(self, storage_path: str, local_path: str):
+        with metrics.timer("ingestion.archive"):
+            await asyncio.to_thread(self._archive, storage_path, local_path)
+
+    async def _index_sections(self, document_id: int, local_path: str, page_count: Optional[int], embed: bool = True):
+        """
+        Extracts and chunks the document into document_sections. Chunks are embedded for the
+        local retriever; with `embed=False` only the text is stored (FAQ fast path).
+        """
+        with metrics.timer("ingestion.index_sections"):
+            await self._store_sections(document_id, local_path, page_count, embed)
+
+    async def _store_sections(self, document_id: int, local_path: str, page_count: Optional[int], embed: bool):
+        # Start from a clean slate when a failed document is ingested again
+        await document_repository.delete_sections(document_id)
+
+        async def insert_batch(batch: List[Chunk]):
+            if embed:
+                embeddings = await gemini_service.embed_texts([c.text for c in batch], task_type="RETRIEVAL_DOCUMENT")
+            else:
+                embeddings = [None] * len(batch)
+            rows = [
+                {
+                    "document_id": document_id,
+                    "chunk_index": chunk.index,
+                    "content": chunk.text,
+                    "start_offset": chunk.start,
+                    "end_offset": chunk.end,
+                    "embedding": embedding
+                }
+                for chunk, embedding in zip(batch, embeddings)
+            ]
+            await document_repository.insert_sections(rows)
+
+        # Pages are extracted in parallel ahead of us while each batch is embedded and stored
+        batch: List[Chunk] = []
+        try:
+            async for chunk in iter_chunks(iter_pages(local_path, page_count)):
+                batch.append(chunk)
+                if len(batch) == settings.embedding_batch_size:
+                    await insert_batch(batch)
+                    batch = []
+            if batch:
+                await insert_batch(batch)
+        except BaseException:
+            await document_repository.delete_sections(document_id)
+            raise
+
+    def _archive(self, storage_path: str, local_path: str):
+        get_supabase().storage.from_("documents").upload(
+            storage_path, local_path, {"content-type": "application/pdf"}
+        )
+
+    async def _set_status(self, document_id: int, status: str, **fields) -> bool:
+        try:
+            return await document_repository.update(document_id, {"status": status, **fields})
+        except Exception as e:
+            logger.error(f"Could not set document {document_id} to {status}: {e}")
+            return False
+
+
+ingestion_service = IngestionService(
+    concurrency=settings.ingestion_concurrency,
+    poller=OperationPoller(
+        initial_delay=settings.ingestion_poll_initial_seconds,
+        max_delay=settings.ingestion_poll_max_seconds,
+        timeout=settings.ingestion_timeout_seconds,
+    ),
+)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import uuid
+import logging
+from typing import Callable, Dict, Optional
+from app.config import get_settings
+from app.services.tenant_cache import tenant_cache
+from app.services.answer_cache import answer_cache
+from app.services.faq_index import faq_index
+from app.services.vector_store import vector_index
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# What changed for a tenant, and so which per-process cache has to drop it
+TENANT = "tenant"  # Profile or plan: tenant_cache
+ANSWERS = "answers"  # Documents: answer_cache
+FAQ = "faq"  # Q&A pairs or documents: faq_index
+VECTORS = "vectors"  # Document sections: vector_index (local retriever)
+
+_HANDLERS: Dict[str, Callable[[str], None]] = {
+    TENANT: tenant_cache.invalidate_owner,
+    ANSWERS: answer_cache.invalidate_owner,
+    FAQ: faq_index.invalidate,
+    VECTORS: vector_index.invalidate,
+}
+
+
+class InvalidationBus:
+    """
+    Drops a tenant's cached state in this process and, with the Redis queue, in every
+    other web and worker process through a Redis pub/sub channel.
+
+    Delivery is best effort: a process that is restarting or reconnecting misses the
+    message and serves its entry until the cache TTL expires, as before.
+    """
+
+    def __init__(self, redis_url: Optional[str], channel: str):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def invalidate(self, owner_id: str, *kinds: str):
+        _apply(owner_id, kinds)
+        if self.redis_url is None:
+            return
+        message = json.dumps({"origin": self.origin, "owner_id": owner_id, "kinds": list(kinds)})
+        try:
+            await self._client().publish(self.channel, message)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Could not publish invalidation of {owner_id}: {e}")
+
+    def start(self):
+        if self.redis_url is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> dict:
+        return {"published": self.published, "received": self.received, "errors": self.errors}
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self._client().pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            self._receive(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Invalidation channel lost, reconnecting: {e}")
+                await asyncio.sleep(1.0)
+
+    def _receive(self, data: str):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        self.received += 1
+        _apply(message["owner_id"], message.get("kinds", ()))
+
+
+def _apply(owner_id: str, kinds):
+    for kind in kinds:
+        handler = _HANDLERS.get(kind)
+        if handler is not None:
+            handler(owner_id)
+
+
+invalidation_bus = InvalidationBus(
+    redis_url=settings.redis_url if settings.queue_backend == "redis" else None,
+    channel=settings.invalidation_channel,
+)
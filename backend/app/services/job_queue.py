@@ -0,0 +1,382 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+import uuid
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CLAIM_INTERVAL_SECONDS = 15.0
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Dict[str, Any]
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    receipt: Optional[str] = None  # Backend handle used to ack (e.g. Redis stream entry id)
+
+    def dumps(self) -> str:
+        return json.dumps({
+            "id": self.id,
+            "payload": self.payload,
+            "attempts": self.attempts,
+            "enqueued_at": self.enqueued_at,
+        })
+
+    @classmethod
+    def loads(cls, raw: str, receipt: Optional[str] = None) -> "Job":
+        data = json.loads(raw)
+        return cls(
+            id=data["id"],
+            payload=data["payload"],
+            attempts=data.get("attempts", 0),
+            enqueued_at=data.get("enqueued_at", time.time()),
+            receipt=receipt,
+        )
+
+
+class JobQueue(ABC):
+    """At-least-once job queue: a job stays owned by its consumer until acked."""
+
+    @abstractmethod
+    async def enqueue(self, payload: Dict[str, Any]) -> str: ...
+
+    @abstractmethod
+    async def dequeue(self, consumer: str, timeout: float) -> Optional[Job]: ...
+
+    @abstractmethod
+    async def ack(self, job: Job): ...
+
+    @abstractmethod
+    async def requeue(self, job: Job):
+        """Puts a new attempt of the job back on the queue and acks the current one; QueueFullError if it can't."""
+
+    @abstractmethod
+    async def dead_letter(self, job: Job, error: str): ...
+
+    @abstractmethod
+    async def dead_letters(self, limit: int = 100) -> List[dict]: ...
+
+    async def depth(self) -> int:
+        return 0
+
+    async def close(self):
+        pass
+
+
+class InMemoryQueue(JobQueue):
+    """Process-local stand-in for tests and single-process deployments. Not durable."""
+
+    def __init__(self, max_pending: int = 0):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._dead: List[dict] = []
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        job = Job(id=str(uuid.uuid4()), payload=payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Job queue is full")
+        return job.id
+
+    async def dequeue(self, consumer: str, timeout: float) -> Optional[Job]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, job: Job):
+        self._queue.task_done()
+
+    async def requeue(self, job: Job):
+        try:
+            self._queue.put_nowait(replace(job, attempts=job.attempts + 1))
+        except asyncio.QueueFull:
+            raise QueueFullError("Job queue is full")
+        self._queue.task_done()
+
+    async def dead_letter(self, job: Job, error: str):
+        self._dead.append({"job": json.loads(job.dumps()), "error": error, "failed_at": time.time()})
+        self._queue.task_done()
+
+    async def dead_letters(self, limit: int = 100) -> List[dict]:
+        return self._dead[-limit:]
+
+    async def depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisStreamQueue(JobQueue):
+    """
+    Durable queue on a Redis stream with a consumer group.
+
+    Entries stay in the group's pending list until acked, so jobs of a crashed worker
+    are reclaimed by another one after `visibility_timeout`, `claim_batch_size` at a
+    time. Each delivery that was never acked counts as a failed attempt, so a job that
+    keeps killing its worker still reaches the `<stream>:dead` list.
+    """
+
+    def __init__(self, redis_url: str, stream: str, group: str, max_pending: int = 0,
+                 visibility_timeout: float = 300.0, claim_batch_size: int = 50):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(redis_url, decode_responses=True)
+        self.stream = stream
+        self.group = group
+        self.dead_key = f"{stream}:dead"
+        self.max_pending = max_pending
+        self.visibility_timeout_ms = int(visibility_timeout * 1000)
+        self.claim_batch_size = claim_batch_size
+        self._group_ready = False
+        self._last_claim = 0.0
+        self._claim_cursor = "0-0"
+        self._claimed: "deque[Job]" = deque()
+
+    async def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            await self._redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def enqueue(self, payload: Dict[str, Any]) -> str:
+        if self.max_pending and await self._redis.xlen(self.stream) >= self.max_pending:
+            raise QueueFullError("Job queue is full")
+        job = Job(id=str(uuid.uuid4()), payload=payload)
+        await self._redis.xadd(self.stream, {"job": job.dumps()})
+        return job.id
+
+    async def dequeue(self, consumer: str, timeout: float) -> Optional[Job]:
+        await self._ensure_group()
+
+        # Take over jobs left pending by a dead consumer before reading new ones.
+        if not self._claimed:
+            await self._claim(consumer)
+        if self._claimed:
+            return self._claimed.popleft()
+
+        response = await self._redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=1, block=int(timeout * 1000)
+        )
+        entries = response[0][1] if response else []
+        for entry_id, fields in entries:
+            if fields and "job" in fields:
+                return Job.loads(fields["job"], receipt=entry_id)
+            # Entry was deleted while pending: drop it from the group.
+            await self._redis.xack(self.stream, self.group, entry_id)
+        return None
+
+    async def _claim(self, consumer: str):
+        # A full batch may have left more behind: carry on from its cursor without waiting
+        now = time.monotonic()
+        if self._claim_cursor == "0-0" and now - self._last_claim < CLAIM_INTERVAL_SECONDS:
+            return
+        self._last_claim = now
+        claimed = await self._redis.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=self.visibility_timeout_ms,
+            start_id=self._claim_cursor, count=self.claim_batch_size,
+        )
+        if not claimed:
+            self._claim_cursor = "0-0"
+            return
+        self._claim_cursor = claimed[0]
+
+        jobs = []
+        for entry_id, fields in claimed[1]:
+            if fields and "job" in fields:
+                jobs.append(Job.loads(fields["job"], receipt=entry_id))
+            else:
+                await self._redis.xack(self.stream, self.group, entry_id)
+        if not jobs:
+            return
+
+        # The claim is one more delivery; every earlier one ended without ack or requeue
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for job in jobs:
+                pipe.xpending_range(self.stream, self.group, min=job.receipt, max=job.receipt, count=1)
+            pending = await pipe.execute()
+        for job, entries in zip(jobs, pending):
+            if entries:
+                job.attempts += entries[0]["times_delivered"] - 1
+        self._claimed.extend(jobs)
+
+    async def ack(self, job: Job):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, job.receipt)
+            pipe.xdel(self.stream, job.receipt)
+            await pipe.execute()
+
+    async def requeue(self, job: Job):
+        retry = replace(job, attempts=job.attempts + 1, receipt=None)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.stream, {"job": retry.dumps()})
+            pipe.xack(self.stream, self.group, job.receipt)
+            pipe.xdel(self.stream, job.receipt)
+            await pipe.execute()
+
+    async def dead_letter(self, job: Job, error: str):
+        record = json.dumps({"job": json.loads(job.dumps()), "error": error, "failed_at": time.time()})
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.dead_key, record)
+            pipe.xack(self.stream, self.group, job.receipt)
+            pipe.xdel(self.stream, job.receipt)
+            await pipe.execute()
+
+    async def dead_letters(self, limit: int = 100) -> List[dict]:
+        return [json.loads(r) for r in await self._redis.lrange(self.dead_key, 0, limit - 1)]
+
+    async def depth(self) -> int:
+        return await self._redis.xlen(self.stream)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class WorkerPool:
+    """
+    Takes jobs off the queue and runs them with retries and a dead-letter list.
+
+    `fetchers` consumers read the queue and start each job as its own task, holding at
+    most `concurrency` jobs at once; how many actually run at the same time is up to
+    the handler (admission control), so a slow tenant never blocks the consumers.
+    A retried job keeps its id, which the handler can use to skip work already done.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Job], Awaitable[Any]],
+                 concurrency: int, max_attempts: int, retry_base_seconds: float, fetchers: int = 2):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.fetchers = fetchers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: set = set()
+        self._retries: set = set()
+        self._stopping = asyncio.Event()
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._consume(f"{self.consumer_prefix}-{i}"))
+            for i in range(self.fetchers)
+        ]
+        logger.info(f"Started {self.fetchers} job consumers holding up to {self.concurrency} jobs")
+
+    async def stop(self, timeout: float = 30.0):
+        """Stops taking new jobs and waits for the in-flight ones to finish."""
+        self._stopping.set()
+        tasks = self._tasks + list(self._jobs) + list(self._retries)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+
+    async def _consume(self, consumer: str):
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            try:
+                job = await self.queue.dequeue(consumer, timeout=1.0)
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"Dequeue failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if job is None:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run(job))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+
+    async def _run(self, job: Job):
+        self.in_flight += 1
+        try:
+            if job.attempts >= self.max_attempts:
+                # Reclaimed after its workers died running it, as many times as it may be tried
+                self.failed += 1
+                logger.error(f"Job {job.id} moved to dead-letter list: its worker stopped on each of {job.attempts} attempts")
+                await self.queue.dead_letter(job, "Worker stopped while running the job")
+                return
+            await self.handler(job)
+            await self.queue.ack(job)
+            self.processed += 1
+        except Exception as e:
+            await self._handle_failure(job, e)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def _handle_failure(self, job: Job, error: Exception):
+        if job.attempts + 1 >= self.max_attempts:
+            self.failed += 1
+            logger.error(f"Job {job.id} moved to dead-letter list after {job.attempts + 1} attempts: {error}")
+            await self.queue.dead_letter(job, str(error))
+            return
+
+        delay = self.retry_base_seconds * (2 ** job.attempts) * random.uniform(0.5, 1.5)
+        logger.warning(f"Job {job.id} failed (attempt {job.attempts + 1}), retrying in {delay:.1f}s: {error}")
+        task = asyncio.create_task(self._requeue_later(job, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue_later(self, job: Job, delay: float):
+        # The job stays un-acked while waiting, so a crash here still leaves it reclaimable.
+        await asyncio.sleep(delay)
+        try:
+            await self.queue.requeue(job)
+        except QueueFullError as e:
+            # No room for the retry: counts as another failed attempt
+            await self._handle_failure(replace(job, attempts=job.attempts + 1), e)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "dead_lettered": self.failed,
+            "retries_scheduled": len(self._retries),
+        }
+
+
+def create_job_queue() -> JobQueue:
+    if settings.queue_backend == "redis":
+        return RedisStreamQueue(
+            settings.redis_url,
+            stream=settings.queue_stream,
+            group=settings.queue_consumer_group,
+            max_pending=settings.queue_max_pending,
+            visibility_timeout=settings.queue_visibility_timeout_seconds,
+            claim_batch_size=settings.queue_claim_batch_size,
+        )
+    if settings.queue_backend == "memory":
+        return InMemoryQueue(max_pending=settings.queue_max_pending)
+    raise ValueError(f"Unknown queue backend: {settings.queue_backend}")
+
+
+job_queue = create_job_queue()
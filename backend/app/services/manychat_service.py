@@ -1,40 +1,341 @@
+import asyncio
+import random
+import re
+import time
+import logging
 import httpx
-from typing import Optional, Dict, Any
-
-
-async def send_to_manychat(user_id: str, text: str, token: str, buttons: Optional[list] = None) -> Dict[str, Any]:
-    url = "https://api.manychat.com/fb/subscriber/sendContent"
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    content = {
-        "type": "text",
-        "text": text
-    }
-    
-    if buttons:
-        content["buttons"] = buttons
-    
-    body = {
-        "subscriber_id": user_id,
-        "data": {
-            "version": "v2",
-            "content": content
-        },
-        "message_tag": "ACCOUNT_UPDATE"
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=body, headers=headers, timeout=10.0)
-        return response.json()
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
+from app.config import get_settings
+from app.services.metrics import metrics
 
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
-async def validate_manychat_api_key(api_key: str) -> bool:
-    url = "https://api.manychat.com/fb/page/getInfo"
-    headers = {"Authorization": f"Bearer {api_key}"}
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, timeout=10.0)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def split_message(text: str, max_chars: int) -> List[str]:
+    """Splits text into parts of at most max_chars, preferring paragraph, then sentence, then word boundaries."""
+    parts: List[str] = []
+    remaining = text.strip()
+    while len(remaining) > max_chars:
+        window = remaining[:max_chars + 1]
+        # Only accept a boundary in the second half of the window, so parts stay reasonably full
+        cut = window.rfind("\n\n")
+        if cut < max_chars // 2:
+            ends = [m.start() for m in _SENTENCE_END.finditer(window)]
+            cut = ends[-1] if ends else -1
+        if cut < max_chars // 2:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = max_chars
+        parts.append(remaining[:cut].rstrip())
+        remaining = remaining[cut:].lstrip()
+    if remaining:
+        parts.append(remaining)
+    return parts
+
+
+class _TenantDelivery:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.latency_ms_avg = 0.0
+        self.last_error: Optional[str] = None
+        # Answer start to first message delivered, for streamed and complete answers
+        self.first_message_ms: Dict[str, float] = {}
+        self.replies: Dict[str, int] = {}
+
+
+class Outbox:
+    """Sends for one subscriber, in the order their messages arrived."""
+
+    def __init__(self, service: "ManyChatService", owner_id: str, subscriber_id: str, token: str,
+                 previous: Optional[asyncio.Future]):
+        self.service = service
+        self.owner_id = owner_id
+        self.subscriber_id = subscriber_id
+        self.token = token
+        self._previous = previous
+
+    async def send(self, text: str, buttons: Optional[list] = None) -> bool:
+        if self._previous is not None:
+            # Wait for the reply to the subscriber's previous message, within reason
+            try:
+                await asyncio.wait_for(asyncio.shield(self._previous), self.service.order_wait)
+            except asyncio.TimeoutError:
+                logger.warning(f"Reply to {self.subscriber_id} sent before the previous one ({self.service.order_wait:.0f}s wait)")
+            self._previous = None
+        return await self.service.send(self.owner_id, self.subscriber_id, text, self.token, buttons)
+
+
+def _last_boundary(text: str) -> int:
+    """End of the last complete paragraph or sentence in text, or 0."""
+    cut = text.rfind("\n\n")
+    ends = [m.start() for m in _SENTENCE_END.finditer(text)]
+    return max(cut, ends[-1] if ends else 0, 0)
+
+
+class StreamingReply:
+    """
+    Sends an answer through an outbox while it is being generated: complete sentences
+    go out once `min_chars` are buffered or `max_delay` seconds passed since the
+    previous one. An answer that was not streamed is sent whole by `finish`.
+
+    `feed` never waits for the outbox (which may hold a reply back behind the
+    subscriber's previous one): parts are queued and sent by a background task, so the
+    generation stream and its concurrency slot are released as soon as it is read.
+    """
+
+    def __init__(self, outbox: Outbox, min_chars: int, max_delay: float):
+        self.outbox = outbox
+        self.min_chars = min_chars
+        self.max_delay = max_delay
+        self.buffer = ""
+        self.streamed_text = ""  # Everything fed, sent or still buffered
+        self.streamed = False
+        self.messages = 0
+        self.started = time.monotonic()
+        self._last_cut = self.started
+        self._queued: List[str] = []
+        self._sender: Optional[asyncio.Task] = None
+
+    async def feed(self, text: str):
+        self.streamed = True
+        self.streamed_text += text
+        self.buffer += text
+        if len(self.buffer) < self.min_chars and time.monotonic() - self._last_cut < self.max_delay:
+            return
+        cut = _last_boundary(self.buffer)
+        if cut == 0 and len(self.buffer) >= self.outbox.service.max_chars:
+            # No sentence end in a whole message worth of text: send what fits
+            cut = len(split_message(self.buffer, self.outbox.service.max_chars)[0])
+        if cut > 0:
+            part, self.buffer = self.buffer[:cut], self.buffer[cut:].lstrip()
+            self._last_cut = time.monotonic()
+            self._queue(part)
+
+    async def finish(self, text: str) -> str:
+        """
+        Sends what is left of the answer and returns the reply as the subscriber got it.
+
+        `text` is the final answer. When it is not the streamed text (generation failed
+        after part of the answer went out), it follows what was already streamed.
+        """
+        if not self.streamed_text.strip():
+            # Nothing went out (not streamed, or failed before any text): the final text is the reply
+            self._queue(text)
+            delivered = text
+        else:
+            self._queue(self.buffer)
+            delivered = self.streamed_text
+            if text.strip() != self.streamed_text.strip():
+                self._queue(text)
+                delivered = f"{self.streamed_text.rstrip()}\n\n{text}"
+        self.buffer = ""
+        if self._sender is not None:
+            await self._sender
+        return delivered
+
+    def _queue(self, text: str):
+        if not text.strip():
+            return
+        self._queued.append(text)
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_queued())
+
+    async def _send_queued(self):
+        while self._queued:
+            await self._send(self._queued.pop(0))
+
+    async def _send(self, text: str):
+        delivered = await self.outbox.send(text)
+        if delivered and not self.messages:
+            self.outbox.service.record_first_message(
+                self.outbox.owner_id, (time.monotonic() - self.started) * 1000, self.streamed
+            )
+        self.messages += 1
+
+
+class ManyChatService:
+    """
+    ManyChat delivery over one pooled keep-alive client.
+
+    429/5xx and transport errors are retried with jittered exponential backoff, or after
+    the delay given by Retry-After / X-RateLimit-Reset. Long answers are split into
+    several messages. `outbox` keeps replies to one subscriber in the order their
+    messages were received (per process). Delivery latency and failures are counted
+    per tenant.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.max_attempts = settings.manychat_max_attempts
+        self.retry_base = settings.manychat_retry_base_seconds
+        self.retry_max = settings.manychat_retry_max_seconds
+        self.max_chars = settings.manychat_max_message_chars
+        self.order_wait = settings.manychat_order_wait_seconds
+        self._tails: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._tenants: Dict[str, _TenantDelivery] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=settings.manychat_api_base_url,
+                limits=httpx.Limits(
+                    max_connections=settings.manychat_max_connections,
+                    max_keepalive_connections=settings.manychat_max_connections,
+                ),
+                timeout=httpx.Timeout(settings.manychat_timeout_seconds),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    @asynccontextmanager
+    async def outbox(self, owner_id: str, subscriber_id: str, token: str) -> AsyncIterator[Outbox]:
+        """Reserves the subscriber's next reply slot; released on exit, sent or not."""
+        key = (owner_id, subscriber_id)
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            yield Outbox(self, owner_id, subscriber_id, token, previous)
+        finally:
+            def release(_=None):
+                done.set_result(None)
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+            # A slot is released only after the one before it: a reply that exits
+            # without sending must not let a later one overtake an earlier one
+            if previous is None or previous.done():
+                release()
+            else:
+                previous.add_done_callback(release)
+
+    async def send(self, owner_id: str, subscriber_id: str, text: str, token: str,
+                   buttons: Optional[list] = None) -> bool:
+        """Sends text (split if too long; buttons go with the last part). Returns False on failure."""
+        parts = split_message(text, self.max_chars)
+        for i, part in enumerate(parts):
+            content: Dict[str, Any] = {"type": "text", "text": part}
+            if buttons and i == len(parts) - 1:
+                content["buttons"] = buttons
+            body = {
+                "subscriber_id": subscriber_id,
+                "data": {
+                    "version": "v2",
+                    "content": content
+                },
+                "message_tag": "ACCOUNT_UPDATE"
+            }
+            if not await self._deliver(owner_id, body, token):
+                return False
+        return True
+
+    async def validate_api_key(self, api_key: str) -> bool:
+        try:
+            response = await self.client.get("/fb/page/getInfo", headers={"Authorization": f"Bearer {api_key}"})
             return response.status_code == 200
-    except Exception:
+        except Exception:
+            return False
+
+    async def _deliver(self, owner_id: str, body: dict, token: str) -> bool:
+        stats = self._tenants.setdefault(owner_id, _TenantDelivery())
+        started = time.monotonic()
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            response = None
+            attempt_started = time.monotonic()
+            try:
+                response = await self.client.post(
+                    "/fb/subscriber/sendContent", json=body, headers={"Authorization": f"Bearer {token}"}
+                )
+                metrics.observe("manychat.send", time.monotonic() - attempt_started,
+                                f"HTTP {response.status_code}" if response.status_code != 200 else None)
+                if response.status_code == 200 and response.json().get("status") != "error":
+                    latency_ms = (time.monotonic() - started) * 1000
+                    stats.latency_ms_avg = latency_ms if not stats.sent else 0.9 * stats.latency_ms_avg + 0.1 * latency_ms
+                    stats.sent += 1
+                    return True
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUS:
+                    break
+            except (httpx.TimeoutException, httpx.TransportError, ValueError) as e:
+                if response is None:
+                    metrics.observe("manychat.send", time.monotonic() - attempt_started, type(e).__name__)
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < self.max_attempts:
+                stats.retries += 1
+                await asyncio.sleep(self._backoff(attempt, response))
+
+        stats.failed += 1
+        stats.last_error = error
+        logger.error(f"ManyChat delivery failed for {owner_id}/{body['subscriber_id']}: {error}")
         return False
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            for header in ("retry-after", "x-ratelimit-reset"):
+                value = response.headers.get(header)
+                if value:
+                    try:
+                        delay = float(value)
+                    except ValueError:
+                        continue
+                    # X-RateLimit-Reset may be an epoch timestamp rather than a delay
+                    if delay > 1e9:
+                        delay -= time.time()
+                    return min(self.retry_max, max(0.0, delay))
+        return random.uniform(0, min(self.retry_max, self.retry_base * (2 ** (attempt - 1))))
+
+    def record_first_message(self, owner_id: str, elapsed_ms: float, streamed: bool):
+        stats = self._tenants.setdefault(owner_id, _TenantDelivery())
+        mode = "streamed" if streamed else "complete"
+        count = stats.replies.get(mode, 0)
+        previous = stats.first_message_ms.get(mode, elapsed_ms)
+        stats.first_message_ms[mode] = elapsed_ms if not count else 0.9 * previous + 0.1 * elapsed_ms
+        stats.replies[mode] = count + 1
+        logger.info(f"First message to {owner_id} after {elapsed_ms:.0f}ms ({mode})")
+
+    def tenant_stats(self, owner_id: str) -> Optional[dict]:
+        stats = self._tenants.get(owner_id)
+        if stats is None:
+            return None
+        return {
+            "sent": stats.sent,
+            "failed": stats.failed,
+            "retries": stats.retries,
+            "latency_ms_avg": round(stats.latency_ms_avg, 1),
+            "last_error": stats.last_error,
+            "time_to_first_message_ms": {mode: round(ms, 1) for mode, ms in stats.first_message_ms.items()},
+        }
+
+    def stats(self) -> dict:
+        return {
+            "sent": sum(s.sent for s in self._tenants.values()),
+            "failed": sum(s.failed for s in self._tenants.values()),
+            "retries": sum(s.retries for s in self._tenants.values()),
+            "ordered_subscribers": len(self._tails),
+        }
+
+
+manychat_service = ManyChatService()
+
+
+async def send_to_manychat(user_id: str, text: str, token: str, buttons: Optional[list] = None,
+                           owner_id: str = "unknown") -> bool:
+    return await manychat_service.send(owner_id, user_id, text, token, buttons)
+
+
+async def validate_manychat_api_key(api_key: str) -> bool:
+    return await manychat_service.validate_api_key(api_key)
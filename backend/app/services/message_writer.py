@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from app.config import get_settings
+from app.repositories.messages import message_repository
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Write-behind buffer for the messages table.
+
+    Rows are flushed with one bulk insert when `max_batch` rows are buffered or every
+    `flush_interval` seconds. At most `max_buffer` rows may be waiting (including the
+    batch being inserted): writers wait for room beyond that. A failed batch is retried
+    up to `max_attempts` times before being dropped and logged.
+    """
+
+    def __init__(self, max_batch: int, flush_interval: float, max_buffer: int, max_attempts: int = 3):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._buffer: List[Dict[str, Any]] = []
+        self._room = asyncio.Semaphore(max_buffer)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.round_trips = 0
+
+    async def write(self, row: Dict[str, Any]):
+        # Timestamp at enqueue time so a batch keeps the real order of the conversation.
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        await self._room.acquire()
+        self._buffer.append(row)
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    def pending(self, job_id: str, direction: str) -> bool:
+        """Whether a row of this job is buffered, not yet in the table."""
+        return any(row.get("job_id") == job_id and row["direction"] == direction for row in self._buffer)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the background flusher and writes everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._buffer:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                await self.flush()
+                if len(self._buffer) < self.max_batch:
+                    break
+
+    async def flush(self):
+        async with self._flush_lock:
+            batch = self._buffer[:self.max_batch]
+            if not batch:
+                return
+            del self._buffer[:len(batch)]
+
+            try:
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        self.round_trips += 1
+                        await message_repository.insert_many(batch)
+                        self.rows_written += len(batch)
+                        return
+                    except Exception as e:
+                        if attempt == self.max_attempts:
+                            self.rows_dropped += len(batch)
+                            logger.error(f"Dropping {len(batch)} messages after {attempt} failed inserts: {e}")
+                        else:
+                            await asyncio.sleep(0.5 * attempt)
+            finally:
+                for _ in batch:
+                    self._room.release()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "round_trips": self.round_trips,
+            "round_trips_per_row": round(self.round_trips / self.rows_written, 4) if self.rows_written else 0.0,
+        }
+
+
+message_writer = MessageWriter(
+    max_batch=settings.message_batch_size,
+    flush_interval=settings.message_flush_interval_ms / 1000,
+    max_buffer=settings.message_buffer_max_rows,
+)
@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import hmac
+import random
+import time
+import logging
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache hits (sub-millisecond) up to slow generations and ingestion
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OTHER_TENANTS = "other"
+NO_TENANT = ""
+
+
+def tenant_alias(owner_id: str) -> str:
+    """
+    Stable opaque name of a tenant for metrics, traces and /health.
+
+    Owner ids double as ManyChat `client_api_key`, so they must never be exposed there.
+    """
+    return "t-" + hashlib.sha256(owner_id.encode()).hexdigest()[:12]
+
+
+def scrape_allowed(authorization: Optional[str]) -> bool:
+    """Whether a request may read /metrics, /metrics/traces and /health (`METRICS_TOKEN`)."""
+    if not settings.metrics_token:
+        return True
+    return hmac.compare_digest(authorization or "", f"Bearer {settings.metrics_token}")
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Trace:
+    """Stage timings of one sampled request, as offsets from its start."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tenant = NO_TENANT
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Tuple[str, float, float, Optional[str]]] = []
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "tenant": self.tenant,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": [
+                {"stage": stage, "start_ms": round(start, 1), "duration_ms": round(duration, 1), "error": error}
+                for stage, start, duration, error in self.spans
+            ],
+        }
+
+
+class _RequestContext:
+    __slots__ = ("tenant", "trace")
+
+    def __init__(self, trace: Optional[Trace]):
+        self.tenant = NO_TENANT
+        self.trace = trace
+
+
+# Set per webhook job; read by every timer below it, including in to_thread workers
+_context: ContextVar[Optional[_RequestContext]] = ContextVar("metrics_context", default=None)
+
+
+class Metrics:
+    """
+    In-process latency histograms, counters and gauges, rendered in the Prometheus text
+    format.
+
+    `timer(stage)` records one observation in `stage_duration_seconds{stage, tenant}`,
+    counts exceptions in `stage_errors_total` and tracks `stage_in_flight{stage}`. The
+    tenant label comes from the request context (`request` / `set_tenant`) as the
+    tenant's `tenant_alias`; only the first `max_tenants` tenants get their own label,
+    the rest share "other". A sampled
+    fraction of requests also keeps a per-stage trace, available from `traces()`.
+    """
+
+    def __init__(self, max_tenants: int, trace_sample_rate: float, trace_buffer: int,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.max_tenants = max_tenants
+        self.trace_sample_rate = trace_sample_rate
+        self.buckets = buckets
+        self._tenants: Dict[str, str] = {}
+        self._histograms: Dict[Tuple[str, str], _Histogram] = {}
+        self._errors: Dict[Tuple[str, str, str], int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._traces: Deque[Trace] = deque(maxlen=trace_buffer)
+        self._lag_task: Optional[asyncio.Task] = None
+        self.max_loop_lag = 0.0
+
+    def tenant_label(self, owner_id: str) -> str:
+        label = self._tenants.get(owner_id)
+        if label is None:
+            label = tenant_alias(owner_id) if len(self._tenants) < self.max_tenants else OTHER_TENANTS
+            if label != OTHER_TENANTS:
+                self._tenants[owner_id] = label
+        return label
+
+    @contextmanager
+    def request(self, name: str) -> Iterator[Optional[Trace]]:
+        """Scope of one request: carries its tenant label and, if sampled, its trace."""
+        trace = Trace(name) if self.trace_sample_rate and random.random() < self.trace_sample_rate else None
+        token = _context.set(_RequestContext(trace))
+        try:
+            with self.timer(name):
+                yield trace
+        finally:
+            _context.reset(token)
+            if trace is not None:
+                trace.duration_ms = round((time.perf_counter() - trace.started) * 1000, 1)
+                self._traces.append(trace)
+
+    def set_tenant(self, owner_id: str):
+        context = _context.get()
+        if context is not None:
+            context.tenant = self.tenant_label(owner_id)
+            if context.trace is not None:
+                context.trace.tenant = tenant_alias(owner_id)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        self._in_flight[stage] = self._in_flight.get(stage, 0) + 1
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._in_flight[stage] -= 1
+            self.observe(stage, time.perf_counter() - started, error, started)
+
+    def observe(self, stage: str, seconds: float, error: Optional[str] = None, started: Optional[float] = None):
+        context = _context.get()
+        tenant = context.tenant if context is not None else NO_TENANT
+        key = (stage, tenant)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(len(self.buckets) + 1)
+        histogram.counts[bisect_left(self.buckets, seconds)] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+        if error is not None:
+            error_key = (stage, tenant, error)
+            self._errors[error_key] = self._errors.get(error_key, 0) + 1
+        if context is not None and context.trace is not None:
+            trace = context.trace
+            start = (started if started is not None else time.perf_counter() - seconds) - trace.started
+            trace.spans.append((stage, start * 1000, seconds * 1000, error))
+
+    def start_loop_monitor(self, interval: float):
+        """Samples event-loop lag (how late a sleep wakes up) into stage `event_loop.lag`."""
+        if interval > 0 and self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._monitor_loop(interval))
+
+    async def stop_loop_monitor(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+
+    async def _monitor_loop(self, interval: float):
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.max_loop_lag = max(self.max_loop_lag, lag)
+            self.observe("event_loop.lag", lag)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def traces(self, limit: int = 50) -> List[dict]:
+        return [trace.as_dict() for trace in list(self._traces)[-limit:]][::-1]
+
+    def stats(self) -> dict:
+        return {
+            "series": len(self._histograms),
+            "tenants": len(self._tenants),
+            "traces": len(self._traces),
+            "max_loop_lag_ms": round(self.max_loop_lag * 1000, 1),
+        }
+
+    def render(self, gauges: Optional[Dict[str, dict]] = None) -> str:
+        """Prometheus text exposition; `gauges` are component stats flattened into `chatbot_<component>_<field>`."""
+        lines = [
+            "# HELP stage_duration_seconds Latency of each stage of request handling",
+            "# TYPE stage_duration_seconds histogram",
+        ]
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for (stage, tenant), histogram in sorted(self._histograms.items()):
+            labels = f'stage="{_escape(stage)}",tenant="{_escape(tenant)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"stage_duration_seconds_sum{{{labels}}} {_format_value(histogram.sum)}")
+            lines.append(f"stage_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += ["# HELP stage_errors_total Stages that ended with an exception", "# TYPE stage_errors_total counter"]
+        for (stage, tenant, error), count in sorted(self._errors.items()):
+            lines.append(f'stage_errors_total{{stage="{_escape(stage)}",tenant="{_escape(tenant)}",error="{_escape(error)}"}} {count}')
+
+        lines += ["# HELP stage_in_flight Stages currently running", "# TYPE stage_in_flight gauge"]
+        for stage, count in sorted(self._in_flight.items()):
+            lines.append(f'stage_in_flight{{stage="{_escape(stage)}"}} {count}')
+
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter, labels), value in sorted(self._counters.items()):
+                if counter == name:
+                    label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text else f"{name} {_format_value(value)}")
+
+        for component, values in (gauges or {}).items():
+            for field, value in _flatten(values):
+                name = f"chatbot_{component}_{field}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(values: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in values.items():
+        # Per-tenant breakdowns stay on /health: as metric names they would be unbounded
+        if key == "tenants" and isinstance(value, dict):
+            continue
+        name = f"{prefix}{key}".replace(".", "_").replace("-", "_")
+        if isinstance(value, bool):
+            yield name, float(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, str) and key == "circuit":
+            yield f"{name}_open", float(value != "closed")
+        elif isinstance(value, dict):
+            yield from _flatten(value, f"{name}_")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics(
+    max_tenants=settings.metrics_max_tenants,
+    trace_sample_rate=settings.metrics_trace_sample_rate,
+    trace_buffer=settings.metrics_trace_buffer,
+)
@@ -0,0 +1,31 @@
+import base64
+from datetime import datetime
+from typing import Tuple
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(created_at: str, row_id: int) -> str:
+    """Opaque cursor pointing just after the row (created_at, row_id) in newest-first order."""
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(created_at)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_filter(cursor: str, time_column: str = "created_at", id_column: str = "id") -> str:
+    """PostgREST `or` filter for rows strictly older than the cursor: (time, id) < (t, i)."""
+    created_at, row_id = decode_cursor(cursor)
+    # Quoted: timestamps contain ':' and '.', which are reserved in PostgREST logic trees
+    return f'{time_column}.lt."{created_at}",and({time_column}.eq."{created_at}",{id_column}.lt.{row_id})'
@@ -1,67 +1,345 @@
-from PyPDF2 import PdfReader
-from typing import List, Tuple
+from fastapi import Request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+import hashlib
 import io
+import multiprocessing
+import os
+import tempfile
 # from app.services.rag_service import create_embedding  <-- Removed to break circular dependency and because it's deprecated
+from app.config import get_settings
 from app.database import get_supabase
+from app.services import pdf_worker
+from app.services.pdf_worker import PdfAnalysis
+
+settings = get_settings()
+
+MULTIPART_OVERHEAD = 64 * 1024  # Boundaries, part headers and small fields around the uploaded file
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class InvalidUploadError(Exception):
+    pass
 
 
 def extract_text_from_pdf(pdf_content: bytes) -> str:
+    from PyPDF2 import PdfReader
+
     pdf_file = io.BytesIO(pdf_content)
     reader = PdfReader(pdf_file)
     
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    
-    return text
+    return "".join((page.extract_text() or "") + "\n" for page in reader.pages)
+
+
+@dataclass
+class Chunk:
+    index: int
+    start: int  # Offset of the chunk in the document text (pages joined with newlines)
+    end: int
+    text: str
+
+
+class Chunker:
+    """
+    Incremental sentence/newline-aware splitter.
+
+    Text is fed piece by piece (e.g. page by page); only the not-yet-emitted tail is kept,
+    so memory stays bounded by one page plus one chunk. Offsets refer to the full text and
+    match what `chunk_text` would produce on the concatenation.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buffer = ""
+        self._offset = 0  # Document offset of self._buffer[0]
+        self._index = 0
+
+    def feed(self, text: str) -> List[Chunk]:
+        self._buffer += text
+        chunks = []
+        # A chunk can only be cut once we know whether more text follows it
+        while len(self._buffer) > self.chunk_size:
+            chunks.extend(self._cut(final=False))
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        chunks = []
+        while self._buffer:
+            chunks.extend(self._cut(final=True))
+        return chunks
+
+    def _cut(self, final: bool) -> List[Chunk]:
+        window = self._buffer[:self.chunk_size]
+        end = len(window)
+        if not (final and end == len(self._buffer)):
+            break_point = max(window.rfind(c) for c in ".!?\n")
+            if break_point > self.chunk_size // 2:
+                end = break_point + 1
+
+        chunks = []
+        text = window[:end].strip()
+        if text:
+            chunks.append(Chunk(self._index, self._offset, self._offset + end, text))
+            self._index += 1
+
+        if end >= len(self._buffer):
+            self._offset += len(self._buffer)
+            self._buffer = ""
+        else:
+            step = max(end - self.overlap, 1)
+            self._buffer = self._buffer[step:]
+            self._offset += step
+        return chunks
 
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        if end < len(text):
-            last_period = chunk.rfind('.')
-            last_newline = chunk.rfind('\n')
-            break_point = max(last_period, last_newline)
-            
-            if break_point > chunk_size // 2:
-                chunk = text[start:start + break_point + 1]
-                end = start + break_point + 1
-        
-        chunks.append(chunk.strip())
-        start = end - overlap
-    
-    return [c for c in chunks if c]
+    chunker = Chunker(chunk_size, overlap)
+    return [c.text for c in chunker.feed(text) + chunker.finish()]
 
 
-def validate_pdf(pdf_content: bytes, max_size_mb: int = 20, max_pages: int = 200) -> Tuple[bool, str]:
-    size_mb = len(pdf_content) / (1024 * 1024)
-    if size_mb > max_size_mb:
-        return False, f"File size ({size_mb:.1f}MB) exceeds limit of {max_size_mb}MB"
-    
+async def iter_chunks(pages: AsyncIterator[str], chunk_size: int = 1000, overlap: int = 200) -> AsyncIterator[Chunk]:
+    """Chunks a stream of pages as they arrive."""
+    chunker = Chunker(chunk_size, overlap)
+    async for page in pages:
+        for chunk in chunker.feed(page + "\n"):
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+    filename: str = ""
+
+
+class _FilePart:
+    """python-multipart callbacks keeping the data of the first `field` file part; other parts are skipped."""
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.filename: Optional[str] = None
+        self.data: List[bytes] = []  # File bytes parsed from the last chunk, not written yet
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._in_file = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field_data,
+            "on_header_value": self._header_value_data,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field_data(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _headers_finished(self):
+        from python_multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and options.get(b"name") == self.field and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._in_file = True
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.data.append(data[start:end])
+
+    def _part_end(self):
+        self._in_file = False
+
+
+async def spool_upload(request: Request, field: str = "file", extension: str = ".pdf",
+                       max_size_mb: int = 20) -> SpooledUpload:
+    """
+    Streams the `field` file of a multipart upload from the request body to a temporary
+    file on disk, hashing it on the way.
+
+    The body is parsed as it arrives instead of being received whole by Starlette first:
+    a declared Content-Length over the limit is refused before anything is read, an
+    undeclared one as soon as the limit is crossed, and the file is written only once.
+    The caller owns (and must delete) the file.
+    """
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    max_bytes = max_size_mb * 1024 * 1024
+    too_large = f"File size exceeds limit of {max_size_mb}MB"
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLargeError(too_large)
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise InvalidUploadError("Expected a multipart/form-data upload")
+
+    part = _FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    digest = hashlib.sha256()
+    tmp = await asyncio.to_thread(tempfile.NamedTemporaryFile, delete=False, suffix=extension)
+    received = size = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD:
+                raise UploadTooLargeError(too_large)
+            parser.write(chunk)
+            if part.filename is not None and not part.filename.lower().endswith(extension):
+                raise InvalidUploadError(f"Only {extension.lstrip('.').upper()} files are allowed")
+            if part.data:
+                data = b"".join(part.data)
+                part.data.clear()
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadTooLargeError(too_large)
+                digest.update(data)
+                await asyncio.to_thread(tmp.write, data)
+        parser.finalize()
+        if part.filename is None:
+            raise InvalidUploadError(f"No file in the '{field}' field")
+    except MultipartParseError as e:
+        await asyncio.to_thread(tmp.close)
+        await asyncio.to_thread(os.unlink, tmp.name)
+        raise InvalidUploadError(f"Malformed upload: {e}")
+    except BaseException:
+        await asyncio.to_thread(tmp.close)
+        await asyncio.to_thread(os.unlink, tmp.name)
+        raise
+    await asyncio.to_thread(tmp.close)
+    return SpooledUpload(path=tmp.name, size=size, sha256=digest.hexdigest(), filename=part.filename)
+
+
+class PdfProcessPool:
+    """
+    Bounded process pool for CPU-heavy PDF parsing, so it never runs on the event loop.
+
+    Each worker's address space is capped at `max_memory_mb` and recycled after
+    `max_tasks_per_child` jobs. At most `max_queued` jobs wait for a worker. A job that
+    exceeds its timeout has no way to be interrupted on its own, so the whole pool is
+    killed and recreated (other jobs running at that moment fail and report it).
+    """
+
+    def __init__(self, max_workers: int, max_memory_mb: int, timeout: float, max_queued: int,
+                 max_tasks_per_child: int = 50):
+        self.max_workers = max_workers
+        self.max_memory_mb = max_memory_mb
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._slots = asyncio.Semaphore(max_workers + max_queued)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.timeouts = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: workers only import pdf_worker, not the whole app
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=pdf_worker.limit_memory,
+                initargs=(self.max_memory_mb,),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+        return self._executor
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        async with self._slots:
+            future = self.executor.submit(fn, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._reset()
+                raise
+            except BrokenProcessPool:
+                # A worker died (e.g. hit its memory cap): start fresh for the next jobs
+                self._reset()
+                raise
+
+    def _reset(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # ProcessPoolExecutor has no public way to stop a running job
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pdf_pool = PdfProcessPool(
+    max_workers=settings.pdf_pool_workers,
+    max_memory_mb=settings.pdf_job_memory_mb,
+    timeout=settings.pdf_job_timeout_seconds,
+    max_queued=settings.pdf_pool_max_queued,
+)
+
+
+async def validate_pdf(pdf_path: str, max_size_mb: int = 20, max_pages: int = 200) -> PdfAnalysis:
+    """Parses the PDF once in the process pool: validity, page count, text density and fingerprint."""
+    try:
+        return await pdf_pool.run(pdf_worker.analyze_pdf, pdf_path, max_size_mb, max_pages)
+    except asyncio.TimeoutError:
+        return PdfAnalysis(False, "PDF took too long to process")
+    except BrokenProcessPool:
+        return PdfAnalysis(False, "PDF processing failed (worker crashed or ran out of memory)")
+
+
+async def iter_pages(pdf_path: str, page_count: Optional[int] = None, pages_per_job: int = 10) -> AsyncIterator[str]:
+    """
+    Extracts page texts in parallel across the process pool and yields them in order.
+
+    Page ranges are submitted a few jobs ahead of the consumer, so extraction keeps
+    running while earlier pages are being chunked and embedded. Pass the `page_count`
+    found by `validate_pdf` to avoid parsing the document once more just to count them.
+    """
+    if page_count is None:
+        page_count = await pdf_pool.run(pdf_worker.count_pages, pdf_path)
+    ranges = [(start, min(start + pages_per_job, page_count)) for start in range(0, page_count, pages_per_job)]
+    window = pdf_pool.max_workers * 2
+    jobs: List[asyncio.Task] = []
     try:
-        pdf_file = io.BytesIO(pdf_content)
-        reader = PdfReader(pdf_file)
-        num_pages = len(reader.pages)
-        
-        if num_pages > max_pages:
-            return False, f"Page count ({num_pages}) exceeds limit of {max_pages} pages"
-        
-        text = ""
-        for page in reader.pages[:3]:
-            text += page.extract_text() or ""
-        
-        if len(text.strip()) < 100:
-            return False, "PDF appears to be image-based or has no extractable text"
-        
-        return True, "Valid PDF"
-    except Exception as e:
-        return False, f"Invalid PDF file: {str(e)}"
+        for start, end in ranges[:window]:
+            jobs.append(asyncio.create_task(pdf_pool.run(pdf_worker.extract_page_range, pdf_path, start, end)))
+        for i in range(len(ranges)):
+            if i + window < len(ranges):
+                start, end = ranges[i + window]
+                jobs.append(asyncio.create_task(pdf_pool.run(pdf_worker.extract_page_range, pdf_path, start, end)))
+            for text in await jobs[i]:
+                yield text
+            jobs[i] = None
+    finally:
+        for job in jobs:
+            if job is not None and not job.done():
+                job.cancel()
 
 
 # Deprecated: process_document is no longer used as we upload directly to Gemini
@@ -0,0 +1,135 @@
+"""
+CPU-bound PDF work executed inside the PDF process pool.
+
+This module is imported by the pool's worker processes, so it must stay free of
+app imports (settings, Supabase client, ...) that would slow down or break their start.
+"""
+import hashlib
+import mmap
+import os
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from PyPDF2 import PdfReader
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Documents whose reader a worker process keeps open between jobs. An evicted document's
+# file stays open (and on disk, if already deleted) until then, so keep this small.
+READER_CACHE_SIZE = 2
+
+
+@dataclass
+class PdfAnalysis:
+    valid: bool
+    message: str
+    page_count: int = 0
+    text_density: float = 0.0  # Extractable characters per sampled page
+    fingerprint: Optional[str] = None  # SHA-256 of the normalised sampled text
+
+
+def limit_memory(max_memory_mb: int):
+    """Pool initializer: caps the address space of the worker process."""
+    try:
+        import resource
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+@contextmanager
+def open_pdf(pdf_path: str) -> Iterator["PdfReader"]:
+    # Imported here so the web process only pays for PyPDF2 if it parses a PDF itself
+    from PyPDF2 import PdfReader
+
+    # Parse straight from the page cache instead of loading the file into memory
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pdf_file:
+        yield PdfReader(pdf_file)
+
+
+@dataclass
+class _OpenReader:
+    identity: Tuple[int, int, int, int]  # device, inode, mtime, size: a new file at the same path doesn't match
+    file: Any
+    buffer: mmap.mmap
+    reader: "PdfReader"
+
+    def close(self):
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass
+        self.file.close()
+
+
+_readers: "OrderedDict[str, _OpenReader]" = OrderedDict()
+
+
+def cached_reader(pdf_path: str) -> "PdfReader":
+    """
+    Reader of `pdf_path` kept open in this worker process, so the page ranges of one
+    document don't each re-parse its cross-reference table.
+    """
+    from PyPDF2 import PdfReader
+
+    stat = os.stat(pdf_path)
+    identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _readers.get(pdf_path)
+    if cached is not None:
+        if cached.identity == identity:
+            _readers.move_to_end(pdf_path)
+            return cached.reader
+        _readers.pop(pdf_path).close()
+
+    f = open(pdf_path, "rb")
+    try:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        reader = PdfReader(buffer)
+    except BaseException:
+        f.close()
+        raise
+    _readers[pdf_path] = _OpenReader(identity, f, buffer, reader)
+    while len(_readers) > READER_CACHE_SIZE:
+        _readers.popitem(last=False)[1].close()
+    return reader
+
+
+def analyze_pdf(pdf_path: str, max_size_mb: int = 20, max_pages: int = 200, sample_pages: int = 3) -> PdfAnalysis:
+    size_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+    if size_mb > max_size_mb:
+        return PdfAnalysis(False, f"File size ({size_mb:.1f}MB) exceeds limit of {max_size_mb}MB")
+
+    try:
+        with open_pdf(pdf_path) as reader:
+            num_pages = len(reader.pages)
+
+            if num_pages > max_pages:
+                return PdfAnalysis(False, f"Page count ({num_pages}) exceeds limit of {max_pages} pages", page_count=num_pages)
+
+            sampled = [page.extract_text() or "" for page in reader.pages[:sample_pages]]
+
+        text = _WHITESPACE.sub(" ", " ".join(sampled)).strip()
+        density = len(text) / len(sampled) if sampled else 0.0
+        fingerprint = hashlib.sha256(text.lower().encode("utf-8")).hexdigest()
+
+        if len(text) < 100:
+            return PdfAnalysis(False, "PDF appears to be image-based or has no extractable text",
+                               page_count=num_pages, text_density=density, fingerprint=fingerprint)
+
+        return PdfAnalysis(True, "Valid PDF", page_count=num_pages, text_density=density, fingerprint=fingerprint)
+    except Exception as e:
+        return PdfAnalysis(False, f"Invalid PDF file: {str(e)}")
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(cached_reader(pdf_path).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    reader = cached_reader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
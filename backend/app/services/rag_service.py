@@ -1,26 +1,137 @@
-import google.generativeai as genai
+import time
+import logging
 from app.config import get_settings
-from app.database import get_supabase
-from app.services.gemini_service import gemini_service
-from typing import List, Dict, Any
+from app.services.gemini_service import (
+    gemini_service, ChunkCallback, TruncatedAnswer, GENERATION_ERROR_MESSAGE, NO_ANSWER_MESSAGE
+)
+from app.services.answer_cache import answer_cache, normalize_query
+from app.services.faq_index import faq_index, tokenize
+from app.services.tenant_cache import TenantContext
+from app.services.metrics import metrics
+from app.services.conversation_store import Conversation, Turn
+from app.services.vector_store import vector_index, fetch_passages, Passage
+from typing import List, Dict, Any, Optional
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
-async def process_rag_query(query: str, owner_id: str, custom_prompt: str = None) -> str:
-    supabase = get_supabase()
+# A question opening with one of these, or using one of the pronouns, leans on earlier turns
+# ("et pour le samedi ?", "ça coûte combien ?")
+FOLLOW_UP_OPENERS = frozenset("et mais alors donc sinon aussi puis ok oui non".split())
+REFERRING_WORDS = frozenset("ca cela ceci celui celle ceux celles il elle ils elles lui eux leur leurs meme".split())
+
+
+def is_context_free(query: str) -> bool:
+    """Whether a question asked mid-conversation stands on its own, so a shared cached answer fits it."""
+    words = normalize_query(query).split()
+    if not words or words[0] in FOLLOW_UP_OPENERS or REFERRING_WORDS.intersection(words):
+        return False
+    return len(tokenize(query)) >= settings.answer_cache_context_free_min_terms
+
+
+class FileSearchRetriever:
+    """Retrieval and generation in one remote call, through the Gemini File Search tool."""
+
+    async def has_documents(self, tenant: TenantContext) -> bool:
+        return bool(tenant.gemini_file_store_id)
+
+    async def generate(self, query: str, tenant: TenantContext, summary: str = "", history: List[Turn] = (),
+                       on_chunk: Optional[ChunkCallback] = None) -> str:
+        return await gemini_service.generate_response(
+            query, tenant.gemini_file_store_id, tenant.chatbot_prompt,
+            history=[(t.role, t.text) for t in history], summary=summary, on_chunk=on_chunk
+        )
+
+
+class LocalRetriever:
+    """Top-k cosine search over the tenant's document_sections, then generation on those chunks only."""
+
+    def __init__(self, top_k: int, min_score: float):
+        self.index = vector_index
+        self.top_k = top_k
+        self.min_score = min_score
+
+    async def has_documents(self, tenant: TenantContext) -> bool:
+        return await self.index.size(tenant.owner_id) > 0
+
+    async def retrieve(self, queries: List[str], owner_id: str) -> List[List[Passage]]:
+        with metrics.timer("rag.embed_query"):
+            embeddings = await gemini_service.embed_texts(queries, task_type="RETRIEVAL_QUERY")
+        with metrics.timer("rag.vector_search"):
+            hits = await self.index.search(owner_id, embeddings, self.top_k)
+        return [
+            await fetch_passages([h for h in query_hits if h[1] >= self.min_score])
+            for query_hits in hits
+        ]
+
+    async def generate(self, query: str, tenant: TenantContext, summary: str = "", history: List[Turn] = (),
+                       on_chunk: Optional[ChunkCallback] = None) -> str:
+        started = time.perf_counter()
+        # A follow-up ("et ça coûte combien ?") is searched together with the previous question
+        previous = [t.text for t in history if t.role == "user"][-1:]
+        passages = (await self.retrieve([" ".join(previous + [query])], tenant.owner_id))[0]
+        logger.info(f"Local retrieval for {tenant.owner_id}: {len(passages)} passages in {(time.perf_counter() - started) * 1000:.1f}ms")
+        if not passages:
+            return NO_ANSWER_MESSAGE
+        return await gemini_service.generate_with_context(
+            query, [p.content for p in passages], tenant.chatbot_prompt,
+            history=[(t.role, t.text) for t in history], summary=summary, on_chunk=on_chunk
+        )
+
+
+def create_retriever():
+    if settings.retriever_backend == "local":
+        return LocalRetriever(settings.retriever_top_k, settings.retriever_min_score)
+    if settings.retriever_backend == "file_search":
+        return FileSearchRetriever()
+    raise ValueError(f"Unknown retriever backend: {settings.retriever_backend}")
+
+
+retriever = create_retriever()
+
+
+async def process_rag_query(query: str, tenant: TenantContext, conversation: Optional[Conversation] = None,
+                            on_chunk: Optional[ChunkCallback] = None) -> str:
+    """Returns the answer; when it comes from Gemini and `on_chunk` is given, it is also streamed through it."""
+    if settings.faq_fast_path_enabled:
+        try:
+            with metrics.timer("rag.faq"):
+                match = await faq_index.match(tenant.owner_id, query)
+            if match is not None:
+                return match.answer
+        except Exception as e:
+            logger.warning(f"FAQ fast path failed for {tenant.owner_id}: {e}")
+
+    if not await retriever.has_documents(tenant):
+        return "Aucun document n'a encore été indexé pour ce chatbot. Veuillez uploader des documents d'abord."
     
-    # Get the user's Gemini File Store ID
-    user_profile = supabase.table("profiles").select("gemini_file_store_id").eq("id", owner_id).single().execute()
-    store_id = user_profile.data.get("gemini_file_store_id")
+    summary, history = "", []
+    if conversation is not None:
+        summary, history = conversation.context(settings.conversation_history_token_budget)
     
-    if not store_id:
-        return "Aucun document n'a encore été indexé pour ce chatbot. Veuillez uploader des documents d'abord."
+    lookup = None
+    has_context = bool(summary or history)
+    if settings.answer_cache_enabled:
+        # Mid-conversation, only a question that stands on its own can take a shared answer
+        if not has_context or is_context_free(query):
+            with metrics.timer("rag.answer_cache"):
+                lookup = await answer_cache.lookup(tenant.owner_id, tenant.chatbot_prompt, query)
+            if lookup.answer is not None:
+                return lookup.answer
+        else:
+            answer_cache.skip_for_context(tenant.owner_id)
     
     try:
-        # Use Gemini File Search Tool
-        response = gemini_service.generate_response(query, store_id, custom_prompt)
+        started = time.perf_counter()
+        with metrics.timer("rag.generate"):
+            response = await retriever.generate(query, tenant, summary, history, on_chunk)
+        
+        # A stream that broke off leaves only the start of an answer: sent, but not worth keeping
+        cacheable = response not in (GENERATION_ERROR_MESSAGE, NO_ANSWER_MESSAGE) and not isinstance(response, TruncatedAnswer)
+        # An answer generated with earlier turns may refer to them (or to the customer): never shared
+        if lookup is not None and cacheable and not has_context:
+            answer_cache.store(lookup, response, (time.perf_counter() - started) * 1000)
         return response
     except Exception as e:
         print(f"Error in RAG generation: {e}")
         return "Je suis désolé, je n'ai pas pu générer une réponse pour le moment."
-
@@ -0,0 +1,251 @@
+import asyncio
+import random
+import time
+import logging
+from typing import Awaitable, Callable, Optional, Tuple
+import httpx
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+OVERLOAD_STATUS = {429, 503}
+
+# Smoothing of the latency averages: the long one is the baseline, the short one the
+# current level. Single slow calls (long generations) barely move the short average.
+LONG_ALPHA = 0.02
+SHORT_ALPHA = 0.1
+MIN_SAMPLES = 20  # Calls observed before latency may cut the limit
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when the circuit is open or retries ran out on a transport error."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: grows by one per `limit` successful calls and is cut by
+    `backoff` on overload (429/503, timeouts) or when the recent average latency (short
+    EWMA) exceeds `latency_tolerance` times the long-run average (long EWMA), i.e. when
+    the upstream is queueing, not when one call happens to be slow. A tolerance of 0
+    disables the latency cut.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int,
+                 latency_tolerance: float, backoff: float = 0.7):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.recent: Optional[float] = None
+        self.samples = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float], overloaded: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self._decrease()
+            elif latency is not None:
+                self.samples += 1
+                if self.baseline is None:
+                    self.baseline = self.recent = latency
+                else:
+                    self.baseline += LONG_ALPHA * (latency - self.baseline)
+                    self.recent += SHORT_ALPHA * (latency - self.recent)
+                if (self.latency_tolerance and self.samples >= MIN_SAMPLES
+                        and self.recent > self.baseline * self.latency_tolerance):
+                    self._decrease()
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify(max(0, int(self.limit) - self.in_flight))
+
+    def _decrease(self):
+        # One cut per round of in-flight calls, not one per failed call of the same round
+        now = time.monotonic()
+        if now - self._last_decrease < (self.baseline or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_timeout` seconds; then lets one probe through (half-open) and closes again
+    if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def abandon(self):
+        """The call was cancelled before it told us anything about the upstream."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class ResilientCaller:
+    """
+    Runs one kind of upstream HTTP call behind a circuit breaker and an adaptive
+    concurrency limit, retrying retryable statuses and transport errors with jittered
+    exponential backoff (or the server's Retry-After).
+
+    A final non-2xx response is returned to the caller as is; UpstreamUnavailableError
+    is raised when the circuit is open or the last attempt failed at transport level.
+    """
+
+    def __init__(self, name: str, limiter: AdaptiveLimiter, breaker: CircuitBreaker,
+                 max_attempts: int, retry_base: float, retry_max: float):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]], retry: bool = True) -> httpx.Response:
+        response, _ = await self._call(send, retry, hold=False)
+        return response
+
+    async def open(self, send: Callable[[], Awaitable[httpx.Response]],
+                   retry: bool = True) -> Tuple[httpx.Response, Callable[[], Awaitable[None]]]:
+        """
+        Like `call` for a streamed response: a successful one keeps its concurrency slot
+        until the returned `release` is awaited, once its body has been read or closed.
+        """
+        response, latency = await self._call(send, retry, hold=True)
+        released = latency is None
+
+        async def release():
+            nonlocal released
+            if not released:
+                released = True
+                await self.limiter.release(latency, overloaded=False)
+
+        return response, release
+
+    async def _call(self, send: Callable[[], Awaitable[httpx.Response]], retry: bool,
+                    hold: bool) -> Tuple[httpx.Response, Optional[float]]:
+        """Returns the final response and, if its slot is still held, its latency to headers."""
+        attempts = self.max_attempts if retry else 1
+        self.calls += 1
+        for attempt in range(1, attempts + 1):
+            probing = self.breaker.state != "closed"
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise UpstreamUnavailableError(f"{self.name}: circuit open")
+
+            try:
+                await self.limiter.acquire()
+            except BaseException:
+                # Cancelled while waiting for a slot: a half-open probe must be given back
+                if probing:
+                    self.breaker.abandon()
+                raise
+            started = time.monotonic()
+            response = None
+            try:
+                response = await send()
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                metrics.observe(self.name, time.monotonic() - started, type(e).__name__)
+                await self.limiter.release(None, overloaded=isinstance(e, httpx.TimeoutException))
+                self.breaker.record_failure()
+                if attempt == attempts:
+                    raise UpstreamUnavailableError(f"{self.name}: {type(e).__name__}: {e}") from e
+                delay = self._backoff(attempt, None)
+            except BaseException:
+                await self.limiter.release(None, overloaded=False)
+                if probing:
+                    self.breaker.abandon()
+                raise
+            else:
+                status = response.status_code
+                latency = time.monotonic() - started
+                metrics.observe(self.name, latency, f"HTTP {status}" if status >= 400 else None)
+                if status >= 500:
+                    self.breaker.record_failure()
+                else:
+                    # 429 is back-pressure from a healthy upstream: handled by the limiter
+                    self.breaker.record_success()
+                final = status not in RETRYABLE_STATUS or attempt == attempts
+                if hold and final and status < 400:
+                    # The body is still to come: the slot goes back when the caller is done with it
+                    return response, latency
+                await self.limiter.release(latency if status < 400 else None, overloaded=status in OVERLOAD_STATUS)
+                if final:
+                    return response, None
+                delay = self._backoff(attempt, response)
+
+            self.retries += 1
+            logger.warning(f"{self.name} attempt {attempt} failed "
+                           f"({response.status_code if response is not None else 'transport error'}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(self.retry_max, float(retry_after))
+                except ValueError:
+                    pass
+        # Full jitter
+        return random.uniform(0, min(self.retry_max, self.retry_base * (2 ** (attempt - 1))))
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "baseline_latency_ms": round(self.limiter.baseline * 1000, 1) if self.limiter.baseline else None,
+            "recent_latency_ms": round(self.limiter.recent * 1000, 1) if self.limiter.recent else None,
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,72 @@
+"""
+Process setup shared by the web process (`app.main`) and the job worker (`app.worker`):
+the webhook worker pool, the /metrics rendering and the startup warmup steps.
+"""
+from typing import Dict, Optional
+from app.config import get_settings
+from app.routers.webhook import run_chat_job
+from app.services.gemini_service import gemini_service
+from app.services.manychat_service import manychat_service
+from app.services.job_queue import WorkerPool, job_queue
+from app.services.message_writer import message_writer
+from app.services.conversation_store import conversation_store
+from app.services.usage_meter import usage_meter, current_period
+from app.services.admission import admission_controller
+from app.services.tenant_cache import tenant_cache
+from app.services.answer_cache import answer_cache
+from app.services.coalescer import message_coalescer
+from app.services.metrics import metrics
+from app.services.invalidation import invalidation_bus
+from app.services.startup import WarmupStep, open_connections, startup
+from app.repositories.billing import billing_repository
+from app.repositories.postgrest import postgrest
+
+settings = get_settings()
+
+
+def create_worker_pool() -> WorkerPool:
+    return WorkerPool(
+        job_queue,
+        run_chat_job,
+        # Jobs waiting for admission are held too; admission control bounds the running ones
+        concurrency=settings.worker_concurrency + settings.admission_max_queued,
+        max_attempts=settings.job_max_attempts,
+        retry_base_seconds=settings.job_retry_base_seconds,
+    )
+
+
+async def render_metrics(pool: Optional[WorkerPool]) -> str:
+    """Stage histograms plus the components' own counters and queue depths, in Prometheus format."""
+    return metrics.render({
+        "job_queue": {"depth": await job_queue.depth(), **(pool.stats() if pool else {})},
+        "admission": admission_controller.stats(),
+        "gemini": gemini_service.stats(),
+        "manychat": manychat_service.stats(),
+        "postgrest": postgrest.stats(),
+        "message_writer": message_writer.stats(),
+        "usage": usage_meter.stats(),
+        "tenant_cache": tenant_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalescer": message_coalescer.stats(),
+        "conversations": conversation_store.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "startup": startup.stats(),
+    })
+
+
+def warmup_steps() -> Dict[str, WarmupStep]:
+    """Connection pools opened and hot tenants cached before the process takes traffic."""
+    connections = settings.warmup_connections
+
+    async def preload_tenants() -> int:
+        owner_ids = await billing_repository.most_active(current_period(), settings.warmup_tenants)
+        return await tenant_cache.preload(owner_ids)
+
+    return {
+        "postgrest": lambda: open_connections(postgrest.client, "HEAD", "/profiles", connections, params={"limit": "1"}),
+        "gemini": lambda: open_connections(
+            gemini_service.client, "GET", f"{gemini_service.base_url}/models", connections, params={"pageSize": "1"}
+        ),
+        "manychat": lambda: open_connections(manychat_service.client, "HEAD", "/fb/page/getInfo", connections),
+        "tenants": preload_tenants,
+    }
@@ -0,0 +1,123 @@
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+WarmupStep = Callable[[], Awaitable[object]]
+
+
+class Startup:
+    """
+    Cold-start timings and readiness of this process.
+
+    Times are measured from the start of the entry module's import (`app.main` or
+    `app.worker`): `import_seconds` until it is imported, `ready_seconds` until warmup
+    has finished and `first_request_seconds` until the first request other than a
+    probe has been answered. `ready` only turns true once warmup has run, failed
+    steps included: they are logged and reported, not retried.
+    """
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.import_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.first_request_seconds: Optional[float] = None
+        self.first_request_ms: Optional[float] = None
+        self.ready = False
+        self.steps: Dict[str, dict] = {}
+
+    def mark_imported(self, started: float):
+        self.started = started
+        self.import_seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Imported in {self.import_seconds * 1000:.0f}ms")
+
+    def mark_request(self, started: float):
+        if self.first_request_seconds is None and self.started is not None:
+            self.first_request_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.first_request_seconds = round(time.perf_counter() - self.started, 3)
+            logger.info(f"First request answered {self.first_request_seconds:.2f}s after start ({self.first_request_ms}ms)")
+
+    async def warm_up(self, steps: Dict[str, WarmupStep], timeout: float):
+        """Runs the steps concurrently, for at most `timeout` seconds, then reports ready."""
+        started = time.perf_counter()
+        tasks = {name: asyncio.ensure_future(self._run(name, step)) for name, step in steps.items()}
+        if tasks:
+            try:
+                _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+            except asyncio.CancelledError:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+            for name, task in tasks.items():
+                if task in pending:
+                    task.cancel()
+                    self.steps[name] = {"ok": False, "error": "timeout"}
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.warmup_seconds = round(time.perf_counter() - started, 3)
+        self.ready = True
+        if self.started is not None:
+            self.ready_seconds = round(time.perf_counter() - self.started, 3)
+        logger.info(f"Warmup finished in {self.warmup_seconds * 1000:.0f}ms: {self.steps}")
+
+    async def _run(self, name: str, step: WarmupStep):
+        started = time.perf_counter()
+        try:
+            result = await step()
+            self.steps[name] = {"ok": True, "ms": round((time.perf_counter() - started) * 1000, 1)}
+            if isinstance(result, (int, float)) and not isinstance(result, bool):
+                self.steps[name]["count"] = result
+        except Exception as e:
+            logger.warning(f"Warmup step {name} failed: {e}")
+            self.steps[name] = {"ok": False, "error": str(e) or type(e).__name__}
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "import_seconds": self.import_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "ready_seconds": self.ready_seconds,
+            "first_request_seconds": self.first_request_seconds,
+            "first_request_ms": self.first_request_ms,
+            "steps": self.steps,
+        }
+
+
+async def open_connections(client: httpx.AsyncClient, method: str, url: str, connections: int, **kwargs) -> int:
+    """
+    Sends `connections` concurrent requests so the pool holds that many open keep-alive
+    connections (TLS included). Any response will do; returns how many came back.
+    """
+    async def one() -> bool:
+        response = await client.request(method, url, **kwargs)
+        await response.aread()
+        return True
+
+    results = await asyncio.gather(*(one() for _ in range(max(1, connections))), return_exceptions=True)
+    failures = [r for r in results if isinstance(r, BaseException)]
+    if len(failures) == len(results):
+        raise failures[0]
+    return len(results) - len(failures)
+
+
+class FirstRequestMiddleware:
+    """ASGI middleware recording when the first non-probe request has been answered."""
+
+    def __init__(self, app, probe_paths=("/health", "/ready", "/metrics")):
+        self.app = app
+        self.probe_paths = probe_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or startup.first_request_seconds is not None or scope["path"] in self.probe_paths:
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            startup.mark_request(started)
+
+
+startup = Startup()
@@ -0,0 +1,155 @@
+import asyncio
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from app.config import get_settings
+from app.repositories.profiles import profile_repository
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TenantContext:
+    owner_id: str
+    manychat_api_key: Optional[str]
+    chatbot_prompt: Optional[str]
+    gemini_file_store_id: Optional[str]
+    message_coalesce_ms: int = 0
+    monthly_request_limit: int = settings.default_monthly_request_limit
+    max_concurrent_requests: int = settings.admission_default_concurrency
+    requests_per_minute: int = settings.admission_default_requests_per_minute
+    scheduling_weight: int = 1
+
+
+def _tenant(row: dict) -> TenantContext:
+    plan = row.get("subscriptions") or {}
+    return TenantContext(
+        owner_id=row["id"],
+        manychat_api_key=row.get("manychat_api_key"),
+        chatbot_prompt=row.get("chatbot_prompt"),
+        gemini_file_store_id=row.get("gemini_file_store_id"),
+        message_coalesce_ms=row.get("message_coalesce_ms") or 0,
+        monthly_request_limit=plan.get("monthly_request_limit") or settings.default_monthly_request_limit,
+        max_concurrent_requests=plan.get("max_concurrent_requests") or settings.admission_default_concurrency,
+        requests_per_minute=plan.get("requests_per_minute") or settings.admission_default_requests_per_minute,
+        scheduling_weight=plan.get("scheduling_weight") or 1,
+    )
+
+
+class TenantCache:
+    """
+    In-process cache of the profile fields the webhook needs, keyed by client_api_key.
+
+    Entries expire after a TTL and the least recently used one is evicted once the
+    cache is full. Unknown keys are cached as negative entries (with a shorter TTL)
+    so junk traffic does not reach the database. `invalidate_owner` only drops this
+    process's entries; `invalidation_bus` calls it in the other processes too.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[TenantContext]]]" = OrderedDict()
+        self._keys_by_owner: Dict[str, Set[str]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, client_api_key: str) -> Optional[TenantContext]:
+        now = time.monotonic()
+        entry = self._entries.get(client_api_key)
+        if entry is not None:
+            expires_at, tenant = entry
+            if expires_at > now:
+                self._entries.move_to_end(client_api_key)
+                if tenant is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return tenant
+            self._remove(client_api_key)
+
+        self.misses += 1
+        # Concurrent misses on one key share a single lookup
+        loading = self._loading.get(client_api_key)
+        if loading is None:
+            loading = self._loading[client_api_key] = asyncio.ensure_future(self._fetch(client_api_key, now))
+            loading.add_done_callback(lambda _: self._loading.pop(client_api_key, None))
+        return await asyncio.shield(loading)
+
+    def invalidate_owner(self, owner_id: str):
+        for key in list(self._keys_by_owner.get(owner_id, ())):
+            self._remove(key)
+
+    async def preload(self, owner_ids: List[str]) -> int:
+        """Loads these tenants in one query, keyed as their webhook calls them; returns how many were found."""
+        now = time.monotonic()
+        rows = await profile_repository.tenants(owner_ids)
+        for row in rows:
+            self._store(row.get("api_key_generee") or row["id"], _tenant(row), now)
+        return len(rows)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_owner.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    async def _fetch(self, client_api_key: str, now: float) -> Optional[TenantContext]:
+        tenant = await self._load(client_api_key)
+        self._store(client_api_key, tenant, now)
+        return tenant
+
+    async def _load(self, client_api_key: str) -> Optional[TenantContext]:
+        # Both lookup columns are UUIDs: anything else can never match, so skip the round trip.
+        try:
+            uuid.UUID(client_api_key)
+        except ValueError:
+            return None
+
+        row = await profile_repository.find_tenant(client_api_key)
+        return _tenant(row) if row is not None else None
+
+    def _store(self, client_api_key: str, tenant: Optional[TenantContext], now: float):
+        ttl = self.ttl if tenant is not None else self.negative_ttl
+        self._entries[client_api_key] = (now + ttl, tenant)
+        self._entries.move_to_end(client_api_key)
+        if tenant is not None:
+            self._keys_by_owner.setdefault(tenant.owner_id, set()).add(client_api_key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, client_api_key: str):
+        _, tenant = self._entries.pop(client_api_key, (None, None))
+        if tenant is not None:
+            keys = self._keys_by_owner.get(tenant.owner_id)
+            if keys is not None:
+                keys.discard(client_api_key)
+                if not keys:
+                    del self._keys_by_owner[tenant.owner_id]
+
+
+tenant_cache = TenantCache(
+    ttl=settings.tenant_cache_ttl_seconds,
+    negative_ttl=settings.tenant_cache_negative_ttl_seconds,
+    max_entries=settings.tenant_cache_max_entries,
+)
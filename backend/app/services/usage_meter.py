@@ -0,0 +1,138 @@
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+from app.config import get_settings
+from app.repositories.billing import billing_repository
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def current_period() -> date:
+    """Usage is counted per calendar month (UTC)."""
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+@dataclass
+class _Counter:
+    flushed: int  # Total stored in usage_counters at the last load/flush (all processes)
+    pending: int = 0  # Counted here, not flushed yet
+    refreshed_at: float = 0.0
+
+
+class UsageMeter:
+    """
+    Per-tenant request counters for the current billing period.
+
+    Counts live in memory and are added to `usage_counters` every `flush_interval`
+    seconds with one atomic RPC for all tenants; the RPC returns the new totals, which
+    also brings in what other processes counted. A tenant's counter is loaded from the
+    table on first use in the period, and reloaded when it has been idle here for a
+    flush interval. Quota checks read memory only, so with several processes a tenant
+    can overshoot by what they count within one flush interval.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._counters: Dict[Tuple[str, date], _Counter] = {}
+        self._load_locks: Dict[Tuple[str, date], asyncio.Lock] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rejected = 0
+
+    async def try_consume(self, owner_id: str, limit: int) -> bool:
+        """Counts one request unless the tenant already reached `limit` this period."""
+        counter = await self._get(owner_id, current_period())
+        if counter.flushed + counter.pending >= limit:
+            self.rejected += 1
+            return False
+        counter.pending += 1
+        return True
+
+    async def usage(self, owner_id: str) -> int:
+        counter = await self._get(owner_id, current_period())
+        return counter.flushed + counter.pending
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final usage flush failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            deltas = {key: counter.pending for key, counter in self._counters.items() if counter.pending}
+            if not deltas:
+                return
+
+            payload = [
+                {"customer_id": owner_id, "period_start": period.isoformat(), "requests": delta}
+                for (owner_id, period), delta in deltas.items()
+            ]
+            rows = await billing_repository.increment_usage(payload)
+            totals = {(row["customer_id"], date.fromisoformat(row["period_start"])): row["requests"] for row in rows}
+
+            period = current_period()
+            for key, delta in deltas.items():
+                counter = self._counters[key]
+                counter.pending -= delta
+                counter.flushed = totals.get(key, counter.flushed + delta)
+                counter.refreshed_at = time.monotonic()
+            # Previous periods are done once flushed
+            for key in [k for k, c in self._counters.items() if k[1] != period and not c.pending]:
+                del self._counters[key]
+                self._load_locks.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "tenants": len(self._counters),
+            "pending": sum(c.pending for c in self._counters.values()),
+            "rejected": self.rejected,
+        }
+
+    async def _get(self, owner_id: str, period: date) -> _Counter:
+        key = (owner_id, period)
+        counter = self._counters.get(key)
+        if counter is not None and not self._stale(counter):
+            return counter
+
+        lock = self._load_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            counter = self._counters.get(key)
+            if counter is None or self._stale(counter):
+                flushed = await billing_repository.usage(owner_id, period)
+                if counter is None:
+                    counter = self._counters[key] = _Counter(flushed=flushed)
+                else:
+                    counter.flushed = max(counter.flushed, flushed)
+                counter.refreshed_at = time.monotonic()
+        return counter
+
+    def _stale(self, counter: _Counter) -> bool:
+        # Counters with pending requests get fresh totals from the next flush anyway
+        return not counter.pending and time.monotonic() - counter.refreshed_at > self.flush_interval
+
+
+usage_meter = UsageMeter(flush_interval=settings.usage_flush_interval_seconds)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import shutil
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from app.config import get_settings
+from app.repositories.documents import document_repository
+
+if TYPE_CHECKING:
+    import numpy as np
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+
+@dataclass
+class Passage:
+    section_id: int
+    content: str
+    score: float
+
+
+class _TenantIndex:
+    """Row-aligned section ids and L2-normalised float32 embeddings, memory-mapped from disk."""
+
+    def __init__(self, ids: "np.ndarray", matrix: "np.ndarray", mtime: float):
+        self.ids = ids
+        self.matrix = matrix
+        self.mtime = mtime
+
+
+class LocalVectorIndex:
+    """
+    Per-tenant embedding matrices built from `document_sections`.
+
+    Each tenant's index lives in `<vector_store_dir>/<owner_id>/` as two .npy files
+    (section ids and a contiguous float32 matrix) that are memory-mapped on first use,
+    so only the pages touched by a search are resident. A missing index is rebuilt from
+    the database; `invalidate` deletes this process's copy, and `invalidation_bus` calls
+    it in the other processes, which may be on hosts with their own vector_store_dir.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._indexes: Dict[str, _TenantIndex] = {}
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+
+    def _paths(self, owner_id: str) -> Tuple[str, str, str]:
+        directory = os.path.join(self.root, owner_id)
+        return directory, os.path.join(directory, "ids.npy"), os.path.join(directory, "embeddings.npy")
+
+    async def search(self, owner_id: str, query_embeddings: List[List[float]], top_k: int) -> List[List[Tuple[int, float]]]:
+        """Batched top-k cosine search. Returns (section_id, score) lists, one per query."""
+        index = await self._get(owner_id)
+        if index is None or len(index.ids) == 0:
+            return [[] for _ in query_embeddings]
+
+        import numpy as np
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+
+        scores = await asyncio.to_thread(np.matmul, queries, index.matrix.T)
+        k = min(top_k, scores.shape[1])
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([(int(index.ids[i]), float(row[i])) for i in top])
+        return results
+
+    async def size(self, owner_id: str) -> int:
+        index = await self._get(owner_id)
+        return 0 if index is None else len(index.ids)
+
+    def invalidate(self, owner_id: str):
+        self._indexes.pop(owner_id, None)
+        directory, _, _ = self._paths(owner_id)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    async def _get(self, owner_id: str) -> Optional[_TenantIndex]:
+        directory, ids_path, matrix_path = self._paths(owner_id)
+        try:
+            mtime = os.stat(matrix_path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        index = self._indexes.get(owner_id)
+        if index is not None and mtime == index.mtime:
+            return index
+
+        if mtime is None:
+            lock = self._build_locks.setdefault(owner_id, asyncio.Lock())
+            async with lock:
+                if not os.path.exists(matrix_path):
+                    await self._build(owner_id)
+            try:
+                mtime = os.stat(matrix_path).st_mtime
+            except FileNotFoundError:
+                return None
+
+        # Imported with the first index used (local retriever only), not at startup
+        import numpy as np
+        index = _TenantIndex(
+            ids=np.load(ids_path, mmap_mode="r"),
+            matrix=np.load(matrix_path, mmap_mode="r"),
+            mtime=mtime,
+        )
+        self._indexes[owner_id] = index
+        return index
+
+    async def _build(self, owner_id: str):
+        ids: List[int] = []
+        rows: List[List[float]] = []
+        async for page in document_repository.processed_sections(owner_id, "id, embedding", embedded_only=True):
+            for section in page:
+                embedding = section["embedding"]
+                if isinstance(embedding, str):
+                    embedding = json.loads(embedding)
+                ids.append(section["id"])
+                rows.append(embedding)
+        await asyncio.to_thread(self._write, owner_id, ids, rows)
+
+    def _write(self, owner_id: str, ids: List[int], rows: List[List[float]]):
+        import numpy as np
+        matrix = np.asarray(rows, dtype=np.float32).reshape(len(rows), settings.embedding_dimensions)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        directory, ids_path, matrix_path = self._paths(owner_id)
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename so readers never map a half-written file
+        np.save(ids_path + ".tmp.npy", np.asarray(ids, dtype=np.int64))
+        np.save(matrix_path + ".tmp.npy", np.ascontiguousarray(matrix))
+        os.replace(ids_path + ".tmp.npy", ids_path)
+        os.replace(matrix_path + ".tmp.npy", matrix_path)
+        logger.info(f"Built vector index for {owner_id}: {len(ids)} sections")
+
+
+async def fetch_passages(hits: List[Tuple[int, float]]) -> List[Passage]:
+    if not hits:
+        return []
+    contents = await document_repository.section_contents([h[0] for h in hits])
+    return [Passage(section_id, contents[section_id], score) for section_id, score in hits if section_id in contents]
+
+
+vector_index = LocalVectorIndex(settings.vector_store_dir)
@@ -0,0 +1,105 @@
+"""
+Webhook job worker: `python -m app.worker`.
+
+Consumes the queue filled by `/webhook/incoming` and runs `process_chat` for each job,
+so AI workloads can be scaled separately from the web process.
+"""
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+import signal
+from app.config import get_settings, SettingsError
+from app.services.gemini_service import gemini_service
+from app.services.manychat_service import manychat_service
+from app.services.job_queue import WorkerPool, job_queue
+from app.services.message_writer import message_writer
+from app.services.conversation_store import conversation_store
+from app.services.faq_index import faq_index
+from app.services.usage_meter import usage_meter
+from app.services.metrics import metrics, scrape_allowed
+from app.services.invalidation import invalidation_bus
+from app.services.runtime import create_worker_pool, render_metrics, warmup_steps
+from app.services.startup import startup
+from app.repositories.postgrest import postgrest
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def serve_metrics(pool: WorkerPool, port: int) -> asyncio.AbstractServer:
+    """Minimal HTTP endpoint so the worker process can be scraped too."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            authorization = None
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "authorization":
+                    authorization = value.strip()
+            if request_line.split(b" ")[1:2] != [b"/metrics"]:
+                body, status = b"Not Found\n", "404 Not Found"
+            elif not scrape_allowed(authorization):
+                body, status = b"Unauthorized\n", "401 Unauthorized"
+            else:
+                body, status = (await render_metrics(pool)).encode(), "200 OK"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, port=port)
+
+
+async def main():
+    try:
+        settings.check_required()
+    except SettingsError as e:
+        raise SystemExit(str(e))
+    if settings.queue_backend != "redis":
+        # The in-memory queue is only filled and consumed by the web process
+        raise SystemExit(
+            f"The worker needs the Redis queue (QUEUE_BACKEND is {settings.queue_backend!r}): set REDIS_URL"
+        )
+    startup.mark_imported(_import_started)
+    pool = create_worker_pool()
+    stop = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    message_writer.start()
+    usage_meter.start()
+    invalidation_bus.start()
+    metrics.start_loop_monitor(settings.metrics_loop_lag_interval_seconds)
+    # No readiness probe here: jobs just wait in the queue until warmup is done
+    await startup.warm_up(warmup_steps() if settings.warmup_enabled else {}, settings.warmup_timeout_seconds)
+    pool.start()
+    metrics_server = await serve_metrics(pool, settings.worker_metrics_port) if settings.worker_metrics_port else None
+    await stop.wait()
+
+    logger.info("Shutting down workers...")
+    if metrics_server is not None:
+        metrics_server.close()
+    await pool.stop()
+    await conversation_store.stop()
+    await faq_index.stop()
+    await usage_meter.stop()
+    await message_writer.stop()
+    await job_queue.close()
+    await invalidation_bus.stop()
+    await gemini_service.aclose()
+    await manychat_service.aclose()
+    await postgrest.aclose()
+    await metrics.stop_loop_monitor()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+"""
+Local stand-ins for the services the webhook path calls: Supabase (PostgREST and
+Storage), the Gemini REST API and ManyChat. Each fake answers just enough of its API
+for `process_chat` and ingestion to run, after an injected latency, and fails a given
+fraction of calls.
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class Behavior:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    calls: int = 0
+    errors: int = 0
+
+    async def delay(self, scale: float = 1.0):
+        seconds = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) * scale / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def fail(self) -> Optional[Response]:
+        """Counts the call; returns the injected error response, if this one fails."""
+        self.calls += 1
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            headers = {"Retry-After": "0.2"} if self.error_status == 429 else None
+            return JSONResponse({"error": "injected"}, status_code=self.error_status, headers=headers)
+        return None
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors}
+
+
+@dataclass
+class FakeTenant:
+    owner_id: str
+    api_key: str
+    manychat_api_key: str
+    requests_per_minute: int
+    max_concurrent_requests: int
+    coalesce_ms: int = 0
+
+    def profile(self) -> dict:
+        return {
+            "id": self.owner_id,
+            "api_key_generee": self.api_key,
+            "manychat_api_key": self.manychat_api_key,
+            "chatbot_prompt": None,
+            "gemini_file_store_id": f"fileSearchStores/bench-{self.owner_id[:8]}",
+            "message_coalesce_ms": self.coalesce_ms,
+            "subscriptions": {
+                "monthly_request_limit": 10_000_000,
+                "max_concurrent_requests": self.max_concurrent_requests,
+                "requests_per_minute": self.requests_per_minute,
+                "scheduling_weight": 1,
+            },
+        }
+
+
+def make_tenants(count: int, requests_per_minute: int, max_concurrent_requests: int, coalesce_ms: int = 0) -> List[FakeTenant]:
+    return [
+        FakeTenant(
+            owner_id=str(uuid.uuid4()),
+            api_key=str(uuid.uuid4()),
+            manychat_api_key=f"mc-{i}",
+            requests_per_minute=requests_per_minute,
+            max_concurrent_requests=max_concurrent_requests,
+            coalesce_ms=coalesce_ms,
+        )
+        for i in range(count)
+    ]
+
+
+def _eq(value: Optional[str]) -> Optional[str]:
+    return value[3:] if value and value.startswith("eq.") else None
+
+
+def _or_eq(value: Optional[str]) -> Dict[str, str]:
+    """`(a.eq.x,b.eq.y)` → {"a": "x", "b": "y"}; enough for the tenant lookup."""
+    conditions = {}
+    for condition in (value or "").strip("()").split(","):
+        column, _, rest = condition.partition(".")
+        if rest.startswith("eq."):
+            conditions[column] = rest[3:]
+    return conditions
+
+
+def postgrest_app(tenants: List[FakeTenant], behavior: Behavior) -> FastAPI:
+    """PostgREST and Storage: profiles resolve to the benchmark tenants, writes are accepted, other reads are empty."""
+    app = FastAPI()
+    by_key = {t.api_key: t for t in tenants}
+    by_id = {t.owner_id: t for t in tenants}
+    usage: Dict[tuple, int] = {}
+    rows_written: Dict[str, int] = {}
+
+    @app.api_route("/rest/v1/rpc/{function}", methods=["POST"])
+    async def rpc(function: str, request: Request):
+        await behavior.delay()
+        if (error := behavior.fail()) is not None:
+            return error
+        body = await request.json()
+        if function == "increment_usage":
+            result = []
+            for delta in body["deltas"]:
+                key = (delta["customer_id"], delta["period_start"])
+                usage[key] = usage.get(key, 0) + delta["requests"]
+                result.append({"customer_id": key[0], "period_start": key[1], "requests": usage[key]})
+            return result
+        return []
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "HEAD", "POST", "PATCH", "PUT", "DELETE"])
+    async def table(table: str, request: Request):
+        await behavior.delay()
+        if (error := behavior.fail()) is not None:
+            return error
+        params = request.query_params
+        if request.method == "HEAD":
+            return Response(headers={"Content-Range": "*/0"})
+        if request.method == "POST":
+            body = await request.json()
+            rows = body if isinstance(body, list) else [body]
+            rows_written[table] = rows_written.get(table, 0) + len(rows)
+            if "return=minimal" in request.headers.get("prefer", ""):
+                return Response(status_code=201)
+            return JSONResponse([{"id": i, **row} for i, row in enumerate(rows)], status_code=201)
+        if request.method != "GET":
+            return []
+        if table == "profiles" and params.get("id", "").startswith("in."):
+            return [by_id[i].profile() for i in params["id"][4:-1].split(",") if i in by_id]
+        if table == "profiles":
+            lookup = {**_or_eq(params.get("or")), **{k: _eq(params.get(k)) for k in ("api_key_generee", "id") if k in params}}
+            tenant = by_key.get(lookup.get("api_key_generee")) or by_id.get(lookup.get("id"))
+            return [tenant.profile()] if tenant else []
+        if table == "usage_counters" and "customer_id" not in params:
+            # Busiest tenants, for the warmup preload
+            ranked = sorted(usage.items(), key=lambda item: -item[1])[:int(params.get("limit", 100))]
+            return [{"customer_id": customer_id} for (customer_id, _), _ in ranked]
+        return []
+
+    @app.api_route("/storage/v1/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def storage(path: str):
+        await behavior.delay()
+        if (error := behavior.fail()) is not None:
+            return error
+        return {"Key": path}
+
+    app.state.rows_written = rows_written
+    return app
+
+
+ANSWER_SENTENCES = [
+    "Merci pour votre message.",
+    "Nos boutiques sont ouvertes du lundi au samedi, de 9h à 19h.",
+    "La livraison est gratuite à partir de 50 euros d'achat.",
+    "Vous pouvez retourner un article sous 30 jours avec le ticket de caisse.",
+    "Le paiement en trois fois sans frais est disponible en ligne.",
+    "N'hésitez pas si vous avez d'autres questions.",
+]
+
+
+def _answer(chars: int) -> str:
+    sentences = []
+    while sum(len(s) + 1 for s in sentences) < chars:
+        sentences.append(random.choice(ANSWER_SENTENCES))
+    return " ".join(sentences)
+
+
+def gemini_app(behavior: Behavior, answer_chars: int, stream_chunks: int) -> FastAPI:
+    """Gemini REST: generateContent, streamGenerateContent (SSE), embeddings, File Search stores and files."""
+    app = FastAPI()
+
+    @app.post("/v1beta/models/{target}")
+    async def model_call(target: str, request: Request):
+        await request.body()
+        _, _, method = target.partition(":")
+        if method == "streamGenerateContent":
+            if (error := behavior.fail()) is not None:
+                await behavior.delay()
+                return error
+            return StreamingResponse(_stream(behavior, _answer(answer_chars), stream_chunks), media_type="text/event-stream")
+
+        await behavior.delay()
+        if (error := behavior.fail()) is not None:
+            return error
+        if method == "generateContent":
+            return {"candidates": [{"content": {"role": "model", "parts": [{"text": _answer(answer_chars)}]}}]}
+        if method == "batchEmbedContents":
+            body = json.loads(await request.body())
+            return {"embeddings": [{"values": _vector()} for _ in body["requests"]]}
+        if method == "embedContent":
+            return {"embedding": {"values": _vector()}}
+        return JSONResponse({"error": f"unknown method {method}"}, status_code=404)
+
+    @app.post("/v1beta/fileSearchStores")
+    async def create_store():
+        await behavior.delay()
+        return {"name": f"fileSearchStores/{uuid.uuid4().hex[:12]}"}
+
+    @app.post("/v1beta/fileSearchStores/{target}")
+    async def import_file(target: str):
+        await behavior.delay()
+        return {"name": f"operations/{uuid.uuid4().hex[:12]}"}
+
+    @app.get("/v1beta/{name:path}")
+    async def get_resource(name: str):
+        await behavior.delay()
+        return {"name": name, "done": True}
+
+    @app.api_route("/upload/v1beta/files", methods=["POST"])
+    async def upload(request: Request):
+        await request.body()
+        await behavior.delay()
+        if request.headers.get("x-goog-upload-command") == "start":
+            return Response(headers={"x-goog-upload-url": f"{request.base_url}upload/v1beta/files"})
+        return {"file": {"name": f"files/{uuid.uuid4().hex[:12]}"}}
+
+    @app.delete("/v1beta/{name:path}")
+    async def delete(name: str):
+        return {}
+
+    return app
+
+
+async def _stream(behavior: Behavior, text: str, chunks: int):
+    # Time to first chunk is a fraction of the configured latency; the rest is spread over the chunks
+    await behavior.delay(0.3)
+    size = max(1, len(text) // chunks)
+    for start in range(0, len(text), size):
+        await behavior.delay(0.7 / chunks)
+        piece = {"candidates": [{"content": {"role": "model", "parts": [{"text": text[start:start + size]}]}}]}
+        yield f"data: {json.dumps(piece, ensure_ascii=False)}\r\n\r\n"
+
+
+def _vector(dimensions: int = 768) -> List[float]:
+    return [random.uniform(-1, 1) for _ in range(dimensions)]
+
+
+@dataclass
+class Delivery:
+    subscriber_id: str
+    text: str
+    received_at: float
+
+
+@dataclass
+class ManyChatFake:
+    behavior: Behavior
+    deliveries: int = 0
+    on_delivery: List[Callable[[Delivery], None]] = field(default_factory=list)
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/fb/subscriber/sendContent")
+        async def send_content(request: Request):
+            body = await request.json()
+            await self.behavior.delay()
+            if (error := self.behavior.fail()) is not None:
+                return error
+            self.deliveries += 1
+            delivery = Delivery(body["subscriber_id"], body["data"]["content"]["text"], time.perf_counter())
+            for callback in self.on_delivery:
+                callback(delivery)
+            return {"status": "success"}
+
+        @app.get("/fb/page/getInfo")
+        async def page_info():
+            return {"status": "success", "data": {"id": 1, "name": "Benchmark"}}
+
+        return app
@@ -0,0 +1,422 @@
+"""
+Webhook load test against local fakes: `python -m benchmarks.webhook_load` (from backend/).
+
+Starts fake Supabase, Gemini and ManyChat servers in this process and the API in a
+uvicorn subprocess pointed at them, then sends multi-tenant WhatsApp traffic to
+`/api/v1/webhook/incoming` at a fixed arrival rate. A turn ends when the fake ManyChat
+receives the first reply for that subscriber; each simulated user waits for its reply
+(plus a think time) before writing again.
+
+Reports webhook requests/sec and latency, end-to-end turn latency percentiles, the
+API's event-loop lag and per-stage latencies (scraped from its /metrics), and writes
+them as JSON. With `--baseline`, exits non-zero when p99 latency or throughput
+regressed by more than `--max-regression` against an earlier result.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+import httpx
+import uvicorn
+from benchmarks.fakes import Behavior, Delivery, FakeTenant, ManyChatFake, gemini_app, make_tenants, postgrest_app
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Any JWT-shaped string: supabase-py only checks the format
+FAKE_SERVICE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark"
+
+QUESTIONS = [
+    "Bonjour, quels sont vos horaires d'ouverture ?",
+    "Est-ce que la livraison est gratuite ?",
+    "Comment retourner un article ?",
+    "Je peux payer en plusieurs fois ?",
+    "Vous livrez en Belgique ?",
+    "Où en est ma commande ?",
+    "Avez-vous ce modèle en taille 42 ?",
+    "Quel est le délai de livraison pour Paris ?",
+    "Comment contacter le service client ?",
+    "Les soldes commencent quand ?",
+    "merci",
+    "Et pour un échange, c'est pareil ?",
+]
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)], 2)
+
+    return {"p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": round(ordered[-1], 2),
+            "mean": round(sum(ordered) / len(ordered), 2)}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def serve(app, port: int) -> Tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+class TurnTracker:
+    """Matches replies seen by the fake ManyChat to the turns waiting for them."""
+
+    def __init__(self):
+        self.pending: Dict[str, Deque[Tuple[float, asyncio.Future]]] = defaultdict(deque)
+        self.unmatched = 0
+
+    def start(self, subscriber_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[subscriber_id].append((time.perf_counter(), future))
+        return future
+
+    def on_delivery(self, delivery: Delivery):
+        queue = self.pending.get(delivery.subscriber_id)
+        # Later parts of a split or streamed reply have no turn waiting
+        if not queue:
+            return
+        started, future = queue.popleft()
+        if not future.done():
+            future.set_result((delivery.received_at - started) * 1000)
+
+
+class LoadGenerator:
+    def __init__(self, api_url: str, tenants: List[FakeTenant], tracker: TurnTracker, args: argparse.Namespace):
+        self.api_url = api_url
+        self.tenants = tenants
+        self.tracker = tracker
+        self.args = args
+        # Zipf-like popularity: a few busy tenants, a long tail of quiet ones
+        self.weights = [1 / (rank + 1) ** args.tenant_skew for rank in range(len(tenants))]
+        self.idle: Dict[str, List[str]] = {
+            t.owner_id: [f"{t.owner_id[:8]}-user-{u}" for u in range(args.users_per_tenant)] for t in tenants
+        }
+        self.request_latencies: List[float] = []
+        self.turn_latencies: List[float] = []
+        self.status_counts: Dict[str, int] = defaultdict(int)
+        self.no_idle_user = 0
+        self.missing_replies = 0
+        self.turns: List[asyncio.Task] = []
+
+    async def run(self, client: httpx.AsyncClient, duration: float, measure: bool):
+        deadline = time.perf_counter() + duration
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            # Open loop: Poisson arrivals, independent of how fast the API answers
+            next_at += random.expovariate(self.args.rps)
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tenant = random.choices(self.tenants, self.weights)[0]
+            users = self.idle[tenant.owner_id]
+            if not users:
+                self.no_idle_user += measure
+                continue
+            user = users.pop(random.randrange(len(users)))
+            self.turns.append(asyncio.create_task(self._turn(client, tenant, user, measure)))
+
+    async def _turn(self, client: httpx.AsyncClient, tenant: FakeTenant, user: str, measure: bool):
+        reply = self.tracker.start(user)
+        payload = {
+            "user_id": user,
+            "first_name": "Bench",
+            "last_text_input": random.choice(QUESTIONS),
+            "client_api_key": tenant.api_key,
+        }
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{self.api_url}/api/v1/webhook/incoming", json=payload)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if measure:
+            self.request_latencies.append((time.perf_counter() - started) * 1000)
+            self.status_counts[status] += 1
+
+        try:
+            if status != "200":
+                reply.cancel()
+                return
+            try:
+                latency = await asyncio.wait_for(asyncio.shield(reply), self.args.reply_timeout)
+                if measure:
+                    self.turn_latencies.append(latency)
+            except asyncio.TimeoutError:
+                self.missing_replies += measure
+            await asyncio.sleep(random.uniform(*self.args.think_time))
+        finally:
+            queue = self.tracker.pending.get(user)
+            if queue and queue[0][1] is reply:
+                queue.popleft()
+            self.idle[tenant.owner_id].append(user)
+
+
+async def start_api(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+    async with httpx.AsyncClient() as client:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError(f"API exited with code {process.returncode}")
+            try:
+                # /ready: warmup (pools, hot tenants) has run
+                if (await client.get(f"http://127.0.0.1:{port}/ready")).status_code == 200:
+                    return process
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("API did not become ready in 30s")
+
+
+def parse_metrics(text: str) -> Dict[str, dict]:
+    """Per-stage count, mean and bucket-estimated p99 (ms) from stage_duration_seconds, all tenants merged."""
+    buckets: Dict[str, Dict[float, float]] = defaultdict(lambda: defaultdict(float))
+    sums: Dict[str, float] = defaultdict(float)
+    counts: Dict[str, float] = defaultdict(float)
+    for line in text.splitlines():
+        if not line.startswith("stage_duration_seconds"):
+            continue
+        name, _, value = line.rpartition(" ")
+        labels = dict(part.split("=", 1) for part in name[name.index("{") + 1:-1].split(","))
+        stage = labels["stage"].strip('"')
+        if name.startswith("stage_duration_seconds_bucket"):
+            bound = labels["le"].strip('"')
+            buckets[stage][math.inf if bound == "+Inf" else float(bound)] += float(value)
+        elif name.startswith("stage_duration_seconds_sum"):
+            sums[stage] += float(value)
+        elif name.startswith("stage_duration_seconds_count"):
+            counts[stage] += float(value)
+
+    stages = {}
+    for stage, count in counts.items():
+        if not count:
+            continue
+        p99 = None
+        for bound, cumulative in sorted(buckets[stage].items()):
+            if cumulative >= 0.99 * count:
+                p99 = bound
+                break
+        stages[stage] = {
+            "count": int(count),
+            "mean_ms": round(sums[stage] / count * 1000, 2),
+            "p99_ms_upper_bound": None if p99 in (None, math.inf) else round(p99 * 1000, 2),
+        }
+    return stages
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> List[str]:
+    """Regressions beyond `max_regression` (relative) on throughput and p99 latencies."""
+    problems = []
+    checks = [
+        ("turns.per_second", lambda r: r["turns"]["per_second"], True),
+        ("turns.latency_ms.p99", lambda r: r["turns"]["latency_ms"]["p99"], False),
+        ("webhook.latency_ms.p99", lambda r: r["webhook"]["latency_ms"]["p99"], False),
+        ("event_loop_lag_ms.p99", lambda r: (r.get("event_loop_lag") or {}).get("p99_ms_upper_bound"), False),
+    ]
+    for name, get, higher_is_better in checks:
+        try:
+            now, before = get(result), get(baseline)
+        except (KeyError, TypeError):
+            continue
+        if not now or not before:
+            continue
+        change = (now - before) / before
+        print(f"  {name}: {before} -> {now} ({change:+.1%})")
+        if (change < -max_regression) if higher_is_better else (change > max_regression):
+            problems.append(f"{name} regressed {change:+.1%}")
+    return problems
+
+
+async def run(args: argparse.Namespace) -> dict:
+    tenants = make_tenants(args.tenants, args.tenant_rpm, args.tenant_concurrency, args.coalesce_ms)
+    postgrest = Behavior(args.postgrest_latency_ms, args.postgrest_jitter_ms, args.postgrest_error_rate)
+    gemini = Behavior(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_error_rate)
+    manychat = ManyChatFake(Behavior(args.manychat_latency_ms, args.manychat_jitter_ms, args.manychat_error_rate, 429))
+    tracker = TurnTracker()
+    manychat.on_delivery.append(tracker.on_delivery)
+
+    ports = {name: free_port() for name in ("postgrest", "gemini", "manychat", "api")}
+    servers = [
+        await serve(postgrest_app(tenants, postgrest), ports["postgrest"]),
+        await serve(gemini_app(gemini, args.answer_chars, args.stream_chunks), ports["gemini"]),
+        await serve(manychat.app(), ports["manychat"]),
+    ]
+    env = {
+        "SUPABASE_URL": f"http://127.0.0.1:{ports['postgrest']}",
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_SERVICE_KEY,
+        "SUPABASE_ANON_KEY": FAKE_SERVICE_KEY,
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_API_BASE_URL": f"http://127.0.0.1:{ports['gemini']}",
+        "GEMINI_HTTP2": "false",
+        "MANYCHAT_API_BASE_URL": f"http://127.0.0.1:{ports['manychat']}",
+        "QUEUE_BACKEND": "memory",
+        "STREAM_REPLIES_ENABLED": str(args.stream).lower(),
+        **dict(item.split("=", 1) for item in args.env),
+    }
+    api = await start_api(ports["api"], env)
+    api_url = f"http://127.0.0.1:{ports['api']}"
+    generator = LoadGenerator(api_url, tenants, tracker, args)
+
+    try:
+        limits = httpx.Limits(max_connections=args.client_connections, max_keepalive_connections=args.client_connections)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            if args.warmup:
+                print(f"Warming up for {args.warmup}s...")
+                await generator.run(client, args.warmup, measure=False)
+            print(f"Sending ~{args.rps} msg/s for {args.duration}s across {args.tenants} tenants...")
+            started = time.perf_counter()
+            await generator.run(client, args.duration, measure=True)
+            sending_time = time.perf_counter() - started
+            # Let the turns started during the run finish (or time out)
+            await asyncio.gather(*generator.turns, return_exceptions=True)
+            metrics_text = (await client.get(f"{api_url}/metrics")).text
+            health = (await client.get(f"{api_url}/health")).json()
+    finally:
+        api.terminate()
+        try:
+            api.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            api.kill()
+        for server, task in servers:
+            server.should_exit = True
+            await task
+
+    stages = parse_metrics(metrics_text)
+    sent = sum(generator.status_counts.values())
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "webhook": {
+            "sent": sent,
+            "statuses": dict(generator.status_counts),
+            "per_second": round(sent / sending_time, 2),
+            "latency_ms": percentiles(generator.request_latencies),
+            "skipped_no_idle_user": generator.no_idle_user,
+        },
+        "turns": {
+            "completed": len(generator.turn_latencies),
+            "missing_replies": generator.missing_replies,
+            "per_second": round(len(generator.turn_latencies) / sending_time, 2),
+            "latency_ms": percentiles(generator.turn_latencies),
+        },
+        "event_loop_lag": stages.pop("event_loop.lag", None),
+        "stages": stages,
+        "api": {
+            "admission_shed": health.get("admission", {}).get("shed"),
+            "manychat": health.get("manychat"),
+            "gemini_generate": health.get("gemini", {}).get("generate"),
+            "startup": health.get("startup"),
+        },
+        "fakes": {
+            "postgrest": postgrest.stats(),
+            "gemini": gemini.stats(),
+            "manychat": {**manychat.behavior.stats(), "deliveries": manychat.deliveries},
+        },
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    traffic = parser.add_argument_group("traffic")
+    traffic.add_argument("--rps", type=float, default=50, help="Webhook messages per second (Poisson arrivals)")
+    traffic.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    traffic.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds first (caches, pools)")
+    traffic.add_argument("--tenants", type=int, default=20)
+    traffic.add_argument("--tenant-skew", type=float, default=1.0, help="Zipf exponent of tenant popularity")
+    traffic.add_argument("--users-per-tenant", type=int, default=200)
+    traffic.add_argument("--think-time", type=float, nargs=2, default=(1.0, 5.0), metavar=("MIN", "MAX"),
+                         help="Seconds a user waits after a reply before writing again")
+    traffic.add_argument("--reply-timeout", type=float, default=60, help="A turn without reply after this is missing")
+    traffic.add_argument("--client-connections", type=int, default=200)
+
+    tenants = parser.add_argument_group("tenant plans")
+    tenants.add_argument("--tenant-rpm", type=int, default=6000, help="requests_per_minute of every tenant's plan")
+    tenants.add_argument("--tenant-concurrency", type=int, default=50, help="max_concurrent_requests of every plan")
+    tenants.add_argument("--coalesce-ms", type=int, default=0, help="message_coalesce_ms of every tenant")
+
+    fakes = parser.add_argument_group("fake upstreams")
+    fakes.add_argument("--postgrest-latency-ms", type=float, default=5)
+    fakes.add_argument("--postgrest-jitter-ms", type=float, default=2)
+    fakes.add_argument("--postgrest-error-rate", type=float, default=0.0)
+    fakes.add_argument("--gemini-latency-ms", type=float, default=1200)
+    fakes.add_argument("--gemini-jitter-ms", type=float, default=400)
+    fakes.add_argument("--gemini-error-rate", type=float, default=0.01)
+    fakes.add_argument("--manychat-latency-ms", type=float, default=80)
+    fakes.add_argument("--manychat-jitter-ms", type=float, default=30)
+    fakes.add_argument("--manychat-error-rate", type=float, default=0.01)
+    fakes.add_argument("--answer-chars", type=int, default=400)
+    fakes.add_argument("--stream-chunks", type=int, default=8, help="SSE chunks per streamed answer")
+
+    api = parser.add_argument_group("API under test")
+    api.add_argument("--stream", action="store_true", help="Run with STREAM_REPLIES_ENABLED")
+    api.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                     help="Extra setting for the API process, e.g. --env WORKER_CONCURRENCY=32")
+
+    output = parser.add_argument_group("results")
+    output.add_argument("--output", help="JSON file to write (default: benchmarks/results/<timestamp>-<commit>.json)")
+    output.add_argument("--baseline", help="Earlier result to compare with")
+    output.add_argument("--max-regression", type=float, default=0.2,
+                        help="Relative p99/throughput change treated as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(BACKEND_DIR, "benchmarks", "results", f"{stamp}-{result['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    webhook, turns = result["webhook"], result["turns"]
+    print(f"Webhook: {webhook['per_second']} req/s, statuses {webhook['statuses']}, latency {webhook['latency_ms']}")
+    print(f"Turns: {turns['completed']} completed ({turns['per_second']}/s), {turns['missing_replies']} missing, "
+          f"latency {turns['latency_ms']}")
+    print(f"Event-loop lag: {result['event_loop_lag']}")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} ({baseline.get('commit')}):")
+        problems = compare(result, baseline, args.max_regression)
+        if problems:
+            print("Regressions: " + "; ".join(problems))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+
+# Settings are read when app modules are imported; these keep the tests off any real project
+# and let the lifespans started by the tests pass check_required()
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-role-key")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
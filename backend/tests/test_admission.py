@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController, LoadShedError
+from app.services.tenant_cache import TenantContext
+
+
+def make_tenant(owner_id: str, concurrency: int = 1, rpm: int = 6000, weight: int = 1) -> TenantContext:
+    return TenantContext(owner_id=owner_id, manychat_api_key="k", chatbot_prompt=None, gemini_file_store_id=None,
+                         max_concurrent_requests=concurrency, requests_per_minute=rpm, scheduling_weight=weight)
+
+
+def make_controller(**overrides) -> AdmissionController:
+    options = dict(max_in_flight=4, max_queued=100, max_queued_per_tenant=10, max_wait=5.0, burst_seconds=1.0)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+async def job(controller, tenant, log, name, hold: float = 0.0):
+    async with controller.slot(tenant):
+        log.append(name)
+        await asyncio.sleep(hold)
+
+
+def test_tenant_concurrency_cap_queues_its_own_jobs():
+    controller = make_controller()
+    tenant = make_tenant("a", concurrency=1)
+    log = []
+
+    async def scenario():
+        first = asyncio.create_task(job(controller, tenant, log, "first", hold=0.05))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(job(controller, tenant, log, "second"))
+        await asyncio.sleep(0.01)
+        queued = controller.tenant_stats("a")["queued"]
+        await asyncio.gather(first, second)
+        return queued
+
+    assert asyncio.run(scenario()) == 1
+    assert log == ["first", "second"]
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_empty_token_bucket_sheds():
+    controller = make_controller()
+    tenant = make_tenant("a", concurrency=5, rpm=60)  # Burst of one request
+
+    async def scenario():
+        await job(controller, tenant, [], "first")
+        with pytest.raises(LoadShedError, match="rate limit"):
+            await job(controller, tenant, [], "second")
+
+    asyncio.run(scenario())
+    assert controller.tenant_stats("a")["shed"] == 1
+
+
+def test_full_tenant_queue_and_long_wait_shed():
+    controller = make_controller(max_queued_per_tenant=1, max_wait=0.05)
+    tenant = make_tenant("a", concurrency=1)
+
+    async def scenario():
+        running = asyncio.create_task(job(controller, tenant, [], "running", hold=0.2))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(job(controller, tenant, [], "waiting"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LoadShedError, match="queue full"):
+            await job(controller, tenant, [], "rejected")
+        with pytest.raises(LoadShedError, match="waited more than"):
+            await waiting
+        await running
+
+    asyncio.run(scenario())
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_waiting_jobs_are_served_by_weight():
+    controller = make_controller(max_in_flight=1)
+    light, heavy = make_tenant("light", concurrency=1, weight=1), make_tenant("heavy", concurrency=1, weight=3)
+    log = []
+
+    async def scenario():
+        blocker = asyncio.create_task(job(controller, make_tenant("other"), log, "blocker", hold=0.05))
+        await asyncio.sleep(0.01)
+        jobs = [asyncio.create_task(job(controller, tenant, log, tenant.owner_id))
+                for _ in range(4) for tenant in (light, heavy)]
+        await asyncio.gather(blocker, *jobs)
+
+    asyncio.run(scenario())
+    first_four = log[1:5]
+    assert first_four.count("heavy") == 3
+
+
+def test_tenant_back_from_idle_does_not_spend_old_credit():
+    controller = make_controller(max_in_flight=1)
+    busy, idle = make_tenant("busy"), make_tenant("idle")
+    log = []
+
+    async def scenario():
+        for _ in range(6):
+            await job(controller, busy, [], "warmup")
+        blocker = asyncio.create_task(job(controller, make_tenant("other"), log, "blocker", hold=0.05))
+        await asyncio.sleep(0.01)
+        jobs = [asyncio.create_task(job(controller, tenant, log, tenant.owner_id))
+                for _ in range(3) for tenant in (idle, busy)]
+        await asyncio.gather(blocker, *jobs)
+
+    asyncio.run(scenario())
+    assert log[1:5].count("idle") == 2
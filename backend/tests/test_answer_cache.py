@@ -0,0 +1,93 @@
+import asyncio
+from app.services import rag_service
+from app.services.answer_cache import AnswerCache
+from app.services.conversation_store import Conversation, Turn
+from app.services.rag_service import is_context_free
+from app.services.tenant_cache import TenantContext
+
+TENANT = TenantContext(owner_id="owner", manychat_api_key="k", chatbot_prompt=None, gemini_file_store_id="store")
+
+
+def make_cache() -> AnswerCache:
+    return AnswerCache(ttl=60.0, max_entries_per_tenant=10, max_tenants=10)
+
+
+def test_normalised_question_hits_and_invalidation_clears():
+    cache = make_cache()
+
+    async def scenario():
+        lookup = await cache.lookup("owner", None, "Quels sont vos horaires ?")
+        cache.store(lookup, "9h-18h", 800.0)
+        hit = await cache.lookup("owner", None, "quels sont vos HORAIRES")
+        cache.invalidate_owner("owner")
+        miss = await cache.lookup("owner", None, "quels sont vos horaires")
+        return hit.answer, miss.answer
+
+    assert asyncio.run(scenario()) == ("9h-18h", None)
+    assert cache.tenant_stats("owner")["exact_hits"] == 1
+
+
+def test_answer_generated_before_an_invalidation_is_not_stored():
+    cache = make_cache()
+
+    async def scenario():
+        lookup = await cache.lookup("owner", None, "horaires")
+        cache.invalidate_owner("owner")
+        cache.store(lookup, "ancienne réponse", 800.0)
+        return (await cache.lookup("owner", None, "horaires")).answer
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_context_free_questions():
+    assert is_context_free("Quels sont vos horaires d'ouverture ?")
+    assert is_context_free("Livrez-vous à Lyon ?")
+    assert not is_context_free("Et le samedi ?")
+    assert not is_context_free("Ça coûte combien ?")
+    assert not is_context_free("Il est disponible en rouge ?")
+    assert not is_context_free("Le prix ?")
+
+
+def run_query(monkeypatch, cache, query, conversation):
+    generated = []
+
+    class Retriever:
+        async def has_documents(self, tenant):
+            return True
+
+        async def generate(self, query, tenant, summary, history, on_chunk):
+            generated.append(query)
+            return f"réponse à {query}"
+
+    monkeypatch.setattr(rag_service.settings, "faq_fast_path_enabled", False)
+    monkeypatch.setattr(rag_service.settings, "answer_cache_enabled", True)
+    monkeypatch.setattr(rag_service, "retriever", Retriever())
+    monkeypatch.setattr(rag_service, "answer_cache", cache)
+    return asyncio.run(rag_service.process_rag_query(query, TENANT, conversation)), generated
+
+
+def test_mid_conversation_standalone_question_uses_the_cache(monkeypatch):
+    cache = make_cache()
+    conversation = Conversation(turns=[Turn("user", "Bonjour"), Turn("model", "Bonjour, que puis-je faire ?")])
+
+    run_query(monkeypatch, cache, "Quels sont vos horaires d'ouverture ?", None)
+    answer, generated = run_query(monkeypatch, cache, "Quels sont vos horaires d'ouverture ?", conversation)
+
+    assert answer == "réponse à Quels sont vos horaires d'ouverture ?"
+    assert generated == []
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_follow_up_skips_the_cache_and_is_not_stored(monkeypatch):
+    cache = make_cache()
+    conversation = Conversation(turns=[Turn("user", "Vous avez la veste bleue ?"), Turn("model", "Oui.")])
+
+    _, generated = run_query(monkeypatch, cache, "Et elle coûte combien ?", conversation)
+    _, generated_again = run_query(monkeypatch, cache, "Quels sont vos horaires d'ouverture ?", conversation)
+
+    stats = cache.stats()
+    assert generated == ["Et elle coûte combien ?"]
+    assert generated_again == ["Quels sont vos horaires d'ouverture ?"]
+    assert stats["context_skips"] == 1
+    assert stats["lookups"] == 1
+    assert stats["stores"] == 0
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app.services import auth_service
+from app.services.auth_service import TokenVerifier
+
+SECRET = "a-real-project-secret"
+
+
+def make_verifier(secret: str) -> TokenVerifier:
+    return TokenVerifier(
+        secret=secret, audience="authenticated", jwks_url="http://localhost/jwks", jwks_ttl=3600,
+        claims_ttl=60, max_entries=100, revocation_check=False,
+    )
+
+
+def make_token(secret: str, role: str = "account_user", sub: str = "user-1") -> str:
+    claims = {"sub": sub, "aud": "authenticated", "exp": int(time.time()) + 3600, "user_metadata": {"role": role}}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def fake_auth_server(monkeypatch, user):
+    calls = []
+
+    def get_user(token):
+        calls.append(token)
+        return SimpleNamespace(user=user)
+
+    client = SimpleNamespace(auth=SimpleNamespace(get_user=get_user))
+    monkeypatch.setattr(auth_service, "get_supabase", lambda: client)
+    return calls
+
+
+def test_token_signed_with_the_project_secret_is_accepted():
+    user = asyncio.run(make_verifier(SECRET).verify(make_token(SECRET)))
+    assert user == {"id": "user-1", "email": None, "role": "account_user"}
+
+
+def test_token_signed_with_another_secret_is_refused():
+    with pytest.raises(Exception):
+        asyncio.run(make_verifier(SECRET).verify(make_token("another-secret")))
+
+
+@pytest.mark.parametrize("secret", ["", "your-jwt-secret-key", "your-jwt-secret"])
+def test_placeholder_secret_never_verifies_locally(monkeypatch, secret):
+    calls = fake_auth_server(monkeypatch, None)
+    forged = make_token("your-jwt-secret-key", role="global_admin")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(make_verifier(secret).verify(forged))
+
+    assert error.value.status_code == 401
+    assert calls == [forged]
+
+
+def test_without_secret_the_auth_server_user_is_used(monkeypatch):
+    user = SimpleNamespace(id="user-2", email="a@b.c", user_metadata={"role": "account_user"})
+    fake_auth_server(monkeypatch, user)
+    # The role comes from the auth server, not from the (unverified) token
+    token = make_token("unknown-secret", role="global_admin", sub="user-2")
+
+    verifier = make_verifier("")
+    assert asyncio.run(verifier.verify(token)) == {"id": "user-2", "email": "a@b.c", "role": "account_user"}
+    assert asyncio.run(verifier.verify(token))["id"] == "user-2"
+    assert verifier.hits == 1
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import customers
+from app.services.auth_service import get_current_user
+from app.services.coalescer import MessageCoalescer
+
+
+def test_burst_is_merged_by_the_first_caller():
+    async def scenario():
+        coalescer = MessageCoalescer(max_wait=1.0, max_messages=10)
+        leader = asyncio.create_task(coalescer.submit("owner", "u1", "bonjour", window=0.05))
+        await asyncio.sleep(0.01)
+        followers = [await coalescer.submit("owner", "u1", text, window=0.05) for text in ("je voudrais", "un devis")]
+        return await leader, followers, coalescer.stats()
+
+    merged, followers, stats = asyncio.run(scenario())
+    assert merged == "bonjour\nje voudrais\nun devis"
+    assert followers == [None, None]
+    assert stats == {"open_bursts": 0, "bursts": 1, "merged_messages": 3}
+
+
+def test_users_and_owners_are_coalesced_separately():
+    async def scenario():
+        coalescer = MessageCoalescer(max_wait=1.0, max_messages=10)
+        return await asyncio.gather(
+            coalescer.submit("owner", "u1", "a", window=0.02),
+            coalescer.submit("owner", "u2", "b", window=0.02),
+            coalescer.submit("other", "u1", "c", window=0.02),
+        )
+
+    assert asyncio.run(scenario()) == ["a", "b", "c"]
+
+
+def test_max_messages_closes_the_burst_early():
+    async def scenario():
+        coalescer = MessageCoalescer(max_wait=5.0, max_messages=2)
+        started = time.monotonic()
+        leader = asyncio.create_task(coalescer.submit("owner", "u1", "un", window=5.0))
+        await asyncio.sleep(0)
+        await coalescer.submit("owner", "u1", "deux", window=5.0)
+        return await leader, time.monotonic() - started
+
+    merged, elapsed = asyncio.run(scenario())
+    assert merged == "un\ndeux"
+    assert elapsed < 1.0
+
+
+def test_max_wait_bounds_a_burst_that_keeps_going():
+    async def scenario():
+        coalescer = MessageCoalescer(max_wait=0.1, max_messages=100)
+        started = time.monotonic()
+        leader = asyncio.create_task(coalescer.submit("owner", "u1", "0", window=0.05))
+        await asyncio.sleep(0)
+        # Each message would push the deadline another window away; max_wait caps it
+        while not leader.done():
+            await coalescer.submit("owner", "u1", "encore", window=0.05)
+            await asyncio.sleep(0.01)
+        return await leader, time.monotonic() - started
+
+    merged, elapsed = asyncio.run(scenario())
+    assert merged.startswith("0\nencore")
+    assert elapsed < 0.3
+
+
+def test_null_coalesce_window_is_rejected_before_reaching_the_profile(monkeypatch):
+    updates = []
+
+    async def update(owner_id, data, returning=None):
+        updates.append(data)
+        return [data]
+
+    async def invalidate(owner_id, *kinds):
+        pass
+
+    monkeypatch.setattr(customers.profile_repository, "update", update)
+    monkeypatch.setattr(customers.invalidation_bus, "invalidate", invalidate)
+    app = FastAPI()
+    app.include_router(customers.router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "owner"}
+    with TestClient(app) as client:
+        rejected = client.patch("/customers/me", json={"message_coalesce_ms": None})
+        accepted = client.patch("/customers/me", json={"company_name": "Boulangerie", "message_coalesce_ms": 0})
+
+    assert rejected.status_code == 422
+    assert accepted.status_code == 200
+    assert updates == [{"company_name": "Boulangerie", "message_coalesce_ms": 0}]
@@ -0,0 +1,94 @@
+import asyncio
+from app.services import conversation_store as conversation_store_module
+from app.services.conversation_store import ConversationStore
+
+
+class FakeMessages:
+    """The messages table and its conversations summary, shared by every store."""
+
+    def __init__(self):
+        self.rows = []
+        self.count_checks = 0
+
+    def write(self, direction, content):
+        self.rows.append({"direction": direction, "content": content})
+
+    async def recent(self, owner_id, user_phone, since, limit):
+        return self.rows[-limit:]
+
+    async def message_count(self, owner_id, user_phone):
+        self.count_checks += 1
+        return len(self.rows)
+
+
+def new_store():
+    return ConversationStore(max_turns=10, max_conversations=100, idle_reset=3600, summary_max_chars=500)
+
+
+def answer(store, messages, question, reply):
+    """One turn as the webhook handles it: load, write the inbound row, answer, write the outbound row."""
+    async def turn():
+        conversation = await store.get("owner", "+33600000000")
+        messages.write("inbound", question)
+        store.record(conversation, question, reply)
+        messages.write("outbound", reply)
+        return conversation
+    return asyncio.run(turn())
+
+
+def texts(conversation):
+    return [turn.text for turn in conversation.turns]
+
+
+def test_turns_answered_by_another_process_are_reloaded(monkeypatch):
+    messages = FakeMessages()
+    monkeypatch.setattr(conversation_store_module, "message_repository", messages)
+    web, worker = new_store(), new_store()
+
+    answer(web, messages, "Bonjour", "Bonjour !")
+    answer(worker, messages, "Vous livrez à Lyon ?", "Oui, en 48h.")
+    conversation = answer(web, messages, "Et à Nice ?", "Aussi.")
+
+    assert texts(conversation) == ["Bonjour", "Bonjour !", "Vous livrez à Lyon ?", "Oui, en 48h.", "Et à Nice ?", "Aussi."]
+    assert web.stats()["refreshes"] == 1 and web.stats()["loads"] == 2
+
+
+def test_own_turns_are_not_reloaded(monkeypatch):
+    messages = FakeMessages()
+    monkeypatch.setattr(conversation_store_module, "message_repository", messages)
+    store = new_store()
+
+    answer(store, messages, "Bonjour", "Bonjour !")
+    conversation = answer(store, messages, "Vos horaires ?", "9h-18h.")
+
+    assert texts(conversation) == ["Bonjour", "Bonjour !", "Vos horaires ?", "9h-18h."]
+    assert store.stats()["loads"] == 1 and store.stats()["refreshes"] == 0
+
+
+def test_pending_writes_keep_the_cached_turns(monkeypatch):
+    # Write-behind: this process's rows may not be in the table yet when the next turn starts
+    messages = FakeMessages()
+    monkeypatch.setattr(conversation_store_module, "message_repository", messages)
+    store = new_store()
+
+    async def scenario():
+        conversation = await store.get("owner", "+33600000000")
+        store.record(conversation, "Bonjour", "Bonjour !")
+        return await store.get("owner", "+33600000000")
+
+    assert texts(asyncio.run(scenario())) == ["Bonjour", "Bonjour !"]
+    assert store.stats()["refreshes"] == 0
+
+
+def test_unreachable_table_keeps_the_cached_turns(monkeypatch):
+    messages = FakeMessages()
+    monkeypatch.setattr(conversation_store_module, "message_repository", messages)
+    store = new_store()
+    answer(store, messages, "Bonjour", "Bonjour !")
+
+    async def unavailable(owner_id, user_phone):
+        raise ConnectionError("database down")
+
+    monkeypatch.setattr(messages, "message_count", unavailable)
+    conversation = asyncio.run(store.get("owner", "+33600000000"))
+    assert texts(conversation) == ["Bonjour", "Bonjour !"]
@@ -0,0 +1,85 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import documents
+from app.repositories.postgrest import PostgrestError, UNIQUE_VIOLATION
+from app.services.auth_service import get_current_user
+from app.services.pdf_worker import PdfAnalysis
+
+PDF = b"%PDF-1.4 contenu du guide"
+EXISTING = {"id": 12, "status": "processed", "gemini_file_name": "files/abc"}
+
+
+class FakeDocuments:
+    """Document repository with one stored document, optionally hidden from the first lookup."""
+
+    def __init__(self, existing, visible_at_first=True):
+        self.existing = existing
+        self.visible = visible_at_first
+        self.created = []
+
+    async def find_by_hash(self, owner_id, content_hash):
+        found = self.existing if self.visible else None
+        self.visible = True
+        return found
+
+    async def create(self, row):
+        self.created.append(row)
+        raise PostgrestError(409, "duplicate key value violates unique constraint", code=UNIQUE_VIOLATION)
+
+    async def update(self, document_id, row):
+        raise AssertionError("a duplicate must not be ingested again")
+
+
+@pytest.fixture
+def upload(monkeypatch):
+    spooled = []
+    real_spool = documents.spool_upload
+
+    async def spool(request):
+        spooled.append(await real_spool(request))
+        return spooled[-1]
+
+    async def validate_pdf(path):
+        return PdfAnalysis(valid=True, message="", page_count=3)
+
+    def submit(*args):
+        raise AssertionError("a duplicate must not be ingested again")
+
+    monkeypatch.setattr(documents, "spool_upload", spool)
+    monkeypatch.setattr(documents, "validate_pdf", validate_pdf)
+    monkeypatch.setattr(documents.ingestion_service, "submit", submit)
+    app = FastAPI()
+    app.include_router(documents.router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "owner"}
+
+    def post(repository):
+        monkeypatch.setattr(documents, "document_repository", repository)
+        with TestClient(app) as client:
+            response = client.post("/documents/upload", files={"file": ("guide.pdf", PDF, "application/pdf")})
+        return response, spooled[-1]
+
+    return post
+
+
+def test_same_content_returns_the_existing_document(upload):
+    repository = FakeDocuments(EXISTING)
+    response, spooled = upload(repository)
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "This document has already been uploaded", "document_id": 12, "status": "processed",
+        "gemini_file_name": "files/abc", "duplicate": True,
+    }
+    assert repository.created == []
+    assert not os.path.exists(spooled.path)
+
+
+def test_concurrent_upload_losing_the_race_returns_the_winner(upload):
+    # find_by_hash misses, then the partial unique index rejects the insert: the winner's row is returned
+    repository = FakeDocuments(EXISTING, visible_at_first=False)
+    response, spooled = upload(repository)
+    assert response.status_code == 200
+    assert response.json()["document_id"] == 12 and response.json()["duplicate"] is True
+    assert repository.created[0]["content_hash"] == spooled.sha256
+    assert not os.path.exists(spooled.path)
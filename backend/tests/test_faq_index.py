@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import faq_index as faq_module
+from app.services.faq_index import Bm25Index, FaqIndex, _TenantFaq, snippet, tokenize
+
+QA = [
+    ("Quels sont vos horaires d'ouverture ?", "Du lundi au samedi, de 9h à 19h."),
+    ("Quel est le prix de la livraison ?", "La livraison est gratuite dès 50 euros."),
+    ("Comment retourner un article ?", "Sous 30 jours, avec le ticket de caisse."),
+]
+PASSAGE = (
+    "Conditions générales de vente. Les prix sont indiqués toutes taxes comprises. "
+    "La livraison standard prend trois à cinq jours ouvrés en France métropolitaine. "
+    "Les horaires du service client sont du lundi au vendredi. "
+    "Le retour d'un article est possible sous trente jours avec la facture. " * 4
+)
+
+
+def make_index(passages_enabled: bool) -> FaqIndex:
+    index = FaqIndex(ttl=600, max_tenants=10, qa_threshold=0.85, passage_threshold=0.6, min_coverage=0.8,
+                     passages_enabled=passages_enabled, passage_min_terms=3, snippet_chars=200)
+
+    async def build(owner_id):
+        return _TenantFaq(QA, [PASSAGE] if passages_enabled else [], 0.0)
+
+    index._build = build
+    index.ttl = float("inf")
+    return index
+
+
+def match(index: FaqIndex, query: str):
+    return asyncio.run(index.match("owner", query))
+
+
+def test_verbatim_question_is_answered_from_the_qa_pair():
+    result = match(make_index(False), "Quels sont vos horaires d'ouverture ?")
+    assert result is not None and result.kind == "qa"
+    assert result.answer == "Du lundi au samedi, de 9h à 19h."
+
+
+def test_question_with_extra_terms_falls_back():
+    assert match(make_index(False), "Quels sont vos horaires d'ouverture le dimanche de Pâques ?") is None
+
+
+@pytest.mark.parametrize("query", ["prix", "livraison", "Quels sont vos horaires ?"])
+def test_short_queries_never_answer_from_document_text(query):
+    result = match(make_index(True), query)
+    assert result is None or result.kind == "qa"
+
+
+def test_passage_answers_are_off_by_default_and_a_snippet_when_on():
+    query = "livraison standard en France métropolitaine"
+    assert match(make_index(False), query) is None
+    result = match(make_index(True), query)
+    assert result is not None and result.kind == "passage"
+    assert "livraison standard" in result.answer
+    assert len(result.answer) <= 200
+
+
+def test_long_passage_mentioning_one_term_scores_low():
+    index = Bm25Index([tokenize(PASSAGE), tokenize("Horaires du magasin")])
+    hit = index.best(tokenize("prix"), length_aware=True)
+    assert hit.doc_id == 0
+    assert hit.confidence < 0.95
+    assert hit.matched_terms == 1
+
+
+def test_unknown_terms_count_against_confidence():
+    index = Bm25Index([tokenize(q) for q, _ in QA])
+    exact = index.best(tokenize(QA[1][0]))
+    partial = index.best(tokenize(QA[1][0] + " remboursement garantie"))
+    assert exact.doc_id == partial.doc_id == 1
+    assert partial.confidence < exact.confidence
+    assert partial.coverage < 1.0
+
+
+def test_snippet_keeps_the_sentences_about_the_query():
+    text = snippet(PASSAGE, tokenize("retour article"), 120)
+    assert text.startswith("Le retour d'un article")
+    assert len(text) <= 120
+
+
+def rebuilding_index():
+    """An index whose builds wait for `release` and read the current `qa` list."""
+    index = FaqIndex(ttl=600, max_tenants=10, qa_threshold=0.85, passage_threshold=0.6, min_coverage=0.8,
+                     passages_enabled=False, passage_min_terms=3, snippet_chars=200)
+    state = {"qa": list(QA), "builds": 0, "release": None}
+
+    async def build(owner_id):
+        state["builds"] += 1
+        qa = list(state["qa"])
+        if state["release"] is not None:
+            await state["release"].wait()
+        return _TenantFaq(qa, [], time.monotonic())
+
+    index._build = build
+    return index, state
+
+
+def test_changed_faq_is_rebuilt_in_the_background_while_the_old_one_answers():
+    index, state = rebuilding_index()
+    question = "Quels sont vos horaires d'ouverture ?"
+
+    async def scenario():
+        await index.match("owner", question)
+        state["qa"] = [(question, "Tous les jours, de 8h à 20h.")]
+        state["release"] = asyncio.Event()
+        index.invalidate("owner")
+
+        # The rebuild is waiting on the database: the question is answered from the previous index
+        during = await asyncio.wait_for(index.match("owner", question), 0.5)
+        state["release"].set()
+        await asyncio.sleep(0.01)
+        after = await index.match("owner", question)
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert during.answer == "Du lundi au samedi, de 9h à 19h."
+    assert after.answer == "Tous les jours, de 8h à 20h."
+    assert index.stats()["rebuilt"] == 1
+
+
+def test_change_during_a_rebuild_is_read_by_another_one():
+    index, state = rebuilding_index()
+    question = "Comment retourner un article ?"
+
+    async def scenario():
+        await index.match("owner", question)
+        state["release"] = asyncio.Event()
+        index.invalidate("owner")
+        await asyncio.sleep(0)
+        # Saved after the rebuild read the pairs
+        state["qa"] = [(question, "Sous 60 jours.")]
+        index.invalidate("owner")
+        state["release"].set()
+        await asyncio.sleep(0.01)
+        return await index.match("owner", question)
+
+    assert asyncio.run(scenario()).answer == "Sous 60 jours."
+    assert state["builds"] == 3
+
+
+def test_expired_index_is_refreshed_without_waiting():
+    index, state = rebuilding_index()
+
+    async def scenario():
+        await index.match("owner", "Quel est le prix de la livraison ?")
+        index._tenants["owner"].built_at -= index.ttl
+        state["release"] = asyncio.Event()
+        answer = await asyncio.wait_for(index.match("owner", "Quel est le prix de la livraison ?"), 0.5)
+        state["release"].set()
+        await asyncio.sleep(0.01)
+        return answer
+
+    assert asyncio.run(scenario()) is not None
+    assert state["builds"] == 2
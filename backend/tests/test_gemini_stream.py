@@ -0,0 +1,109 @@
+import asyncio
+import json
+import httpx
+from app.services import rag_service
+from app.services.answer_cache import CacheLookup
+from app.services.gemini_service import GeminiService, TruncatedAnswer
+from app.services.tenant_cache import TenantContext
+
+
+def sse(text: str) -> bytes:
+    return f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]})}\n\n".encode()
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    def __init__(self, events, broken: bool):
+        self.events = events
+        self.broken = broken
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+        if self.broken:
+            raise httpx.ReadError("connection reset")
+
+
+def stream_answer(broken: bool):
+    service = GeminiService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=BrokenStream([sse("Bonjour, "), sse("nos horaires")], broken))
+    ))
+    chunks = []
+
+    async def on_chunk(text):
+        chunks.append(text)
+
+    async def scenario():
+        try:
+            return await service._generate_stream({"contents": []}, on_chunk)
+        finally:
+            await service.aclose()
+
+    return service, asyncio.run(scenario()), chunks
+
+
+def test_interrupted_stream_is_reported_as_truncated():
+    service, answer, chunks = stream_answer(broken=True)
+
+    assert answer == "Bonjour, nos horaires"
+    assert isinstance(answer, TruncatedAnswer)
+    assert chunks == ["Bonjour, ", "nos horaires"]
+    assert service.stats()["truncated_streams"] == 1
+
+
+def test_complete_stream_is_a_plain_answer():
+    service, answer, _ = stream_answer(broken=False)
+
+    assert answer == "Bonjour, nos horaires"
+    assert not isinstance(answer, TruncatedAnswer)
+    assert service.stats()["truncated_streams"] == 0
+
+
+def test_truncated_answer_is_not_cached(monkeypatch):
+    stored = []
+    tenant = TenantContext(owner_id="owner", manychat_api_key="k", chatbot_prompt=None, gemini_file_store_id="store")
+
+    class Retriever:
+        async def has_documents(self, tenant):
+            return True
+
+        async def generate(self, query, tenant, summary, history, on_chunk):
+            return TruncatedAnswer("Bonjour, nos hor")
+
+    class Cache:
+        async def lookup(self, owner_id, custom_prompt, query):
+            return CacheLookup(owner_id=owner_id, scope=(owner_id, ""), key=query, generation=0)
+
+        def store(self, lookup, answer, generation_ms):
+            stored.append(answer)
+
+    monkeypatch.setattr(rag_service.settings, "faq_fast_path_enabled", False)
+    monkeypatch.setattr(rag_service.settings, "answer_cache_enabled", True)
+    monkeypatch.setattr(rag_service, "retriever", Retriever())
+    monkeypatch.setattr(rag_service, "answer_cache", Cache())
+
+    answer = asyncio.run(rag_service.process_rag_query("horaires ?", tenant))
+
+    assert answer == "Bonjour, nos hor"
+    assert stored == []
+
+
+def test_generation_slot_is_held_while_the_stream_is_read():
+    service = GeminiService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=BrokenStream([sse("Bonjour, "), sse("nos horaires")], False))
+    ))
+    in_flight = []
+
+    async def on_chunk(text):
+        in_flight.append(service.generation.limiter.in_flight)
+
+    async def scenario():
+        try:
+            return await service._generate_stream({"contents": []}, on_chunk)
+        finally:
+            await service.aclose()
+
+    asyncio.run(scenario())
+    assert in_flight == [1, 1]
+    assert service.generation.limiter.in_flight == 0
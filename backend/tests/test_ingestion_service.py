@@ -0,0 +1,69 @@
+import asyncio
+from app.services import ingestion_service as ingestion_module
+from app.services.ingestion_service import IngestionService
+
+
+class FakeGemini:
+    def __init__(self, upload_seconds: float):
+        self.upload_seconds = upload_seconds
+        self.upload_cancelled = False
+        self.deleted = []
+
+    async def upload_file(self, local_path, display_name):
+        try:
+            await asyncio.sleep(self.upload_seconds)
+        except asyncio.CancelledError:
+            self.upload_cancelled = True
+            raise
+        return "files/abc"
+
+    async def delete_document(self, file_name):
+        self.deleted.append(file_name)
+
+
+def ingest_with_failing_sections(monkeypatch, tmp_path, upload_seconds: float, index_seconds: float):
+    gemini = FakeGemini(upload_seconds)
+    statuses = []
+    monkeypatch.setattr(ingestion_module, "gemini_service", gemini)
+    monkeypatch.setattr(ingestion_module.settings, "retriever_backend", "file_search")
+
+    service = IngestionService(concurrency=1, poller=None)
+
+    async def set_status(document_id, status, **fields):
+        statuses.append((status, fields.get("error_message")))
+        return True
+
+    async def ensure_store(owner_id):
+        return "stores/s1"
+
+    async def archive(storage_path, local_path):
+        pass
+
+    async def index_sections(document_id, local_path, page_count, embed=True):
+        await asyncio.sleep(index_seconds)
+        raise RuntimeError("sections failed")
+
+    service._set_status = set_status
+    service._ensure_store = ensure_store
+    service._timed_archive = archive
+    service._index_sections = index_sections
+
+    local_path = tmp_path / "doc.pdf"
+    local_path.write_bytes(b"%PDF")
+    asyncio.run(service._run_ingestion(1, "owner", str(local_path), "owner/doc.pdf", "doc.pdf", 3))
+    return gemini, statuses
+
+
+def test_failed_step_cancels_the_upload(monkeypatch, tmp_path):
+    gemini, statuses = ingest_with_failing_sections(monkeypatch, tmp_path, upload_seconds=5.0, index_seconds=0.0)
+
+    assert gemini.upload_cancelled
+    assert gemini.deleted == []
+    assert statuses[-1] == ("failed", "sections failed")
+
+
+def test_failed_step_deletes_a_finished_upload(monkeypatch, tmp_path):
+    gemini, statuses = ingest_with_failing_sections(monkeypatch, tmp_path, upload_seconds=0.0, index_seconds=0.05)
+
+    assert gemini.deleted == ["files/abc"]
+    assert statuses[-1] == ("failed", "sections failed")
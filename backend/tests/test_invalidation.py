@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from app.services import invalidation
+from app.config import get_settings
+from app.services.invalidation import InvalidationBus, ANSWERS, FAQ, TENANT, VECTORS
+from app.services.vector_store import LocalVectorIndex
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def record_handlers(monkeypatch):
+    calls = []
+    monkeypatch.setattr(invalidation, "_HANDLERS", {
+        kind: (lambda owner_id, kind=kind: calls.append((kind, owner_id))) for kind in (TENANT, ANSWERS, FAQ, VECTORS)
+    })
+    return calls
+
+
+def test_local_invalidation_without_redis(monkeypatch):
+    calls = record_handlers(monkeypatch)
+    bus = InvalidationBus(redis_url=None, channel="test")
+    asyncio.run(bus.invalidate("owner", ANSWERS, FAQ))
+    assert calls == [(ANSWERS, "owner"), (FAQ, "owner")]
+    assert bus.published == 0
+
+
+def test_invalidation_reaches_other_processes(monkeypatch):
+    calls = record_handlers(monkeypatch)
+    web = InvalidationBus(redis_url="redis://test", channel="test")
+    worker = InvalidationBus(redis_url="redis://test", channel="test")
+    web._redis = FakeRedis()
+
+    asyncio.run(web.invalidate("owner", TENANT))
+    (channel, message), = web._redis.published
+    assert channel == "test"
+
+    # The worker applies it; the publisher ignores its own echo
+    worker._receive(message)
+    web._receive(message)
+    assert calls == [(TENANT, "owner"), (TENANT, "owner")]
+    assert worker.received == 1 and web.received == 0
+    assert json.loads(message)["kinds"] == [TENANT]
+
+
+def test_other_processes_drop_their_vector_index(monkeypatch, tmp_path):
+    # Each process keeps its own copy of the index (e.g. on another host)
+    web_index, worker_index = LocalVectorIndex(str(tmp_path / "web")), LocalVectorIndex(str(tmp_path / "worker"))
+    embedding = [[1.0] * get_settings().embedding_dimensions]
+    for index in (web_index, worker_index):
+        index._write("owner", [1], embedding)
+    assert asyncio.run(worker_index.size("owner")) == 1
+
+    web = InvalidationBus(redis_url="redis://test", channel="test")
+    worker = InvalidationBus(redis_url="redis://test", channel="test")
+    web._redis = FakeRedis()
+    monkeypatch.setitem(invalidation._HANDLERS, VECTORS, web_index.invalidate)
+    asyncio.run(web.invalidate("owner", VECTORS))
+    assert not (tmp_path / "web" / "owner").exists()
+
+    monkeypatch.setitem(invalidation._HANDLERS, VECTORS, worker_index.invalidate)
+    worker._receive(web._redis.published[0][1])
+    assert "owner" not in worker_index._indexes
+    assert not (tmp_path / "worker" / "owner").exists()
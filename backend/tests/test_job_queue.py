@@ -0,0 +1,186 @@
+import asyncio
+import json
+import httpx
+from app.repositories.messages import MessageRepository
+from app.repositories.postgrest import PostgrestClient
+import pytest
+from app.services.job_queue import InMemoryQueue, Job, QueueFullError, RedisStreamQueue, WorkerPool
+
+
+def run_pool(handler, max_attempts: int, jobs: int = 1):
+    async def scenario():
+        queue = InMemoryQueue()
+        pool = WorkerPool(queue, handler, concurrency=2, max_attempts=max_attempts, retry_base_seconds=0.0)
+        for i in range(jobs):
+            await queue.enqueue({"n": i})
+        pool.start()
+        await asyncio.wait_for(queue._queue.join(), 2.0)
+        await pool.stop(timeout=1.0)
+        return queue, pool
+
+    return asyncio.run(scenario())
+
+
+def test_retried_job_keeps_its_id():
+    seen = []
+
+    async def handler(job: Job):
+        seen.append((job.id, job.attempts))
+        if job.attempts == 0:
+            raise RuntimeError("generation failed")
+
+    _, pool = run_pool(handler, max_attempts=3)
+
+    assert [attempts for _, attempts in seen] == [0, 1]
+    assert seen[0][0] == seen[1][0]
+    assert pool.stats()["processed"] == 1
+
+
+def test_job_is_dead_lettered_after_max_attempts():
+    async def handler(job: Job):
+        raise RuntimeError("always fails")
+
+    queue, pool = run_pool(handler, max_attempts=2)
+
+    dead = asyncio.run(queue.dead_letters())
+    assert len(dead) == 1
+    assert dead[0]["job"]["attempts"] == 1
+    assert dead[0]["error"] == "always fails"
+    assert pool.stats()["dead_lettered"] == 1
+
+
+def test_message_rows_skip_duplicates_of_a_retried_job():
+    requests = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(201)
+
+    async def scenario():
+        db = PostgrestClient("http://db.test", "key")
+        db._client = httpx.AsyncClient(base_url=db.url, transport=httpx.MockTransport(respond))
+        await MessageRepository(db).insert_many([
+            {"customer_id": "owner", "user_phone": "u1", "direction": "inbound", "content": "bonjour", "job_id": "j1"},
+        ])
+        await db.aclose()
+
+    asyncio.run(scenario())
+
+    request = requests[0]
+    assert request.url.params["on_conflict"] == "job_id,direction"
+    assert "resolution=ignore-duplicates" in request.headers["prefer"]
+    assert json.loads(request.content)[0]["job_id"] == "j1"
+
+
+class FakeStreamRedis:
+    """The pending list of one consumer group: entries delivered once to a consumer that died."""
+
+    def __init__(self, entries):
+        self.entries = dict(entries)  # entry id -> (fields, times delivered)
+        self.claims = []
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id, count):
+        ids = sorted(i for i in self.entries if i > start_id)
+        batch, rest = ids[:count], ids[count:]
+        self.claims.append((start_id, count))
+        for entry_id in batch:
+            fields, delivered = self.entries[entry_id]
+            self.entries[entry_id] = (fields, delivered + 1)
+        return [batch[-1] if rest else "0-0", [(i, self.entries[i][0]) for i in batch], []]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def xpending_range(self, stream, group, min, max, count):
+        self.commands.append(min)
+
+    async def execute(self):
+        return [[{"message_id": i, "times_delivered": self.redis.entries[i][1]}] for i in self.commands]
+
+
+def redis_queue(entries, claim_batch_size):
+    # redis-py only connects on the first command
+    queue = RedisStreamQueue("redis://test", "jobs", "workers", visibility_timeout=1.0, claim_batch_size=claim_batch_size)
+    queue._redis = FakeStreamRedis(entries)
+    queue._group_ready = True
+    return queue
+
+
+def test_reclaimed_jobs_count_lost_deliveries_and_come_in_batches():
+    entries = {
+        f"1-{i}": ({"job": Job(id=f"j{i}", payload={}, attempts=1).dumps()}, 1 + i % 2) for i in range(3)
+    }
+    queue = redis_queue(entries, claim_batch_size=2)
+
+    async def scenario():
+        return [await queue.dequeue("worker-1", timeout=0) for _ in range(3)]
+
+    jobs = asyncio.run(scenario())
+    # Stored attempts plus every delivery before this one
+    assert [(job.id, job.attempts) for job in jobs] == [("j0", 2), ("j1", 3), ("j2", 2)]
+    # The second batch follows the first one's cursor instead of waiting for the claim interval
+    assert queue._redis.claims == [("0-0", 2), ("1-1", 2)]
+
+
+def test_job_lost_by_its_workers_too_often_is_dead_lettered():
+    ran = []
+
+    async def handler(job: Job):
+        ran.append(job.id)
+
+    async def scenario():
+        queue = InMemoryQueue()
+        pool = WorkerPool(queue, handler, concurrency=1, max_attempts=3, retry_base_seconds=0.0)
+        await queue._queue.put(Job(id="crashes-workers", payload={}, attempts=3))
+        pool.start()
+        await asyncio.wait_for(queue._queue.join(), 2.0)
+        await pool.stop(timeout=1.0)
+        return await queue.dead_letters()
+
+    dead = asyncio.run(scenario())
+    assert ran == []
+    assert dead[0]["job"]["id"] == "crashes-workers"
+
+
+def test_retry_into_a_full_queue_does_not_block():
+    async def scenario():
+        queue = InMemoryQueue(max_pending=1)
+        await queue.enqueue({"n": 0})
+        job = await queue.dequeue("c", timeout=0.1)
+        await queue.enqueue({"n": 1})
+        with pytest.raises(QueueFullError):
+            await asyncio.wait_for(queue.requeue(job), 0.5)
+
+    asyncio.run(scenario())
+
+
+def test_retry_that_finds_the_queue_full_counts_as_an_attempt():
+    async def handler(job: Job):
+        pass
+
+    async def scenario():
+        queue = InMemoryQueue(max_pending=1)
+        pool = WorkerPool(queue, handler, concurrency=1, max_attempts=2, retry_base_seconds=0.0)
+        await queue.enqueue({"n": 0})
+        job = await queue.dequeue("c", timeout=0.1)
+        await queue.enqueue({"n": 1})  # Takes the only slot
+        await pool._handle_failure(job, RuntimeError("generation failed"))
+        await asyncio.sleep(0.05)
+        return queue, pool
+
+    queue, pool = asyncio.run(scenario())
+    dead = asyncio.run(queue.dead_letters())
+    assert [record["error"] for record in dead] == ["Job queue is full"]
+    assert pool.stats()["dead_lettered"] == 1
@@ -0,0 +1,134 @@
+import asyncio
+
+from app.services.manychat_service import ManyChatService, StreamingReply
+
+
+def make_service(sent):
+    service = ManyChatService()
+    service.order_wait = 5.0
+
+    async def send(owner_id, subscriber_id, text, token, buttons=None):
+        sent.append(text)
+        return True
+
+    service.send = send
+    return service
+
+
+async def reply(service, text, delay, send=True):
+    async with service.outbox("owner", "subscriber", "token") as outbox:
+        await asyncio.sleep(delay)
+        if send:
+            await outbox.send(text)
+
+
+def test_replies_keep_arrival_order():
+    sent = []
+    service = make_service(sent)
+
+    async def scenario():
+        first = asyncio.create_task(reply(service, "A", 0.05))
+        await asyncio.sleep(0)
+        await reply(service, "B", 0.0)
+        await first
+
+    asyncio.run(scenario())
+    assert sent == ["A", "B"]
+
+
+def test_silent_reply_does_not_let_a_later_one_overtake():
+    sent = []
+    service = make_service(sent)
+
+    async def scenario():
+        a = asyncio.create_task(reply(service, "A", 0.05))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(reply(service, "B", 0.0, send=False))  # Coalesced, quota, empty answer...
+        await asyncio.sleep(0)
+        c = asyncio.create_task(reply(service, "C", 0.0))
+        await asyncio.gather(a, b, c)
+
+    asyncio.run(scenario())
+    assert sent == ["A", "C"]
+    assert service._tails == {}
+
+
+def test_other_subscribers_are_not_held_back():
+    sent = []
+    service = make_service(sent)
+
+    async def other():
+        async with service.outbox("owner", "someone-else", "token") as outbox:
+            await outbox.send("other")
+
+    async def scenario():
+        slow = asyncio.create_task(reply(service, "slow", 0.05))
+        await asyncio.sleep(0)
+        await other()
+        await slow
+
+    asyncio.run(scenario())
+    assert sent == ["other", "slow"]
+
+
+def test_streamed_answer_goes_out_sentence_by_sentence():
+    sent = []
+    service = make_service(sent)
+
+    async def scenario():
+        async with service.outbox("owner", "subscriber", "token") as outbox:
+            streaming = StreamingReply(outbox, min_chars=10, max_delay=60)
+            for chunk in ["Bonjour à vous. Nos bou", "tiques sont ouvertes. Mer", "ci !"]:
+                await streaming.feed(chunk)
+            return await streaming.finish("Bonjour à vous. Nos boutiques sont ouvertes. Merci !")
+
+    assert asyncio.run(scenario()) == "Bonjour à vous. Nos boutiques sont ouvertes. Merci !"
+    assert sent == ["Bonjour à vous.", "Nos boutiques sont ouvertes.", "Merci !"]
+
+
+def test_streaming_does_not_wait_for_the_previous_reply():
+    sent = []
+    service = make_service(sent)
+
+    async def scenario():
+        release_previous = asyncio.Event()
+
+        async def previous():
+            async with service.outbox("owner", "subscriber", "token") as outbox:
+                await release_previous.wait()
+                await outbox.send("previous")
+
+        earlier = asyncio.create_task(previous())
+        await asyncio.sleep(0)
+        async with service.outbox("owner", "subscriber", "token") as outbox:
+            streaming = StreamingReply(outbox, min_chars=10, max_delay=60)
+            # The whole answer is read while the previous reply still holds the subscriber's slot
+            for chunk in ["Bonjour à vous. ", "Nos boutiques sont ouvertes. "]:
+                await asyncio.wait_for(streaming.feed(chunk), 0.1)
+            assert sent == []
+            release_previous.set()
+            await streaming.finish("Bonjour à vous. Nos boutiques sont ouvertes. ")
+        await earlier
+
+    asyncio.run(scenario())
+    assert sent == ["previous", "Bonjour à vous.", "Nos boutiques sont ouvertes."]
+
+
+def test_failure_after_streaming_returns_what_the_subscriber_got():
+    sent = []
+    service = make_service(sent)
+
+    async def scenario():
+        async with service.outbox("owner", "subscriber", "token") as outbox:
+            streaming = StreamingReply(outbox, min_chars=10, max_delay=60)
+            await streaming.feed("Nos boutiques sont ouvertes. Le dim")
+            return await streaming.finish("Je suis désolé, je n'ai pas pu générer une réponse pour le moment.")
+
+    delivered = asyncio.run(scenario())
+    assert sent == [
+        "Nos boutiques sont ouvertes.", "Le dim",
+        "Je suis désolé, je n'ai pas pu générer une réponse pour le moment.",
+    ]
+    assert delivered == (
+        "Nos boutiques sont ouvertes. Le dim\n\nJe suis désolé, je n'ai pas pu générer une réponse pour le moment."
+    )
@@ -0,0 +1,92 @@
+import asyncio
+from app.services import message_writer as message_writer_module
+from app.services.message_writer import MessageWriter
+
+
+class FakeMessages:
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        self.failures = failures
+        self.delay = delay
+        self.batches = []
+
+    async def insert_many(self, rows):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        self.batches.append([row["content"] for row in rows])
+
+
+def row(content: str) -> dict:
+    return {"customer_id": "owner", "user_phone": "u1", "direction": "inbound", "content": content}
+
+
+def test_writers_wait_for_room_in_a_full_buffer(monkeypatch):
+    messages = FakeMessages(delay=0.05)
+    monkeypatch.setattr(message_writer_module, "message_repository", messages)
+    writer = MessageWriter(max_batch=2, flush_interval=60, max_buffer=2)
+
+    async def scenario():
+        await writer.write(row("a"))
+        await writer.write(row("b"))
+        third = asyncio.create_task(writer.write(row("c")))
+        await asyncio.sleep(0.01)
+        blocked = not third.done()
+        # Room is given back once the batch holding the first rows is inserted
+        await writer.flush()
+        await asyncio.wait_for(third, 0.1)
+        await writer.flush()
+        return blocked
+
+    assert asyncio.run(scenario())
+    assert messages.batches == [["a", "b"], ["c"]]
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    messages = FakeMessages(failures=2)
+    monkeypatch.setattr(message_writer_module, "message_repository", messages)
+    monkeypatch.setattr(message_writer_module.asyncio, "sleep", _no_sleep)
+    writer = MessageWriter(max_batch=10, flush_interval=60, max_buffer=10, max_attempts=3)
+
+    async def scenario():
+        await writer.write(row("a"))
+        await writer.flush()
+
+    asyncio.run(scenario())
+    assert messages.batches == [["a"]]
+    assert writer.stats()["rows_written"] == 1 and writer.stats()["round_trips"] == 3
+
+
+def test_batch_is_dropped_after_max_attempts_and_frees_its_room(monkeypatch):
+    messages = FakeMessages(failures=3)
+    monkeypatch.setattr(message_writer_module, "message_repository", messages)
+    monkeypatch.setattr(message_writer_module.asyncio, "sleep", _no_sleep)
+    writer = MessageWriter(max_batch=10, flush_interval=60, max_buffer=1, max_attempts=3)
+
+    async def scenario():
+        await writer.write(row("a"))
+        await writer.flush()
+        await asyncio.wait_for(writer.write(row("b")), 0.1)
+
+    asyncio.run(scenario())
+    assert writer.stats()["rows_dropped"] == 1
+
+
+def test_stop_flushes_every_buffered_row(monkeypatch):
+    messages = FakeMessages()
+    monkeypatch.setattr(message_writer_module, "message_repository", messages)
+    writer = MessageWriter(max_batch=2, flush_interval=60, max_buffer=10)
+
+    async def scenario():
+        writer.start()
+        for content in "abcde":
+            await writer.write(row(content))
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert sum(messages.batches, []) == list("abcde")
+    assert writer.stats()["buffered"] == 0
+
+
+async def _no_sleep(delay):
+    pass
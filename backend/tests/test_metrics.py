@@ -0,0 +1,46 @@
+import asyncio
+from app.services import metrics as metrics_module
+from app.services.admission import AdmissionController
+from app.services.metrics import Metrics, scrape_allowed, tenant_alias
+from app.services.tenant_cache import TenantContext
+
+OWNER_ID = "3f1c2a9e-0000-4000-8000-000000000001"
+
+
+def test_owner_id_never_reaches_labels_or_traces():
+    metrics = Metrics(max_tenants=10, trace_sample_rate=1.0, trace_buffer=10)
+
+    with metrics.request("webhook.process_chat"):
+        metrics.set_tenant(OWNER_ID)
+        with metrics.timer("rag.query"):
+            pass
+
+    rendered = metrics.render()
+    assert OWNER_ID not in rendered
+    assert f'tenant="{tenant_alias(OWNER_ID)}"' in rendered
+    assert metrics.traces()[0]["tenant"] == tenant_alias(OWNER_ID)
+
+
+def test_admission_stats_use_alias():
+    controller = AdmissionController(max_in_flight=2, max_queued=4, max_queued_per_tenant=2, max_wait=1.0,
+                                     burst_seconds=1.0)
+    tenant = TenantContext(owner_id=OWNER_ID, manychat_api_key="k", chatbot_prompt=None, gemini_file_store_id=None,
+                           max_concurrent_requests=1,
+                           requests_per_minute=60, scheduling_weight=1)
+
+    async def scenario():
+        async with controller.slot(tenant):
+            return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert list(stats["tenants"]) == [tenant_alias(OWNER_ID)]
+
+
+def test_scrape_requires_token_when_configured(monkeypatch):
+    monkeypatch.setattr(metrics_module.settings, "metrics_token", "")
+    assert scrape_allowed(None)
+
+    monkeypatch.setattr(metrics_module.settings, "metrics_token", "s3cret")
+    assert not scrape_allowed(None)
+    assert not scrape_allowed("Bearer wrong")
+    assert scrape_allowed("Bearer s3cret")
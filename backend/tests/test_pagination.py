@@ -0,0 +1,80 @@
+import asyncio
+import httpx
+import pytest
+from app.repositories.messages import MessageRepository
+from app.repositories.postgrest import PostgrestClient
+from app.services.pagination import InvalidCursorError, decode_cursor, encode_cursor, keyset_filter
+
+CREATED_AT = "2026-10-17T03:25:05.123456+00:00"
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(CREATED_AT, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (CREATED_AT, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", encode_cursor("yesterday", 1), encode_cursor(CREATED_AT, "x")])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_keyset_filter_is_strictly_after_the_cursor_row():
+    assert keyset_filter(encode_cursor(CREATED_AT, 42)) == (
+        f'created_at.lt."{CREATED_AT}",and(created_at.eq."{CREATED_AT}",id.lt.42)'
+    )
+    assert keyset_filter(encode_cursor(CREATED_AT, 7), "last_message_at", "last_message_id").startswith(
+        f'last_message_at.lt."{CREATED_AT}"'
+    )
+
+
+def test_cursor_page_ignores_offset():
+    requests = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json=[])
+
+    async def scenario():
+        db = PostgrestClient("http://db.test", "key")
+        db._client = httpx.AsyncClient(base_url=db.url, transport=httpx.MockTransport(respond))
+        await MessageRepository(db).page("owner", 50, cursor=encode_cursor(CREATED_AT, 42), offset=100)
+        await db.aclose()
+
+    asyncio.run(scenario())
+    params = requests[0].url.params
+    assert params["or"] == f'({keyset_filter(encode_cursor(CREATED_AT, 42))})'
+    assert params["order"] == "created_at.desc,id.desc"
+    assert params["limit"] == "50"
+    assert "offset" not in params
+
+
+def test_conversations_are_unbounded_without_limit_or_cursor():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.routers import messages
+    from app.services.auth_service import get_current_user
+
+    calls = []
+
+    async def conversations(owner_id, limit, cursor=None):
+        calls.append((limit, cursor))
+        count = 3 if limit is None else limit
+        return [{"user_phone": str(i), "last_message_at": CREATED_AT, "last_message_id": i, "message_count": 1,
+                 "last_direction": "inbound", "last_snippet": "Bonjour"}
+                for i in range(count)]
+
+    app = FastAPI()
+    app.include_router(messages.router)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "owner"}
+    cursor = encode_cursor(CREATED_AT, 42)
+    with TestClient(app) as client, pytest.MonkeyPatch.context() as patch:
+        patch.setattr(messages.message_repository, "conversations", conversations)
+        unbounded = client.get("/messages/conversations")
+        paged = client.get("/messages/conversations", params={"limit": 2})
+        next_page = client.get("/messages/conversations", params={"cursor": cursor})
+
+    assert len(unbounded.json()) == 3 and "x-next-cursor" not in unbounded.headers
+    assert paged.headers["x-next-cursor"] == encode_cursor(CREATED_AT, 1)
+    assert calls == [(None, None), (2, None), (messages.DEFAULT_CONVERSATIONS_PAGE, cursor)]
@@ -0,0 +1,54 @@
+import asyncio
+from PyPDF2 import PdfWriter
+from app.services import pdf_service, pdf_worker
+
+
+def write_pdf(path, pages: int):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_reader_is_reused_until_the_file_changes(tmp_path):
+    path = write_pdf(tmp_path / "doc.pdf", 3)
+
+    first = pdf_worker.cached_reader(path)
+    assert pdf_worker.cached_reader(path) is first
+    assert pdf_worker.count_pages(path) == 3
+
+    write_pdf(tmp_path / "doc.pdf", 5)
+    assert pdf_worker.cached_reader(path) is not first
+    assert pdf_worker.count_pages(path) == 5
+
+
+def test_readers_beyond_cache_size_are_closed(tmp_path):
+    paths = [write_pdf(tmp_path / f"doc{i}.pdf", 1) for i in range(pdf_worker.READER_CACHE_SIZE + 1)]
+    for path in paths:
+        pdf_worker.cached_reader(path)
+
+    assert paths[0] not in pdf_worker._readers
+    assert len(pdf_worker._readers) == pdf_worker.READER_CACHE_SIZE
+
+
+def test_iter_pages_uses_known_page_count(monkeypatch):
+    calls = []
+
+    async def run(fn, *args, timeout=None):
+        calls.append(fn.__name__)
+        if fn is pdf_worker.count_pages:
+            return 25
+        _, start, end = args
+        return [f"page {i}" for i in range(start, end)]
+
+    monkeypatch.setattr(pdf_service.pdf_pool, "run", run)
+
+    async def collect():
+        return [text async for text in pdf_service.iter_pages("doc.pdf", page_count=25)]
+
+    pages = asyncio.run(collect())
+    assert pages == [f"page {i}" for i in range(25)]
+    assert "count_pages" not in calls
+    assert calls.count("extract_page_range") == 3
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from starlette.requests import Request
+from app.services.pdf_service import (
+    InvalidUploadError, PdfProcessPool, UploadTooLargeError, spool_upload,
+)
+
+BOUNDARY = "test-boundary"
+
+
+def multipart_body(content: bytes, filename: str = "catalogue.pdf") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nignored\r\n"
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def upload_request(body: bytes, declare_length: bool = True, chunk_size: int = 64 * 1024):
+    """A request whose body arrives in chunks; `received` counts the chunks read."""
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = []
+
+    async def receive():
+        chunk = chunks[len(received)]
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if declare_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive), received
+
+
+@pytest.fixture
+def spool_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return tmp_path
+
+
+def test_upload_is_written_once_and_hashed(spool_dir):
+    content = os.urandom(300 * 1024)
+    request, _ = upload_request(multipart_body(content))
+
+    upload = asyncio.run(spool_upload(request))
+
+    with open(upload.path, "rb") as f:
+        assert f.read() == content
+    assert upload.size == len(content) and upload.filename == "catalogue.pdf"
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_declared_oversized_upload_is_refused_before_reading(spool_dir):
+    request, received = upload_request(multipart_body(b"x" * (2 * 1024 * 1024)))
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(spool_upload(request, max_size_mb=1))
+    assert received == []
+    assert os.listdir(spool_dir) == []
+
+
+def test_undeclared_oversized_upload_stops_at_the_limit(spool_dir):
+    body = multipart_body(b"x" * (4 * 1024 * 1024))
+    request, received = upload_request(body, declare_length=False)
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(spool_upload(request, max_size_mb=1))
+    assert sum(len(chunk) for chunk in received) < 2 * 1024 * 1024
+    assert os.listdir(spool_dir) == []
+
+
+def test_other_file_types_are_refused(spool_dir):
+    request, _ = upload_request(multipart_body(b"MZ", filename="setup.exe"))
+
+    with pytest.raises(InvalidUploadError, match="Only PDF files are allowed"):
+        asyncio.run(spool_upload(request))
+    assert os.listdir(spool_dir) == []
+
+
+def test_timed_out_job_restarts_the_workers():
+    async def scenario():
+        pool = PdfProcessPool(max_workers=1, max_memory_mb=2048, timeout=1.0, max_queued=1)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(time.sleep, 60)
+            assert pool.timeouts == 1 and pool._executor is None
+            assert await pool.run(abs, -3, timeout=30) == 3
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_crashed_worker_restarts_the_workers():
+    async def scenario():
+        pool = PdfProcessPool(max_workers=1, max_memory_mb=2048, timeout=30, max_queued=1)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await pool.run(os._exit, 1)
+            assert pool._executor is None
+            assert await pool.run(abs, -3) == 3
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
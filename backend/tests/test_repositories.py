@@ -0,0 +1,110 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.repositories import documents as documents_module
+from app.repositories.documents import DocumentRepository
+from app.repositories.messages import MessageRepository
+from app.repositories.postgrest import PostgrestClient, PostgrestError, UNIQUE_VIOLATION
+
+
+def run(respond, scenario):
+    """Runs scenario(db) against a PostgREST answering with respond(request); returns the requests."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return respond(request)
+
+    async def main():
+        db = PostgrestClient("http://db.test", "key")
+        db._client = httpx.AsyncClient(base_url=db.url, transport=httpx.MockTransport(handler))
+        try:
+            return await scenario(db)
+        finally:
+            await db.aclose()
+
+    return asyncio.run(main()), requests
+
+
+def test_insert_ignoring_conflicts_asks_postgrest_to_skip_duplicates():
+    result, requests = run(
+        lambda request: httpx.Response(201, json=[{"id": 7}]),
+        lambda db: db.insert("messages", [{"job_id": "j1", "direction": "inbound"}], returning="id",
+                             ignore_conflicts_on="job_id,direction"),
+    )
+    request, = requests
+    assert result == [{"id": 7}]
+    assert request.method == "POST" and request.url.path == "/rest/v1/messages"
+    assert request.url.params["on_conflict"] == "job_id,direction"
+    assert request.url.params["select"] == "id"
+    assert request.headers["prefer"] == "return=representation,resolution=ignore-duplicates"
+
+
+def test_plain_insert_fails_on_conflict():
+    result, requests = run(
+        lambda request: httpx.Response(201),
+        lambda db: db.insert("documents", [{"owner_id": "owner"}]),
+    )
+    assert "on_conflict" not in requests[0].url.params
+    assert requests[0].headers["prefer"] == "return=minimal"
+
+
+def test_errors_are_mapped_to_postgrest_error():
+    def respond(request):
+        return httpx.Response(409, json={
+            "code": UNIQUE_VIOLATION, "message": "duplicate key value", "details": "Key (content_hash)=(ab) exists.",
+        })
+
+    with pytest.raises(PostgrestError) as error:
+        run(respond, lambda db: db.insert("documents", [{"owner_id": "owner"}]))
+    assert (error.value.status_code, error.value.code) == (409, UNIQUE_VIOLATION)
+    assert str(error.value) == "duplicate key value"
+    assert error.value.details == "Key (content_hash)=(ab) exists."
+
+
+def test_non_json_error_keeps_the_body_as_message():
+    with pytest.raises(PostgrestError) as error:
+        run(lambda request: httpx.Response(502, text="Bad Gateway"), lambda db: db.select("documents", "id"))
+    assert (error.value.status_code, error.value.code, str(error.value)) == (502, None, "Bad Gateway")
+
+
+def test_filters_quote_reserved_characters():
+    _, requests = run(
+        lambda request: httpx.Response(200, json=[]),
+        lambda db: db.select("profiles", "id", [("id", "in", ["a", "b,c"]), ("jwt_secret", "is", None)]),
+    )
+    params = requests[0].url.params
+    assert params["id"] == 'in.(a,"b,c")'
+    assert params["jwt_secret"] == "is.null"
+
+
+def test_insert_many_skips_rows_already_written_by_an_earlier_attempt():
+    rows = [
+        {"customer_id": "owner", "user_phone": "u1", "direction": "inbound", "content": "bonjour", "job_id": "j1"},
+        {"customer_id": "owner", "user_phone": "u1", "direction": "outbound", "content": "Bonjour !", "job_id": "j1"},
+    ]
+    _, requests = run(lambda request: httpx.Response(201), lambda db: MessageRepository(db).insert_many(rows))
+    request, = requests
+    assert request.url.params["on_conflict"] == "job_id,direction"
+    assert "resolution=ignore-duplicates" in request.headers["prefer"]
+    assert json.loads(request.content) == rows
+
+
+def test_processed_sections_page_by_id(monkeypatch):
+    monkeypatch.setattr(documents_module, "SECTION_PAGE_SIZE", 2)
+    ids = [3, 5, 8, 13, 21]
+
+    def respond(request):
+        after = int(request.url.params.get("id", "gt.0")[3:])
+        page = [i for i in ids if i > after][:int(request.url.params["limit"])]
+        return httpx.Response(200, json=[{"id": i, "content": f"section {i}"} for i in page])
+
+    async def scenario(db):
+        return [[row["id"] for row in page] async for page in DocumentRepository(db).processed_sections("owner", "content")]
+
+    pages, requests = run(respond, scenario)
+    assert pages == [[3, 5], [8, 13], [21]]
+    assert [request.url.params.get("id") for request in requests] == [None, "gt.5", "gt.13"]
+    assert all("offset" not in request.url.params for request in requests)
+    assert requests[0].url.params["select"] == "id, content, documents!inner(owner_id, status)"
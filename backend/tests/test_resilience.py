@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+
+import httpx
+import pytest
+
+from app.services import resilience
+from app.services.resilience import AdaptiveLimiter, CircuitBreaker, ResilientCaller
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+def make_limiter(**overrides) -> AdaptiveLimiter:
+    options = dict(initial=16, min_limit=2, max_limit=50, latency_tolerance=2.0)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+
+async def feed(limiter: AdaptiveLimiter, clock: FakeClock, latencies, overloaded: bool = False):
+    for latency in latencies:
+        # Calls complete one after another, so time moves on by their latency
+        clock.now += latency or 1.0
+        await limiter.acquire()
+        await limiter.release(latency, overloaded=overloaded)
+
+
+def test_limit_holds_when_generation_latency_varies_widely(clock):
+    rng = random.Random(1)
+    limiter = make_limiter()
+    # Typical generation latencies: 0.1s to 5s, one call in ten above 1.5s
+    asyncio.run(feed(limiter, clock, [rng.lognormvariate(-0.7, 0.8) for _ in range(2000)]))
+    assert limiter.limit >= 16
+
+
+def test_sustained_latency_rise_cuts_the_limit(clock):
+    limiter = make_limiter()
+
+    async def scenario():
+        await feed(limiter, clock, [0.2] * 200)
+        before = limiter.limit
+        await feed(limiter, clock, [2.0] * 50)
+        return before
+
+    before = asyncio.run(scenario())
+    assert limiter.limit < before / 2
+
+
+def test_overload_cuts_and_min_limit_holds(clock):
+    limiter = make_limiter()
+    asyncio.run(feed(limiter, clock, [None] * 30, overloaded=True))
+    assert limiter.limit == 2
+
+
+def test_cancelled_half_open_probe_gives_the_probe_back():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    limiter = make_limiter(initial=1, min_limit=1)
+    caller = ResilientCaller("test", limiter, breaker, max_attempts=1, retry_base=0.0, retry_max=0.0)
+
+    async def scenario():
+        await limiter.acquire()  # The only slot is taken: the probe waits for it
+        task = asyncio.create_task(caller.call(lambda: None))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open" and breaker._probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await limiter.release(None, overloaded=False)
+
+    asyncio.run(scenario())
+    assert breaker.allow()
+
+
+def test_probe_success_closes_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    caller = ResilientCaller("test", make_limiter(), breaker, max_attempts=1, retry_base=0.0, retry_max=0.0)
+
+    async def send():
+        return httpx.Response(200)
+
+    assert asyncio.run(caller.call(send)).status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_streamed_response_holds_its_slot_until_released():
+    limiter = make_limiter()
+    caller = ResilientCaller("test", limiter, CircuitBreaker(5, 30.0), max_attempts=1, retry_base=0.0, retry_max=0.0)
+
+    async def send():
+        return httpx.Response(200)
+
+    async def scenario():
+        response, release = await caller.open(send)
+        held = limiter.in_flight
+        await release()
+        await release()
+        return held
+
+    assert asyncio.run(scenario()) == 1
+    assert limiter.in_flight == 0
+
+
+def test_failed_streamed_response_gives_its_slot_back_at_once():
+    limiter = make_limiter()
+    caller = ResilientCaller("test", limiter, CircuitBreaker(5, 30.0), max_attempts=1, retry_base=0.0, retry_max=0.0)
+
+    async def send():
+        return httpx.Response(400)
+
+    async def scenario():
+        response, release = await caller.open(send)
+        held = limiter.in_flight
+        await release()
+        return held
+
+    assert asyncio.run(scenario()) == 0
+    assert limiter.in_flight == 0
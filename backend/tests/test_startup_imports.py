@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from app.config import Settings, SettingsError, REQUIRED_SETTINGS
+
+
+def test_app_import_defers_heavy_dependencies():
+    # A fresh interpreter: other tests may already have imported these
+    code = (
+        "import sys, app.main; "
+        "print(','.join(m for m in ('numpy', 'jose', 'supabase', 'PyPDF2') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).resolve().parents[1])
+    assert result.stdout.strip() == ""
+
+
+def test_missing_settings_fail_at_startup_not_at_import():
+    backend = Path(__file__).resolve().parents[1]
+    env = {name: value for name, value in os.environ.items()
+           if name.lower() not in REQUIRED_SETTINGS and name != "JWT_SECRET"}
+    imported = subprocess.run([sys.executable, "-W", "ignore", "-c", "import app.main, app.worker"],
+                              capture_output=True, text=True, env=env, cwd=backend)
+    assert imported.returncode == 0, imported.stderr
+
+    worker = subprocess.run([sys.executable, "-W", "ignore", "-m", "app.worker"],
+                            capture_output=True, text=True, env=env, cwd=backend)
+    assert worker.returncode == 1
+    assert worker.stderr.strip().endswith(
+        "Missing required settings: SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, SUPABASE_ANON_KEY, GEMINI_API_KEY "
+        "(set them in the environment or in backend/.env)"
+    )
+    assert "Traceback" not in worker.stderr
+
+
+def test_check_required_names_the_missing_variables():
+    settings = Settings(_env_file=None, supabase_url="http://db.test", supabase_service_role_key="key",
+                        supabase_anon_key="anon", gemini_api_key="")
+    with pytest.raises(SettingsError, match="Missing required settings: GEMINI_API_KEY "):
+        settings.check_required()
+    Settings(_env_file=None, supabase_url="http://db.test", supabase_service_role_key="key",
+             supabase_anon_key="anon", gemini_api_key="gemini").check_required()
@@ -0,0 +1,108 @@
+import asyncio
+import uuid
+from app.services import tenant_cache as tenant_cache_module
+from app.services.tenant_cache import TenantCache
+
+OWNER = str(uuid.uuid4())
+KEY = str(uuid.uuid4())
+
+
+def fake_profiles(monkeypatch, rows, delay=0.0):
+    lookups = []
+
+    async def find_tenant(client_api_key):
+        lookups.append(client_api_key)
+        await asyncio.sleep(delay)
+        return rows.get(client_api_key)
+
+    monkeypatch.setattr(tenant_cache_module.profile_repository, "find_tenant", find_tenant)
+    return lookups
+
+
+def test_hit_after_first_lookup(monkeypatch):
+    lookups = fake_profiles(monkeypatch, {KEY: {"id": OWNER, "subscriptions": {"scheduling_weight": 3}}})
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=10)
+
+    async def scenario():
+        return await cache.get(KEY), await cache.get(KEY)
+
+    first, second = asyncio.run(scenario())
+    assert first == second and first.owner_id == OWNER and first.scheduling_weight == 3
+    assert lookups == [KEY]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_unknown_keys_are_cached_and_non_uuid_keys_skip_the_database(monkeypatch):
+    lookups = fake_profiles(monkeypatch, {})
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=10)
+    unknown = str(uuid.uuid4())
+
+    async def scenario():
+        return [await cache.get(key) for key in (unknown, unknown, "junk", "junk")]
+
+    assert asyncio.run(scenario()) == [None] * 4
+    assert lookups == [unknown]
+    assert cache.stats()["negative_hits"] == 2
+
+
+def test_expired_entries_are_reloaded(monkeypatch):
+    lookups = fake_profiles(monkeypatch, {KEY: {"id": OWNER}})
+    clock = [1000.0]
+    monkeypatch.setattr(tenant_cache_module.time, "monotonic", lambda: clock[0])
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=10)
+
+    async def scenario():
+        await cache.get(KEY)
+        clock[0] += 30
+        await cache.get(KEY)
+        clock[0] += 31
+        await cache.get(KEY)
+
+    asyncio.run(scenario())
+    assert lookups == [KEY, KEY]
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    keys = [str(uuid.uuid4()) for _ in range(3)]
+    lookups = fake_profiles(monkeypatch, {key: {"id": key} for key in keys})
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=2)
+
+    async def scenario():
+        await cache.get(keys[0])
+        await cache.get(keys[1])
+        await cache.get(keys[0])
+        await cache.get(keys[2])
+        await cache.get(keys[0])
+        await cache.get(keys[1])
+
+    asyncio.run(scenario())
+    assert lookups == [keys[0], keys[1], keys[2], keys[1]]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_invalidate_owner_drops_every_key_of_the_tenant(monkeypatch):
+    other_key = str(uuid.uuid4())
+    lookups = fake_profiles(monkeypatch, {KEY: {"id": OWNER}, OWNER: {"id": OWNER}, other_key: {"id": other_key}})
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=10)
+
+    async def scenario():
+        for key in (KEY, OWNER, other_key):
+            await cache.get(key)
+        cache.invalidate_owner(OWNER)
+        for key in (KEY, OWNER, other_key):
+            await cache.get(key)
+
+    asyncio.run(scenario())
+    assert lookups == [KEY, OWNER, other_key, KEY, OWNER]
+
+
+def test_concurrent_misses_share_one_lookup(monkeypatch):
+    lookups = fake_profiles(monkeypatch, {KEY: {"id": OWNER}}, delay=0.01)
+    cache = TenantCache(ttl=60, negative_ttl=5, max_entries=10)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get(KEY) for _ in range(20)))
+
+    tenants = asyncio.run(scenario())
+    assert {tenant.owner_id for tenant in tenants} == {OWNER}
+    assert lookups == [KEY]
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.repositories.billing import BillingRepository
+from app.repositories.postgrest import PostgrestClient, PostgrestError
+from app.services import usage_meter as usage_meter_module
+from app.services.usage_meter import UsageMeter, current_period
+
+
+class FakeUsageTable:
+    """usage_counters and the increment_usage RPC, with what other processes already counted."""
+
+    def __init__(self, stored: int):
+        self.stored = stored
+        self.rpc_calls = []
+        self.rpc_failures = 0
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/rpc/increment_usage"):
+            deltas = json.loads(request.content)["deltas"]
+            self.rpc_calls.append(deltas)
+            if self.rpc_failures:
+                self.rpc_failures -= 1
+                return httpx.Response(503, json={"message": "connection pool exhausted"})
+            self.stored += sum(delta["requests"] for delta in deltas)
+            return httpx.Response(200, json=[{**deltas[0], "requests": self.stored}])
+        return httpx.Response(200, json=[{"requests": self.stored}])
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeUsageTable(stored=8)
+    db = PostgrestClient("http://db.test", "key")
+    db._client = httpx.AsyncClient(base_url=db.url, transport=httpx.MockTransport(table.respond))
+    monkeypatch.setattr(usage_meter_module, "billing_repository", BillingRepository(db))
+    return table
+
+
+def test_requests_stop_at_the_monthly_limit(table):
+    meter = UsageMeter(flush_interval=60)
+
+    async def scenario():
+        return [await meter.try_consume("owner", 10) for _ in range(3)], await meter.usage("owner")
+
+    allowed, usage = asyncio.run(scenario())
+    assert allowed == [True, True, False]
+    assert usage == 10
+    assert meter.stats()["rejected"] == 1
+
+
+def test_flush_adds_the_deltas_and_takes_the_totals_of_other_processes(table):
+    meter = UsageMeter(flush_interval=60)
+
+    async def scenario():
+        await meter.try_consume("owner", 20)
+        table.stored += 5  # Counted by another process meanwhile
+        await meter.flush()
+        return await meter.usage("owner")
+
+    assert asyncio.run(scenario()) == 14
+    assert table.rpc_calls == [[{"customer_id": "owner", "period_start": current_period().isoformat(), "requests": 1}]]
+
+
+def test_failed_flush_keeps_the_count_for_the_next_one(table):
+    table.rpc_failures = 1
+    meter = UsageMeter(flush_interval=60)
+
+    async def scenario():
+        await meter.try_consume("owner", 20)
+        with pytest.raises(PostgrestError):
+            await meter.flush()
+        await meter.try_consume("owner", 20)
+        await meter.flush()
+        return await meter.usage("owner")
+
+    assert asyncio.run(scenario()) == 10
+    assert [deltas[0]["requests"] for deltas in table.rpc_calls] == [1, 2]
+    assert meter.stats()["pending"] == 0
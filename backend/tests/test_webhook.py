@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.models.schemas import ManyChatWebhook
+from app.routers import webhook
+from app.services.job_queue import Job
+from app.services.message_writer import MessageWriter
+from app.services.manychat_service import ManyChatService
+from app.services.tenant_cache import TenantContext
+
+TENANT = TenantContext(owner_id="owner", manychat_api_key="token", chatbot_prompt=None, gemini_file_store_id=None)
+PAYLOAD = ManyChatWebhook(client_api_key="key", user_id="+33600000000", last_text_input="Vos horaires ?")
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """answer_message with Gemini, ManyChat, quotas and the messages table faked."""
+    calls = {"generated": 0, "sent": [], "replies": set()}
+
+    async def process_rag_query(query, tenant, conversation, on_chunk):
+        calls["generated"] += 1
+        return "Du lundi au vendredi, 9h-18h."
+
+    async def try_consume(owner_id, limit):
+        return True
+
+    async def has_reply(job_id):
+        return job_id in calls["replies"]
+
+    async def send(owner_id, subscriber_id, text, token, buttons=None):
+        calls["sent"].append(text)
+        return True
+
+    service = ManyChatService()
+    service.send = send
+    writer = MessageWriter(max_batch=100, flush_interval=60, max_buffer=100)
+    monkeypatch.setattr(webhook.settings, "conversation_memory_enabled", False)
+    monkeypatch.setattr(webhook, "process_rag_query", process_rag_query)
+    monkeypatch.setattr(webhook.usage_meter, "try_consume", try_consume)
+    monkeypatch.setattr(webhook.message_repository, "has_reply", has_reply)
+    monkeypatch.setattr(webhook, "message_writer", writer)
+
+    def answer(job):
+        async def scenario():
+            async with service.outbox("owner", PAYLOAD.user_id, "token") as outbox:
+                await webhook.answer_message(PAYLOAD, TENANT, outbox, job)
+        asyncio.run(scenario())
+
+    calls["answer"] = answer
+    calls["writer"] = writer
+    return calls
+
+
+def test_retry_of_an_answered_job_does_not_answer_again(chat):
+    chat["replies"].add("job-1")
+    chat["answer"](Job(id="job-1", payload={}, attempts=1))
+    assert chat["generated"] == 0 and chat["sent"] == []
+    assert chat["writer"]._buffer == []
+
+
+def test_reply_still_buffered_counts_as_answered(chat):
+    job = Job(id="job-1", payload={})
+    chat["answer"](job)
+    chat["answer"](Job(id="job-1", payload={}, attempts=1))
+    assert chat["generated"] == 1 and len(chat["sent"]) == 1
+
+
+def test_retry_that_never_answered_is_answered(chat):
+    chat["answer"](Job(id="job-1", payload={}, attempts=1))
+    assert chat["generated"] == 1 and chat["sent"] == ["Du lundi au vendredi, 9h-18h."]
+    assert [row["direction"] for row in chat["writer"]._buffer] == ["inbound", "outbound"]
+
+
+def test_outbound_row_stores_the_streamed_text_and_the_apology(chat, monkeypatch):
+    async def process_rag_query(query, tenant, conversation, on_chunk):
+        await on_chunk("Nous sommes ouverts du lundi au vendredi. Le sam")
+        return "Je suis désolé, je n'ai pas pu générer une réponse pour le moment."
+
+    monkeypatch.setattr(webhook, "process_rag_query", process_rag_query)
+    monkeypatch.setattr(webhook.settings, "stream_replies_enabled", True)
+    monkeypatch.setattr(webhook.settings, "stream_min_chars", 10)
+    chat["answer"](Job(id="job-1", payload={}))
+
+    outbound = chat["writer"]._buffer[-1]
+    assert outbound["direction"] == "outbound"
+    assert chat["sent"][-1] == "Je suis désolé, je n'ai pas pu générer une réponse pour le moment."
+    assert outbound["content"] == (
+        "Nous sommes ouverts du lundi au vendredi. Le sam\n\n"
+        "Je suis désolé, je n'ai pas pu générer une réponse pour le moment."
+    )
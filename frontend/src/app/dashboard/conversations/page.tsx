@@ -3,8 +3,8 @@
 import { useState } from 'react'
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/Card'
 import { Button } from '@/components/ui/Button'
-import { api } from '@/lib/api'
-import useSWR from 'swr'
+import { api, Page } from '@/lib/api'
+import useSWRInfinite from 'swr/infinite'
 import { MessageSquare, User, ArrowRight } from 'lucide-react'
 
 type Message = {
@@ -21,16 +21,48 @@ type Conversation = {
   message_count: number
 }
 
+const CONVERSATIONS_PER_PAGE = 100
+const MESSAGES_PER_PAGE = 50
+
+// Key of the page after `previous`: null once the server sent no next cursor
+function pageKey<T>(name: string, previous: Page<T> | null) {
+  if (previous && !previous.nextCursor) return null
+  return [name, previous?.nextCursor ?? ''] as const
+}
+
 export default function ConversationsPage() {
   const [selectedPhone, setSelectedPhone] = useState<string | null>(null)
-  const { data: conversations, isLoading: loadingConversations } = useSWR<Conversation[]>(
-    'conversations',
-    () => api.messages.getConversations()
+  const {
+    data: conversationPages,
+    isLoading: loadingConversations,
+    isValidating: validatingConversations,
+    size: conversationPageCount,
+    setSize: setConversationPageCount,
+  } = useSWRInfinite<Page<Conversation>>(
+    (_, previous) => pageKey('conversations', previous),
+    ([, cursor]) => api.messages.getConversationsPage<Conversation>({
+      limit: CONVERSATIONS_PER_PAGE,
+      cursor: cursor || undefined,
+    })
   )
-  const { data: messages, isLoading: loadingMessages } = useSWR<Message[]>(
-    selectedPhone ? `messages/${selectedPhone}` : null,
-    () => api.messages.list({ user_phone: selectedPhone!, limit: 50 })
+  const {
+    data: messagePages,
+    isLoading: loadingMessages,
+    isValidating: validatingMessages,
+    size: messagePageCount,
+    setSize: setMessagePageCount,
+  } = useSWRInfinite<Page<Message>>(
+    (_, previous) => (selectedPhone ? pageKey(`messages/${selectedPhone}`, previous) : null),
+    ([, cursor]) => api.messages.listPage<Message>({
+      user_phone: selectedPhone!,
+      limit: MESSAGES_PER_PAGE,
+      cursor: cursor || undefined,
+    })
   )
+  const conversations = conversationPages?.flatMap((page) => page.items)
+  const moreConversations = !!conversationPages?.[conversationPages.length - 1]?.nextCursor
+  const messages = messagePages?.flatMap((page) => page.items)
+  const moreMessages = !!messagePages?.[messagePages.length - 1]?.nextCursor
 
   return (
     <div className="space-y-6">
@@ -73,6 +105,18 @@ export default function ConversationsPage() {
                     <ArrowRight className="w-4 h-4 text-gray-400" />
                   </button>
                 ))}
+                {moreConversations && (
+                  <div className="p-3">
+                    <Button
+                      variant="outline"
+                      className="w-full"
+                      disabled={validatingConversations}
+                      onClick={() => setConversationPageCount(conversationPageCount + 1)}
+                    >
+                      Load more
+                    </Button>
+                  </div>
+                )}
               </div>
             ) : (
               <div className="text-center py-8 text-gray-500">
@@ -122,6 +166,16 @@ export default function ConversationsPage() {
                     </div>
                   </div>
                 ))}
+                {moreMessages && (
+                  <Button
+                    variant="outline"
+                    className="w-full"
+                    disabled={validatingMessages}
+                    onClick={() => setMessagePageCount(messagePageCount + 1)}
+                  >
+                    Load older messages
+                  </Button>
+                )}
               </div>
             ) : (
               <div className="text-center py-12 text-gray-500">
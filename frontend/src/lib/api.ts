@@ -21,7 +21,15 @@ const getBaseUrl = () => {
 
 const API_URL = getBaseUrl()
 
-async function fetchWithAuth(endpoint: string, options: RequestInit = {}) {
+const NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+export interface Page<T> {
+  items: T[]
+  // Pass back as `cursor` for the next page; null on the last page
+  nextCursor: string | null
+}
+
+async function requestWithAuth(endpoint: string, options: RequestInit = {}) {
   const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null
   
   const headers: Record<string, string> = {
@@ -46,9 +54,32 @@ async function fetchWithAuth(endpoint: string, options: RequestInit = {}) {
     throw new Error(error.detail || 'An error occurred')
   }
   
+  return response
+}
+
+async function fetchWithAuth(endpoint: string, options: RequestInit = {}) {
+  const response = await requestWithAuth(endpoint, options)
   return response.json()
 }
 
+// For keyset-paginated lists: the cursor of the next page comes in a response header
+async function fetchPageWithAuth<T>(endpoint: string, options: RequestInit = {}): Promise<Page<T>> {
+  const response = await requestWithAuth(endpoint, options)
+  return {
+    items: await response.json(),
+    nextCursor: response.headers.get(NEXT_CURSOR_HEADER),
+  }
+}
+
+function messageParams(params?: { limit?: number; offset?: number; cursor?: string; user_phone?: string }) {
+  const searchParams = new URLSearchParams()
+  if (params?.limit) searchParams.set('limit', params.limit.toString())
+  if (params?.offset) searchParams.set('offset', params.offset.toString())
+  if (params?.cursor) searchParams.set('cursor', params.cursor)
+  if (params?.user_phone) searchParams.set('user_phone', params.user_phone)
+  return searchParams.toString()
+}
+
 export const api = {
   auth: {
     signup: (data: { email: string; password: string; company_name: string }) =>
@@ -98,14 +129,13 @@ export const api = {
   },
   
   messages: {
-    list: (params?: { limit?: number; offset?: number; user_phone?: string }) => {
-      const searchParams = new URLSearchParams()
-      if (params?.limit) searchParams.set('limit', params.limit.toString())
-      if (params?.offset) searchParams.set('offset', params.offset.toString())
-      if (params?.user_phone) searchParams.set('user_phone', params.user_phone)
-      return fetchWithAuth(`/messages?${searchParams.toString()}`)
-    },
+    list: (params?: { limit?: number; offset?: number; cursor?: string; user_phone?: string }) =>
+      fetchWithAuth(`/messages?${messageParams(params)}`),
+    listPage: <T = unknown>(params?: { limit?: number; cursor?: string; user_phone?: string }) =>
+      fetchPageWithAuth<T>(`/messages?${messageParams(params)}`),
     getConversations: () => fetchWithAuth('/messages/conversations'),
+    getConversationsPage: <T = unknown>(params?: { limit?: number; cursor?: string }) =>
+      fetchPageWithAuth<T>(`/messages/conversations?${messageParams(params)}`),
   },
   
   billing: {
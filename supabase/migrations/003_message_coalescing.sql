@@ -0,0 +1,4 @@
+-- Per-tenant debounce window (milliseconds) used to merge bursts of WhatsApp messages
+-- from the same subscriber into a single query. 0 disables coalescing.
+ALTER TABLE public.profiles ADD COLUMN message_coalesce_ms INT NOT NULL DEFAULT 0
+  CHECK (message_coalesce_ms >= 0 AND message_coalesce_ms <= 10000);
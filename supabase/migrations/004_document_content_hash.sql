@@ -0,0 +1,6 @@
+-- SHA-256 of the uploaded file, used to deduplicate re-uploads per tenant.
+ALTER TABLE public.documents ADD COLUMN content_hash TEXT;
+
+-- Unique per owner so two concurrent uploads of the same file cannot both be ingested.
+CREATE UNIQUE INDEX idx_documents_owner_content_hash ON public.documents(owner_id, content_hash)
+  WHERE content_hash IS NOT NULL;
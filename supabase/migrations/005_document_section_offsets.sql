@@ -0,0 +1,3 @@
+-- Character offsets of each chunk in the extracted document text.
+ALTER TABLE public.document_sections ADD COLUMN start_offset INT;
+ALTER TABLE public.document_sections ADD COLUMN end_offset INT;
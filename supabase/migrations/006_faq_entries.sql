@@ -0,0 +1,21 @@
+-- Tenant-curated question/answer pairs served by the lexical FAQ fast path
+CREATE TABLE public.faq_entries (
+  id BIGSERIAL PRIMARY KEY,
+  owner_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE,
+  question TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX idx_faq_entries_owner_id ON public.faq_entries(owner_id);
+
+ALTER TABLE public.faq_entries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own faq entries" ON public.faq_entries
+  FOR SELECT USING (owner_id = auth.uid());
+
+CREATE POLICY "Users can insert own faq entries" ON public.faq_entries
+  FOR INSERT WITH CHECK (owner_id = auth.uid());
+
+CREATE POLICY "Users can delete own faq entries" ON public.faq_entries
+  FOR DELETE USING (owner_id = auth.uid());
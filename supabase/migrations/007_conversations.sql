@@ -0,0 +1,92 @@
+-- One row per (customer, user_phone), maintained on message insert so listing
+-- conversations no longer aggregates the whole messages table.
+CREATE TABLE public.conversations (
+  customer_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE,
+  user_phone TEXT NOT NULL,
+  message_count BIGINT NOT NULL DEFAULT 0,
+  last_message_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  last_message_id BIGINT NOT NULL,
+  last_direction TEXT NOT NULL,
+  last_snippet TEXT NOT NULL DEFAULT '',
+  PRIMARY KEY (customer_id, user_phone)
+);
+
+-- Keyset pagination: newest first, (created_at, id) as tiebreaker
+CREATE INDEX idx_conversations_customer_last ON public.conversations(customer_id, last_message_at DESC, last_message_id DESC);
+CREATE INDEX idx_messages_customer_created ON public.messages(customer_id, created_at DESC, id DESC);
+CREATE INDEX idx_messages_customer_phone_created ON public.messages(customer_id, user_phone, created_at DESC, id DESC);
+
+-- Covered by the composite indexes above
+DROP INDEX IF EXISTS public.idx_messages_customer_id;
+DROP INDEX IF EXISTS public.idx_messages_user_phone;
+
+-- Statement-level so a batched insert of N messages costs one upsert per conversation
+CREATE OR REPLACE FUNCTION public.update_conversations()
+RETURNS trigger AS $$
+BEGIN
+  INSERT INTO public.conversations AS c
+    (customer_id, user_phone, message_count, last_message_at, last_message_id, last_direction, last_snippet)
+  SELECT DISTINCT ON (customer_id, user_phone)
+    customer_id,
+    user_phone,
+    COUNT(*) OVER (PARTITION BY customer_id, user_phone),
+    created_at,
+    id,
+    direction,
+    left(content, 200)
+  FROM new_messages
+  WHERE customer_id IS NOT NULL
+  ORDER BY customer_id, user_phone, created_at DESC, id DESC
+  ON CONFLICT (customer_id, user_phone) DO UPDATE SET
+    message_count = c.message_count + EXCLUDED.message_count,
+    last_message_at = CASE WHEN (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (c.last_message_at, c.last_message_id)
+      THEN EXCLUDED.last_message_at ELSE c.last_message_at END,
+    last_message_id = CASE WHEN (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (c.last_message_at, c.last_message_id)
+      THEN EXCLUDED.last_message_id ELSE c.last_message_id END,
+    last_direction = CASE WHEN (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (c.last_message_at, c.last_message_id)
+      THEN EXCLUDED.last_direction ELSE c.last_direction END,
+    last_snippet = CASE WHEN (EXCLUDED.last_message_at, EXCLUDED.last_message_id) > (c.last_message_at, c.last_message_id)
+      THEN EXCLUDED.last_snippet ELSE c.last_snippet END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER on_messages_inserted
+  AFTER INSERT ON public.messages
+  REFERENCING NEW TABLE AS new_messages
+  FOR EACH STATEMENT EXECUTE FUNCTION public.update_conversations();
+
+-- Backfill from existing messages
+INSERT INTO public.conversations
+  (customer_id, user_phone, message_count, last_message_at, last_message_id, last_direction, last_snippet)
+SELECT DISTINCT ON (customer_id, user_phone)
+  customer_id,
+  user_phone,
+  COUNT(*) OVER (PARTITION BY customer_id, user_phone),
+  created_at,
+  id,
+  direction,
+  left(content, 200)
+FROM public.messages
+WHERE customer_id IS NOT NULL
+ORDER BY customer_id, user_phone, created_at DESC, id DESC;
+
+-- Kept for existing callers, now served from the summary table
+CREATE OR REPLACE FUNCTION get_conversations(filter_customer_id uuid)
+RETURNS TABLE (
+  user_phone text,
+  last_message_at timestamp with time zone,
+  message_count bigint
+)
+LANGUAGE sql
+AS $$
+  SELECT c.user_phone, c.last_message_at, c.message_count
+  FROM conversations c
+  WHERE c.customer_id = filter_customer_id
+  ORDER BY c.last_message_at DESC;
+$$;
+
+ALTER TABLE public.conversations ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own conversations" ON public.conversations
+  FOR SELECT USING (customer_id = auth.uid());
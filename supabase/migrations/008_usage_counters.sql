@@ -0,0 +1,32 @@
+-- Requests answered per customer and billing period (calendar month, UTC)
+CREATE TABLE public.usage_counters (
+  customer_id UUID REFERENCES public.profiles(id) ON DELETE CASCADE,
+  period_start DATE NOT NULL,
+  requests BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+  PRIMARY KEY (customer_id, period_start)
+);
+
+-- Adds a batch of deltas ([{customer_id, period_start, requests}, ...]) atomically
+-- and returns the new totals.
+CREATE OR REPLACE FUNCTION increment_usage(deltas jsonb)
+RETURNS TABLE (
+  customer_id uuid,
+  period_start date,
+  requests bigint
+)
+LANGUAGE sql
+AS $$
+  INSERT INTO public.usage_counters AS u (customer_id, period_start, requests)
+  SELECT (d->>'customer_id')::uuid, (d->>'period_start')::date, (d->>'requests')::bigint
+  FROM jsonb_array_elements(deltas) AS d
+  ON CONFLICT (customer_id, period_start) DO UPDATE SET
+    requests = u.requests + EXCLUDED.requests,
+    updated_at = now()
+  RETURNING u.customer_id, u.period_start, u.requests;
+$$;
+
+ALTER TABLE public.usage_counters ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own usage" ON public.usage_counters
+  FOR SELECT USING (customer_id = auth.uid());
@@ -0,0 +1,9 @@
+-- Per-plan limits used by webhook admission control
+ALTER TABLE public.subscriptions ADD COLUMN max_concurrent_requests INT NOT NULL DEFAULT 2;
+ALTER TABLE public.subscriptions ADD COLUMN requests_per_minute INT NOT NULL DEFAULT 30;
+ALTER TABLE public.subscriptions ADD COLUMN scheduling_weight INT NOT NULL DEFAULT 1 CHECK (scheduling_weight > 0);
+
+UPDATE public.subscriptions SET max_concurrent_requests = 1, requests_per_minute = 10, scheduling_weight = 1 WHERE name = 'Free';
+UPDATE public.subscriptions SET max_concurrent_requests = 2, requests_per_minute = 30, scheduling_weight = 2 WHERE name = 'Starter';
+UPDATE public.subscriptions SET max_concurrent_requests = 4, requests_per_minute = 120, scheduling_weight = 4 WHERE name = 'Professional';
+UPDATE public.subscriptions SET max_concurrent_requests = 8, requests_per_minute = 600, scheduling_weight = 8 WHERE name = 'Enterprise';
@@ -0,0 +1,5 @@
+-- Webhook job that wrote the message, so a retried job doesn't store it twice
+ALTER TABLE public.messages ADD COLUMN job_id TEXT;
+
+-- NULLs never conflict: rows written outside a job are not deduplicated
+CREATE UNIQUE INDEX idx_messages_job_direction ON public.messages(job_id, direction);